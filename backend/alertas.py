@@ -0,0 +1,219 @@
+"""
+Alertas de validade
+Varredura diária que regrava a situação de validade dos lotes e registra
+os que venceram ou entraram na janela de vencimento naquele dia
+"""
+
+import time
+from datetime import date, datetime, timedelta
+
+import click
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask_login import login_required, current_user
+from sqlalchemy import and_, insert, literal, or_, select
+from sqlalchemy.orm import joinedload
+
+from models import (db, Item, Almoxarifado, AlertaValidade, Notificacao, DIAS_VENCE_EM_BREVE,
+                    expressao_status_validade, sincronizar_status)
+
+alertas = Blueprint('alertas', __name__)
+
+TIPOS_ALERTA = ('vencido', 'vence_em_breve')
+
+
+def _lotes_que_cruzaram(almoxarifado_id, desde, hoje):
+    """
+    Lotes ativos com estoque do almoxarifado cuja validade cruzou um
+    limite depois do dia desde (exclusive) até hoje: venceram
+    (desde <= validade < hoje) ou entraram na janela de vencimento
+    (desde + janela < validade <= hoje + janela, ainda não vencidos).
+    Pela data, não pela situação gravada: uma saída no meio do dia já
+    regrava a situação do lote e o alerta não pode se perder por isso.
+    """
+    tabela = Item.__table__
+    validade = tabela.c.data_validade
+    janela = timedelta(days=DIAS_VENCE_EM_BREVE)
+    return select(
+        expressao_status_validade(hoje), tabela.c.id, tabela.c.almoxarifado_id, tabela.c.estoque_atual
+    ).where(
+        tabela.c.almoxarifado_id == almoxarifado_id,
+        tabela.c.ativo == True,
+        tabela.c.estoque_atual > 0,
+        or_(
+            and_(validade >= desde, validade < hoje),
+            and_(validade > desde + janela, validade <= hoje + janela, validade >= hoje)
+        )
+    )
+
+
+def varrer_status(hoje=None):
+    """
+    Varredura do dia (agendar via cron logo após a meia-noite):
+    registra em alertas_validade (e na fila de notificações) os lotes
+    ativos com estoque que venceram ou entraram na janela de vencimento
+    desde a última varredura de cada almoxarifado (data_varredura; na
+    primeira, desde ontem) e regrava a situação de todos os itens, tudo
+    em SQL. Repetir no mesmo dia não duplica alertas. Retorna
+    {'vencido': n, 'vence_em_breve': n, 'atualizados': n}.
+    """
+    hoje = hoje or date.today()
+    agora = datetime.utcnow()
+
+    for almoxarifado in Almoxarifado.query.all():
+        desde = almoxarifado.data_varredura or hoje - timedelta(days=1)
+        if desde >= hoje:
+            continue
+        novos = _lotes_que_cruzaram(almoxarifado.id, desde, hoje)
+        db.session.execute(insert(AlertaValidade).from_select(
+            ['tipo', 'item_id', 'almoxarifado_id', 'quantidade', 'data'],
+            novos.add_columns(literal(hoje))
+        ))
+        db.session.execute(insert(Notificacao).from_select(
+            ['tipo', 'item_id', 'almoxarifado_id', 'quantidade', 'data_hora'],
+            novos.add_columns(literal(agora))
+        ))
+        almoxarifado.data_varredura = hoje
+
+    resumo = dict(contar_alertas(hoje))
+    resumo['atualizados'] = sincronizar_status(db.session, hoje=hoje)
+    db.session.commit()
+    return resumo
+
+
+def contar_alertas(data, almoxarifado_id=None):
+    """Quantidade de alertas de cada tipo registrados no dia"""
+    query = db.session.query(AlertaValidade.tipo, db.func.count(AlertaValidade.id)).filter(
+        AlertaValidade.data == data
+    )
+    if almoxarifado_id:
+        query = query.filter(AlertaValidade.almoxarifado_id == almoxarifado_id)
+    contagem = dict.fromkeys(TIPOS_ALERTA, 0)
+    contagem.update(query.group_by(AlertaValidade.tipo).all())
+    return contagem
+
+
+def alertas_do_dia(data, almoxarifado_id):
+    """Alertas de um almoxarifado no dia, separados por tipo e ordenados por validade"""
+    registros = AlertaValidade.query.join(Item).options(joinedload(AlertaValidade.item)).filter(
+        AlertaValidade.data == data,
+        AlertaValidade.almoxarifado_id == almoxarifado_id
+    ).order_by(Item.data_validade, Item.nome).all()
+
+    lista = {tipo: [] for tipo in TIPOS_ALERTA}
+    for alerta in registros:
+        lista[alerta.tipo].append(alerta)
+    return lista
+
+
+def _almoxarifado_selecionado():
+    if current_user.ve_todos_almoxarifados:
+        return request.values.get('almoxarifado_id', type=int)
+    return current_user.almoxarifado_id
+
+
+def _data_parametro():
+    valor = request.args.get('data')
+    return datetime.strptime(valor, '%Y-%m-%d').date() if valor else date.today()
+
+
+@alertas.route('/alertas/validade')
+@login_required
+def validade():
+    """Lotes que venceram ou entraram na janela de vencimento no dia"""
+    almoxarifado_id = _almoxarifado_selecionado()
+    try:
+        data = _data_parametro()
+    except ValueError:
+        flash('Data inválida.', 'danger')
+        data = date.today()
+
+    almoxarifado = db.session.get(Almoxarifado, almoxarifado_id) if almoxarifado_id else None
+    lista = alertas_do_dia(data, almoxarifado.id) if almoxarifado else None
+
+    almoxarifados = []
+    if current_user.ve_todos_almoxarifados:
+        almoxarifados = Almoxarifado.query.filter_by(ativo=True).order_by(Almoxarifado.nome).all()
+
+    return render_template('alertas/validade.html',
+                         almoxarifado=almoxarifado,
+                         almoxarifados=almoxarifados,
+                         data=data,
+                         lista=lista,
+                         dias_janela=DIAS_VENCE_EM_BREVE)
+
+
+@alertas.route('/alertas/validade/varrer', methods=['POST'])
+@login_required
+def varrer():
+    """Executa a varredura do dia"""
+    if not current_user.ve_todos_almoxarifados:
+        flash('Apenas administradores podem executar a varredura.', 'danger')
+        return redirect(url_for('alertas.validade'))
+
+    try:
+        resumo = varrer_status()
+        flash(f'Varredura concluída: {resumo["vencido"]} lote(s) vencido(s) e '
+              f'{resumo["vence_em_breve"]} entrando na janela de vencimento.', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Erro na varredura de validade: {str(e)}', 'danger')
+
+    return redirect(url_for('alertas.validade', almoxarifado_id=request.form.get('almoxarifado_id')))
+
+
+@alertas.route('/api/alertas/validade')
+@login_required
+def api_validade():
+    """API: alertas de validade do dia (ou da data informada) de um almoxarifado"""
+    almoxarifado_id = _almoxarifado_selecionado()
+    if not almoxarifado_id:
+        return jsonify({'erro': 'Informe o almoxarifado_id.'}), 400
+    try:
+        data = _data_parametro()
+    except ValueError:
+        return jsonify({'erro': 'Data inválida. Use o formato AAAA-MM-DD.'}), 400
+
+    return jsonify({
+        'almoxarifado_id': almoxarifado_id,
+        'data': data.isoformat(),
+        **{tipo: [{
+            'item_id': alerta.item_id,
+            'codigo_barras': alerta.item.codigo_barras,
+            'lote': alerta.item.lote,
+            'nome': alerta.item.nome,
+            'data_validade': alerta.item.data_validade.isoformat() if alerta.item.data_validade else None,
+            'quantidade': alerta.quantidade
+        } for alerta in registros] for tipo, registros in alertas_do_dia(data, almoxarifado_id).items()}
+    })
+
+
+# Minutos depois da meia-noite em que o modo contínuo roda a varredura
+MINUTOS_APOS_MEIA_NOITE = 5
+
+
+def _segundos_ate_proxima_varredura(agora=None):
+    agora = agora or datetime.now()
+    proxima = datetime.combine(agora.date() + timedelta(days=1), datetime.min.time())
+    return (proxima - agora).total_seconds() + MINUTOS_APOS_MEIA_NOITE * 60
+
+
+@alertas.cli.command('varrer')
+@click.option('--continuo', is_flag=True, help='Varre agora e depois todo dia logo após a meia-noite (processo de serviço).')
+def varrer_comando(continuo):
+    """Varredura diária de validade (agendar via cron ou rodar com --continuo)"""
+    while True:
+        try:
+            resumo = varrer_status()
+            click.echo(f'{resumo["vencido"]} lote(s) vencido(s), {resumo["vence_em_breve"]} entrando na janela '
+                       f'de {DIAS_VENCE_EM_BREVE} dias; situação regravada em {resumo["atualizados"]} item(ns).')
+        except Exception as e:
+            db.session.rollback()
+            click.echo(f'Erro na varredura de validade: {e}', err=True)
+            if not continuo:
+                raise SystemExit(1)
+        finally:
+            db.session.remove()
+
+        if not continuo:
+            break
+        time.sleep(_segundos_ate_proxima_varredura())
@@ -4,7 +4,8 @@ Rotas para gestão de almoxarifados
 
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
-from models import db, Almoxarifado
+from models import db, Almoxarifado, Usuario, Item
+from sqlalchemy import func
 from datetime import datetime
 
 almoxarifados = Blueprint('almoxarifados', __name__)
@@ -25,7 +26,27 @@ def listar():
     if not requer_admin():
         return redirect(url_for('dashboard'))
     
-    almoxarifados_lista = Almoxarifado.query.order_by(Almoxarifado.nome).all()
+    # Contagens agregadas por almoxarifado (evita carregar todos os usuários/itens de cada card)
+    usuarios_por_almox = db.session.query(
+        Usuario.almoxarifado_id,
+        func.count(Usuario.id).label('total')
+    ).group_by(Usuario.almoxarifado_id).subquery()
+    
+    itens_por_almox = db.session.query(
+        Item.almoxarifado_id,
+        func.count(Item.id).label('total')
+    ).group_by(Item.almoxarifado_id).subquery()
+    
+    almoxarifados_lista = db.session.query(
+        Almoxarifado,
+        func.coalesce(usuarios_por_almox.c.total, 0),
+        func.coalesce(itens_por_almox.c.total, 0)
+    ).outerjoin(
+        usuarios_por_almox, usuarios_por_almox.c.almoxarifado_id == Almoxarifado.id
+    ).outerjoin(
+        itens_por_almox, itens_por_almox.c.almoxarifado_id == Almoxarifado.id
+    ).order_by(Almoxarifado.nome).all()
+    
     return render_template('almoxarifados/listar.html', almoxarifados=almoxarifados_lista)
 
 
@@ -142,13 +163,13 @@ def excluir(id):
     almoxarifado = Almoxarifado.query.get_or_404(id)
     
     try:
-        # Validações
-        if almoxarifado.usuarios:
-            flash(f'Não é possível excluir! Existem {len(almoxarifado.usuarios)} usuário(s) vinculado(s) a este almoxarifado.', 'danger')
+        # Validações (EXISTS: não carrega os relacionamentos inteiros)
+        if db.session.query(Usuario.query.filter_by(almoxarifado_id=id).exists()).scalar():
+            flash('Não é possível excluir! Existem usuários vinculados a este almoxarifado.', 'danger')
             return redirect(url_for('almoxarifados.listar'))
         
-        if almoxarifado.itens:
-            flash(f'Não é possível excluir! Existem {len(almoxarifado.itens)} item(ns) cadastrado(s) neste almoxarifado.', 'danger')
+        if db.session.query(Item.query.filter_by(almoxarifado_id=id).exists()).scalar():
+            flash('Não é possível excluir! Existem itens cadastrados neste almoxarifado.', 'danger')
             return redirect(url_for('almoxarifados.listar'))
         
         nome = almoxarifado.nome
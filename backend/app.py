@@ -3,23 +3,47 @@ Sistema de Almoxarifado Hospitalar
 Aplicação principal Flask
 """
 
+import math
 import os
 from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from datetime import datetime, timedelta
+from datetime import datetime
 from functools import wraps
 from dotenv import load_dotenv
 from io import BytesIO
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
 
 # Importar models
-from models import db, Usuario, Setor, Categoria, Fornecedor, Item, Movimentacao, Configuracao, Almoxarifado
+from models import db, Usuario, Setor, Categoria, Fornecedor, Item, Movimentacao, Configuracao, Almoxarifado, Endereco, coluna_status_validade
 
 # Importar gerador de relatórios
 from relatorios import gerar_relatorio_estoque, gerar_relatorio_movimentacoes
 
+# Importar operações de estoque
+from estoque import (registrar_movimentacao, atualizar_custo_medio, saida_fefo, transferir, filtrar_por_almoxarifado,
+                     ordenar_por_endereco, valores_por_almoxarifado, EstoqueInsuficienteError)
+
 # Importar novas funcionalidades
 from novas_funcionalidades import novas_rotas
 from almoxarifados import almoxarifados
+from saldos import saldos
+from kardex import kardex
+from scan import scan
+from sincronizacao import sincronizacao
+from importacao import importacao
+from reservas import reservas
+from requisicoes import requisicoes
+from enderecos import enderecos
+from compras import compras, registrar_compra
+from classificacao import classificacao
+from alertas import alertas
+from notificacoes import notificacoes
+from indicadores import indicadores
+from previsao import previsao
+from reposicao import reposicao
+from eventos import eventos, cursor_atual
 
 # Carregar variáveis de ambiente
 load_dotenv()
@@ -40,6 +64,19 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['UPLOAD_FOLDER'] = os.path.join(BASE_DIR, 'frontend', 'static', 'uploads')
 app.config['MAX_CONTENT_LENGTH'] = 5 * 1024 * 1024  # 5MB max
 
+# SMTP dos resumos de notificações (padrão: servidor local de testes na porta 1025)
+app.config['SMTP_HOST'] = os.getenv('SMTP_HOST', 'localhost')
+app.config['SMTP_PORT'] = int(os.getenv('SMTP_PORT', '1025'))
+app.config['SMTP_USUARIO'] = os.getenv('SMTP_USUARIO', '')
+app.config['SMTP_SENHA'] = os.getenv('SMTP_SENHA', '')
+app.config['SMTP_TLS'] = os.getenv('SMTP_TLS', '').lower() in ('1', 'true', 'sim')
+app.config['SMTP_REMETENTE'] = os.getenv('SMTP_REMETENTE', 'almoxarifado@localhost')
+app.config['SMTP_TIMEOUT'] = int(os.getenv('SMTP_TIMEOUT', '30'))
+
+# Conexões simultâneas do stream de eventos por processo; cada uma ocupa uma
+# thread do gunicorn, então deve ficar abaixo de --threads
+app.config['EVENTOS_MAX_CONEXOES'] = int(os.getenv('EVENTOS_MAX_CONEXOES', '8'))
+
 # Criar pasta de uploads se não existir
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
@@ -57,6 +94,22 @@ login_manager.login_message = 'Por favor, faça login para acessar esta página.
 # Registrar blueprints
 app.register_blueprint(novas_rotas)
 app.register_blueprint(almoxarifados)
+app.register_blueprint(saldos)
+app.register_blueprint(kardex)
+app.register_blueprint(scan)
+app.register_blueprint(sincronizacao)
+app.register_blueprint(importacao)
+app.register_blueprint(reservas)
+app.register_blueprint(requisicoes)
+app.register_blueprint(enderecos)
+app.register_blueprint(compras)
+app.register_blueprint(classificacao)
+app.register_blueprint(alertas)
+app.register_blueprint(notificacoes)
+app.register_blueprint(indicadores)
+app.register_blueprint(previsao)
+app.register_blueprint(reposicao)
+app.register_blueprint(eventos)
 
 # ====================
 # CONTEXT PROCESSOR
@@ -167,19 +220,17 @@ def dashboard():
     
     # Itens abaixo do estoque mínimo
     itens_baixo_estoque = base_query.filter(
-        Item.estoque_atual < Item.estoque_minimo
+        Item.estoque_disponivel < Item.estoque_minimo
     ).all()
     
-    # Itens vencidos
-    hoje = datetime.now().date()
+    # Itens vencidos e a vencer em 30 dias (situação gravada; pela data se a varredura atrasar)
+    status_validade = coluna_status_validade()
     itens_vencidos = base_query.filter(
-        Item.data_validade < hoje
+        status_validade == 'vencido'
     ).all()
     
-    # Itens a vencer em 30 dias
-    data_limite = hoje + timedelta(days=30)
     itens_a_vencer = base_query.filter(
-        Item.data_validade.between(hoje, data_limite)
+        status_validade == 'vence_em_breve'
     ).all()
     
     # Últimas movimentações (filtradas por almoxarifado através dos itens)
@@ -194,12 +245,18 @@ def dashboard():
         Movimentacao.data_hora.desc()
     ).limit(10).all()
     
+    # Valor do estoque ao custo médio (totais mantidos por almoxarifado)
+    valores_estoque = valores_por_almoxarifado(current_user)
+    
     return render_template('dashboard.html',
                          total_itens=total_itens,
+                         valores_estoque=valores_estoque,
+                         valor_estoque=sum(valor for _, valor in valores_estoque),
                          itens_baixo_estoque=itens_baixo_estoque,
                          itens_vencidos=itens_vencidos,
                          itens_a_vencer=itens_a_vencer,
-                         ultimas_movimentacoes=ultimas_movimentacoes)
+                         ultimas_movimentacoes=ultimas_movimentacoes,
+                         cursor_eventos=cursor_atual())
 
 
 # ====================
@@ -226,7 +283,13 @@ def listar_itens():
             # Usuário sem almoxarifado não vê nada
             query = query.filter_by(almoxarifado_id=None)
     
-    itens = query.order_by(Item.nome).all()
+    # Filtros pela situação gravada (status_validade / status_estoque)
+    if request.args.get('status_validade'):
+        query = query.filter(coluna_status_validade() == request.args['status_validade'])
+    if request.args.get('status_estoque'):
+        query = query.filter(Item.status_estoque == request.args['status_estoque'])
+    
+    itens = query.options(joinedload(Item.endereco)).order_by(Item.nome).all()
     
     # Buscar almoxarifados para o filtro (apenas para admins)
     almoxarifados = []
@@ -239,6 +302,25 @@ def listar_itens():
                          almoxarifado_selecionado=almoxarifado_filtro)
 
 
+def _enderecos_visiveis():
+    """Endereços ativos que o usuário pode atribuir aos lotes"""
+    query = Endereco.query.filter_by(ativo=True)
+    if not current_user.ve_todos_almoxarifados:
+        query = query.filter_by(almoxarifado_id=current_user.almoxarifado_id)
+    return query.order_by(Endereco.almoxarifado_id, *Endereco.ordem_caminhada()).all()
+
+
+def _endereco_do_formulario(almoxarifado_id):
+    """Endereço escolhido no formulário, desde que seja do almoxarifado do lote"""
+    endereco_id = request.form.get('endereco_id', type=int)
+    if not endereco_id:
+        return None
+    endereco = db.session.get(Endereco, endereco_id)
+    if not endereco or endereco.almoxarifado_id != int(almoxarifado_id):
+        raise ValueError('O endereço escolhido não pertence ao almoxarifado do item.')
+    return endereco.id
+
+
 @app.route('/itens/novo', methods=['GET', 'POST'])
 @login_required
 @requer_permissao('admin', 'almoxarife')
@@ -254,7 +336,8 @@ def novo_item():
                     flash('Selecione o almoxarifado!', 'warning')
                     categorias = Categoria.query.order_by(Categoria.nome).all()
                     almoxarifados = Almoxarifado.query.filter_by(ativo=True).order_by(Almoxarifado.nome).all()
-                    return render_template('itens/form.html', categorias=categorias, almoxarifados=almoxarifados)
+                    return render_template('itens/form.html', categorias=categorias, almoxarifados=almoxarifados,
+                                         enderecos=_enderecos_visiveis())
             else:
                 # Admin local ou colaborador: usa o almoxarifado dele
                 almoxarifado_id = current_user.almoxarifado_id
@@ -277,7 +360,8 @@ def novo_item():
                 lote=request.form.get('lote'),
                 data_validade=data_validade,
                 categoria_id=request.form.get('categoria_id') or None,
-                almoxarifado_id=almoxarifado_id
+                almoxarifado_id=almoxarifado_id,
+                endereco_id=_endereco_do_formulario(almoxarifado_id)
             )
             
             db.session.add(item)
@@ -294,7 +378,8 @@ def novo_item():
     
     return render_template('itens/form.html', 
                          categorias=categorias,
-                         almoxarifados=almoxarifados)
+                         almoxarifados=almoxarifados,
+                         enderecos=_enderecos_visiveis())
 
 
 @app.route('/itens/<int:id>/editar', methods=['GET', 'POST'])
@@ -327,6 +412,8 @@ def editar_item(id):
                 if almoxarifado_id:
                     item.almoxarifado_id = almoxarifado_id
             
+            item.endereco_id = _endereco_do_formulario(item.almoxarifado_id)
+            
             db.session.commit()
             
             flash('Item atualizado com sucesso!', 'success')
@@ -341,7 +428,8 @@ def editar_item(id):
     return render_template('itens/form.html', 
                          item=item,
                          categorias=categorias,
-                         almoxarifados=almoxarifados)
+                         almoxarifados=almoxarifados,
+                         enderecos=_enderecos_visiveis())
 
 
 @app.route('/itens/<int:id>/excluir', methods=['POST'])
@@ -403,7 +491,8 @@ def listar_movimentacoes():
     return render_template('movimentacoes/listar.html', 
                          movimentacoes=movimentacoes,
                          almoxarifados=almoxarifados,
-                         almoxarifado_selecionado=almoxarifado_filtro)
+                         almoxarifado_selecionado=almoxarifado_filtro,
+                         cursor_eventos=cursor_atual())
 
 
 @app.route('/movimentacoes/entrada', methods=['GET', 'POST'])
@@ -415,23 +504,36 @@ def entrada_material():
         try:
             item_id = int(request.form.get('item_id'))
             quantidade = float(request.form.get('quantidade'))
+            if not math.isfinite(quantidade) or quantidade <= 0:
+                flash('Quantidade deve ser maior que zero!', 'warning')
+                return redirect(url_for('entrada_material'))
+            
+            preco_unitario = request.form.get('preco_unitario')
+            preco_unitario = float(preco_unitario.replace(',', '.')) if preco_unitario else None
+            if preco_unitario is not None and preco_unitario < 0:
+                flash('Preço unitário não pode ser negativo!', 'warning')
+                return redirect(url_for('entrada_material'))
             
             item = Item.query.get_or_404(item_id)
             
-            # Criar movimentação
-            movimentacao = Movimentacao(
-                tipo='entrada',
-                quantidade=quantidade,
+            # Com preço informado, recalcular o custo médio antes de somar o estoque
+            if preco_unitario is not None:
+                atualizar_custo_medio(item, quantidade, preco_unitario)
+            
+            # Criar movimentação e atualizar estoque
+            movimentacao = registrar_movimentacao(
+                item, 'entrada', quantidade, current_user.id,
                 observacao=request.form.get('observacao'),
-                nota_fiscal=request.form.get('nota_fiscal'),
-                item_id=item_id,
-                usuario_id=current_user.id
+                nota_fiscal=request.form.get('nota_fiscal')
             )
             
-            # Atualizar estoque
-            item.estoque_atual += quantidade
-            
-            db.session.add(movimentacao)
+            # Com preço informado, a entrada entra no histórico de compras
+            if preco_unitario is not None:
+                registrar_compra(
+                    item, quantidade, preco_unitario, movimentacao,
+                    fornecedor_id=request.form.get('fornecedor_id', type=int),
+                    nota_fiscal=request.form.get('nota_fiscal')
+                )
             db.session.commit()
             
             flash(f'Entrada registrada! Estoque atual: {item.estoque_atual} {item.unidade_medida}', 'success')
@@ -450,7 +552,8 @@ def entrada_material():
             query = query.filter_by(almoxarifado_id=None)
     
     itens = query.order_by(Item.nome).all()
-    return render_template('movimentacoes/entrada.html', itens=itens)
+    fornecedores = Fornecedor.query.filter_by(ativo=True).order_by(Fornecedor.nome).all()
+    return render_template('movimentacoes/entrada.html', itens=itens, fornecedores=fornecedores)
 
 
 @app.route('/movimentacoes/saida', methods=['GET', 'POST'])
@@ -463,28 +566,23 @@ def saida_material():
             item_id = int(request.form.get('item_id'))
             quantidade = float(request.form.get('quantidade'))
             setor_id = int(request.form.get('setor_id'))
+            if not math.isfinite(quantidade) or quantidade <= 0:
+                flash('Quantidade deve ser maior que zero!', 'warning')
+                return redirect(url_for('saida_material'))
             
-            item = Item.query.get_or_404(item_id)
+            item = Item.query.filter_by(id=item_id).with_for_update().first_or_404()
             
-            # Verificar se há estoque suficiente
-            if item.estoque_atual < quantidade:
-                flash('Estoque insuficiente!', 'danger')
+            # Verificar se há estoque suficiente (descontando o que está reservado)
+            if item.estoque_disponivel < quantidade:
+                flash(f'Estoque insuficiente! Disponível: {item.estoque_disponivel:g} {item.unidade_medida}', 'danger')
                 return redirect(url_for('saida_material'))
             
-            # Criar movimentação
-            movimentacao = Movimentacao(
-                tipo='saida',
-                quantidade=quantidade,
+            # Criar movimentação e atualizar estoque
+            registrar_movimentacao(
+                item, 'saida', quantidade, current_user.id,
                 observacao=request.form.get('observacao'),
-                item_id=item_id,
-                usuario_id=current_user.id,
                 setor_id=setor_id
             )
-            
-            # Atualizar estoque
-            item.estoque_atual -= quantidade
-            
-            db.session.add(movimentacao)
             db.session.commit()
             
             flash(f'Saída registrada! Estoque atual: {item.estoque_atual} {item.unidade_medida}', 'success')
@@ -502,10 +600,117 @@ def saida_material():
         else:
             query = query.filter_by(almoxarifado_id=None)
     
-    itens = query.order_by(Item.nome).all()
+    # Em ordem de caminhada, para retirar vários itens numa só passada
+    ordem = request.args.get('ordem')
+    if ordem == 'endereco':
+        itens = ordenar_por_endereco(query).order_by(Item.nome).all()
+    else:
+        itens = query.options(joinedload(Item.endereco)).order_by(Item.nome).all()
     setores = Setor.query.filter_by(ativo=True).order_by(Setor.nome).all()
     
-    return render_template('movimentacoes/saida.html', itens=itens, setores=setores)
+    return render_template('movimentacoes/saida.html', itens=itens, setores=setores, ordem=ordem)
+
+
+@app.route('/movimentacoes/saida-codigo', methods=['GET', 'POST'])
+@login_required
+@requer_permissao('admin', 'almoxarife')
+def saida_por_codigo():
+    """Registrar saída por código de barras, distribuída entre lotes por validade (FEFO)"""
+    if request.method == 'POST':
+        try:
+            codigo_barras = request.form.get('codigo_barras', '').strip()
+            quantidade = float(request.form.get('quantidade'))
+            setor_id = int(request.form.get('setor_id'))
+            if not math.isfinite(quantidade) or quantidade <= 0:
+                flash('Quantidade deve ser maior que zero!', 'warning')
+                return redirect(url_for('saida_por_codigo'))
+            
+            if current_user.ve_todos_almoxarifados:
+                almoxarifado_id = int(request.form.get('almoxarifado_id'))
+            else:
+                almoxarifado_id = current_user.almoxarifado_id
+            
+            alocacao = saida_fefo(
+                almoxarifado_id, codigo_barras, quantidade, current_user.id,
+                observacao=request.form.get('observacao'),
+                setor_id=setor_id
+            )
+            db.session.commit()
+            
+            lotes = ', '.join(
+                f'{lote.lote}: {baixa:g}' + (f' ({lote.endereco.codigo})' if lote.endereco else '')
+                for lote, baixa in alocacao
+            )
+            flash(f'Saída registrada! Lotes baixados: {lotes}', 'success')
+            return redirect(url_for('saida_por_codigo'))
+        except EstoqueInsuficienteError as e:
+            db.session.rollback()
+            flash(str(e), 'danger')
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Erro ao registrar saída: {str(e)}', 'danger')
+    
+    setores = Setor.query.filter_by(ativo=True).order_by(Setor.nome).all()
+    almoxarifados = []
+    if current_user.ve_todos_almoxarifados:
+        almoxarifados = Almoxarifado.query.filter_by(ativo=True).order_by(Almoxarifado.nome).all()
+    
+    return render_template('movimentacoes/saida_codigo.html', setores=setores, almoxarifados=almoxarifados)
+
+
+@app.route('/movimentacoes/transferencia', methods=['GET', 'POST'])
+@login_required
+@requer_permissao('admin', 'almoxarife')
+def transferencia_material():
+    """Transferir estoque de um lote para outro almoxarifado"""
+    if request.method == 'POST':
+        try:
+            item_id = int(request.form.get('item_id'))
+            almoxarifado_destino_id = int(request.form.get('almoxarifado_destino_id'))
+            quantidade = float(request.form.get('quantidade'))
+            
+            for tentativa in range(2):
+                item = Item.query.filter_by(id=item_id).with_for_update().first_or_404()
+                if not current_user.pode_acessar_almoxarifado(item.almoxarifado_id):
+                    flash('Você não tem permissão para movimentar este item.', 'danger')
+                    return redirect(url_for('transferencia_material'))
+                
+                try:
+                    destino, _, _ = transferir(
+                        item, almoxarifado_destino_id, quantidade, current_user.id,
+                        observacao=request.form.get('observacao')
+                    )
+                    db.session.commit()
+                    break
+                except IntegrityError:
+                    # Outra transferência cadastrou o mesmo lote no destino: refaz com o lote já existente
+                    db.session.rollback()
+                    if tentativa:
+                        raise
+            
+            flash(f'Transferência registrada! Estoque na origem: {item.estoque_atual} {item.unidade_medida}; '
+                  f'no destino ({destino.almoxarifado.nome}): {destino.estoque_atual} {destino.unidade_medida}', 'success')
+            return redirect(url_for('listar_movimentacoes'))
+        except (EstoqueInsuficienteError, ValueError) as e:
+            db.session.rollback()
+            flash(str(e), 'danger')
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Erro ao registrar transferência: {str(e)}', 'danger')
+    
+    # Filtrar itens por almoxarifado
+    query = Item.query.filter(Item.ativo == True, Item.estoque_disponivel > 0)
+    
+    if not current_user.ve_todos_almoxarifados:
+        if current_user.almoxarifado_id:
+            query = query.filter_by(almoxarifado_id=current_user.almoxarifado_id)
+        else:
+            query = query.filter_by(almoxarifado_id=None)
+    
+    itens = query.order_by(Item.nome).all()
+    almoxarifados = Almoxarifado.query.filter_by(ativo=True).order_by(Almoxarifado.nome).all()
+    
+    return render_template('movimentacoes/transferencia.html', itens=itens, almoxarifados=almoxarifados)
 
 
 @app.route('/movimentacoes/ajuste', methods=['GET', 'POST'])
@@ -523,19 +728,11 @@ def ajuste_estoque():
             # Calcular diferença
             diferenca = nova_quantidade - item.estoque_atual
             
-            # Criar movimentação
-            movimentacao = Movimentacao(
-                tipo='ajuste',
-                quantidade=diferenca,
-                observacao=request.form.get('observacao'),
-                item_id=item_id,
-                usuario_id=current_user.id
+            # Criar movimentação e atualizar estoque
+            registrar_movimentacao(
+                item, 'ajuste', diferenca, current_user.id,
+                observacao=request.form.get('observacao')
             )
-            
-            # Atualizar estoque
-            item.estoque_atual = nova_quantidade
-            
-            db.session.add(movimentacao)
             db.session.commit()
             
             flash(f'Ajuste registrado! Estoque ajustado para: {item.estoque_atual} {item.unidade_medida}', 'success')
@@ -688,7 +885,8 @@ def novo_fornecedor():
                 cnpj=request.form.get('cnpj'),
                 contato=request.form.get('contato'),
                 telefone=request.form.get('telefone'),
-                email=request.form.get('email')
+                email=request.form.get('email'),
+                prazo_entrega_dias=request.form.get('prazo_entrega_dias', type=int)
             )
             
             db.session.add(fornecedor)
@@ -712,7 +910,16 @@ def novo_fornecedor():
 def listar_usuarios():
     """Lista todos os usuários"""
     usuarios = Usuario.query.filter_by(ativo=True).order_by(Usuario.nome).all()
-    return render_template('usuarios/listar.html', usuarios=usuarios)
+    
+    # Contador de movimentações por usuário (uma única consulta agrupada)
+    movimentacoes_por_usuario = dict(db.session.query(
+        Movimentacao.usuario_id,
+        func.count(Movimentacao.id)
+    ).group_by(Movimentacao.usuario_id).all())
+    
+    return render_template('usuarios/listar.html',
+                         usuarios=usuarios,
+                         movimentacoes_por_usuario=movimentacoes_por_usuario)
 
 
 @app.route('/usuarios/novo', methods=['GET', 'POST'])
@@ -805,11 +1012,154 @@ def api_item(id):
         'codigo_barras': item.codigo_barras,
         'nome': item.nome,
         'estoque_atual': item.estoque_atual,
+        'estoque_reservado': item.estoque_reservado,
+        'estoque_disponivel': item.estoque_disponivel,
         'unidade_medida': item.unidade_medida,
-        'estoque_minimo': item.estoque_minimo
+        'estoque_minimo': item.estoque_minimo,
+        'custo_medio': item.custo_medio
     })
 
 
+# Campos que podem ser pedidos na API de itens em lote
+CAMPOS_API_ITENS = {
+    'id': Item.id,
+    'codigo_barras': Item.codigo_barras,
+    'nome': Item.nome,
+    'descricao': Item.descricao,
+    'marca': Item.marca,
+    'lote': Item.lote,
+    'data_validade': Item.data_validade,
+    'estoque_atual': Item.estoque_atual,
+    'estoque_reservado': Item.estoque_reservado,
+    'estoque_disponivel': Item.estoque_disponivel,
+    'estoque_minimo': Item.estoque_minimo,
+    'custo_medio': Item.custo_medio,
+    'valor_estoque': Item.valor_estoque,
+    'unidade_medida': Item.unidade_medida,
+    'categoria_id': Item.categoria_id,
+    'almoxarifado_id': Item.almoxarifado_id,
+}
+CAMPOS_API_ITENS_PADRAO = ['id', 'codigo_barras', 'nome', 'estoque_atual', 'unidade_medida', 'estoque_minimo']
+MAX_IDS_API_ITENS = 1000
+
+
+@app.route('/api/itens', methods=['GET', 'POST'])
+@login_required
+def api_itens():
+    """API para obter vários itens em uma única consulta (GET ?ids=1,2,3 ou POST JSON)"""
+    if request.method == 'POST':
+        dados = request.get_json(silent=True) or {}
+        ids = dados.get('ids') or []
+        campos = dados.get('campos') or CAMPOS_API_ITENS_PADRAO
+        if not isinstance(ids, list):
+            return jsonify({'erro': 'ids deve ser uma lista.'}), 400
+        if not isinstance(campos, list) or not all(isinstance(c, str) for c in campos):
+            return jsonify({'erro': 'campos deve ser uma lista de nomes de campos.'}), 400
+    else:
+        ids = [i for i in request.args.get('ids', '').split(',') if i.strip()]
+        campos = request.args.get('campos')
+        campos = campos.split(',') if campos else CAMPOS_API_ITENS_PADRAO
+    
+    try:
+        ids = list({int(i) for i in ids})
+    except (TypeError, ValueError):
+        return jsonify({'erro': 'ids devem ser números inteiros.'}), 400
+    
+    if len(ids) > MAX_IDS_API_ITENS:
+        return jsonify({'erro': f'Máximo de {MAX_IDS_API_ITENS} ids por requisição.'}), 400
+    
+    invalidos = [c for c in campos if c not in CAMPOS_API_ITENS]
+    if invalidos:
+        return jsonify({'erro': f'Campos inválidos: {", ".join(invalidos)}'}), 400
+    
+    campos = ['id'] + [c for c in campos if c != 'id']
+    
+    if not ids:
+        return jsonify({'itens': []})
+    
+    query = db.session.query(*[CAMPOS_API_ITENS[c] for c in campos]).filter(
+        Item.id.in_(ids),
+        Item.ativo == True
+    )
+    query = filtrar_por_almoxarifado(query, current_user)
+    
+    itens = []
+    for linha in query.all():
+        registro = dict(zip(campos, linha))
+        if registro.get('data_validade'):
+            registro['data_validade'] = registro['data_validade'].isoformat()
+        itens.append(registro)
+    
+    return jsonify({'itens': itens})
+
+
+MAX_TRANSFERENCIAS_LOTE = 1000
+
+
+@app.route('/api/transferencias', methods=['POST'])
+@login_required
+def api_transferencias():
+    """
+    API: várias transferências em uma única transação (todas ou nenhuma).
+    Corpo: {"transferencias": [{"item_id", "almoxarifado_destino_id", "quantidade", "observacao"}, ...]}
+    """
+    if not current_user.pode_gerenciar_estoque:
+        return jsonify({'erro': 'Sem permissão para movimentar estoque.'}), 403
+    
+    dados = request.get_json(silent=True) or {}
+    transferencias = dados.get('transferencias')
+    if not isinstance(transferencias, list) or not transferencias:
+        return jsonify({'erro': 'Envie uma lista em "transferencias".'}), 400
+    if len(transferencias) > MAX_TRANSFERENCIAS_LOTE:
+        return jsonify({'erro': f'Máximo de {MAX_TRANSFERENCIAS_LOTE} transferências por lote.'}), 400
+    
+    try:
+        ids = {int(t['item_id']) for t in transferencias}
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'erro': 'Toda transferência precisa de um item_id válido.'}), 400
+    
+    for tentativa in range(2):
+        try:
+            # Bloqueia os lotes de origem em ordem de id (evita deadlock entre lotes concorrentes)
+            itens = {item.id: item for item in Item.query.filter(
+                Item.id.in_(ids)
+            ).order_by(Item.id).with_for_update().all()}
+            
+            movimentos = []
+            for indice, t in enumerate(transferencias):
+                item = itens.get(int(t['item_id']))
+                try:
+                    if item is None or not item.ativo:
+                        raise ValueError('Item não encontrado.')
+                    if not current_user.pode_acessar_almoxarifado(item.almoxarifado_id):
+                        raise ValueError('Sem permissão para este almoxarifado.')
+                    destino, saida, entrada = transferir(
+                        item, int(t.get('almoxarifado_destino_id')), float(t.get('quantidade')),
+                        current_user.id, observacao=t.get('observacao')
+                    )
+                except (TypeError, ValueError) as e:
+                    db.session.rollback()
+                    return jsonify({'erro': str(e), 'indice': indice}), 400
+                movimentos.append((item, destino, saida, entrada))
+            
+            db.session.commit()
+            break
+        except IntegrityError:
+            # Outra transferência cadastrou o mesmo lote no destino: refaz com o lote já existente
+            db.session.rollback()
+    else:
+        return jsonify({'erro': 'Conflito com outra transferência em andamento. Reenvie o lote.'}), 409
+    
+    return jsonify({'transferencias': [{
+        'item_id': item.id,
+        'item_destino_id': destino.id,
+        'movimentacao_saida_id': saida.id,
+        'movimentacao_entrada_id': entrada.id,
+        'estoque_origem': item.estoque_atual,
+        'estoque_destino': destino.estoque_atual
+    } for item, destino, saida, entrada in movimentos]})
+
+
 # ====================
 # TRATAMENTO DE ERROS
 # ====================
@@ -0,0 +1,312 @@
+"""
+Classificação ABC/XYZ do consumo
+ABC pelo valor consumido (curva de Pareto) e XYZ pelo coeficiente de
+variação da demanda mensal, calculadas em NumPy para o catálogo inteiro
+a partir de uma única consulta agrupada
+"""
+
+from datetime import date, datetime
+
+import click
+import numpy as np
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask_login import login_required, current_user
+from sqlalchemy import bindparam, extract, func, or_, select, update
+
+from models import db, Item, Movimentacao, Almoxarifado
+
+classificacao = Blueprint('classificacao', __name__)
+
+# Meses completos de consumo considerados
+MESES_CLASSIFICACAO = 12
+
+# Participação acumulada no valor consumido: A até 80%, B até 95%, C o resto
+LIMITE_A = 0.80
+LIMITE_B = 0.95
+
+# Coeficiente de variação da demanda mensal: X até 0,5, Y até 1,0, Z acima
+LIMITE_X = 0.5
+LIMITE_Y = 1.0
+
+CLASSES_ABC = ('A', 'B', 'C')
+CLASSES_XYZ = ('X', 'Y', 'Z')
+
+
+def periodo_classificacao(meses=MESES_CLASSIFICACAO, hoje=None):
+    """Intervalo [inicio, fim) dos últimos `meses` meses completos"""
+    fim = (hoje or date.today()).replace(day=1)
+    ano, mes = divmod(fim.year * 12 + fim.month - 1 - meses, 12)
+    return date(ano, mes + 1, 1), fim
+
+
+def consumo_mensal(inicio, fim):
+    """
+    Saídas do período somadas por (almoxarifado, código, mês), numa
+    única consulta agrupada. Retorna arrays NumPy paralelos:
+    almoxarifado_id, codigo_barras, mes (índice 0..n-1), quantidade e valor.
+    """
+    mes = extract('year', Movimentacao.data_hora) * 12 + extract('month', Movimentacao.data_hora)
+    linhas = db.session.query(
+        Item.almoxarifado_id,
+        Item.codigo_barras,
+        mes,
+        func.sum(Movimentacao.quantidade),
+        func.sum(Movimentacao.quantidade * func.coalesce(Item.custo_medio, 0))
+    ).join(Item, Movimentacao.item_id == Item.id).filter(
+        Movimentacao.tipo == 'saida',
+        Movimentacao.data_hora >= inicio,
+        Movimentacao.data_hora < fim
+    ).group_by(Item.almoxarifado_id, Item.codigo_barras, mes).all()
+
+    almoxarifados, codigos, meses, quantidades, valores = zip(*linhas) if linhas else ((),) * 5
+    primeiro_mes = inicio.year * 12 + inicio.month
+    return (
+        np.asarray(almoxarifados, dtype=np.int64),
+        np.asarray(codigos, dtype=object),
+        np.asarray(meses, dtype=np.int64) - primeiro_mes,
+        np.asarray(quantidades, dtype=np.float64),
+        np.asarray(valores, dtype=np.float64)
+    )
+
+
+def calcular_classes(almoxarifados, codigos, meses, quantidades, valores, total_meses):
+    """
+    Classes ABC/XYZ por produto (almoxarifado + código), vetorizado.
+    Retorna (almoxarifado_id, codigo_barras, classe_abc, classe_xyz, valor)
+    como arrays, um elemento por produto.
+    """
+    if not len(codigos):
+        vazio = np.array([], dtype=object)
+        return np.array([], dtype=np.int64), vazio, vazio, vazio, np.array([])
+
+    # Produto = par (almoxarifado, código) reduzido a um índice 0..n-1
+    nomes, indice_codigo = np.unique(codigos.astype(str), return_inverse=True)
+    chaves, produto = np.unique(almoxarifados * len(nomes) + indice_codigo.ravel(), return_inverse=True)
+    produto = produto.ravel()
+    almox_produto = chaves // len(nomes)
+    codigo_produto = nomes[chaves % len(nomes)]
+    total_produtos = len(chaves)
+
+    # Matriz produto x mês com a quantidade consumida (meses sem saída ficam zerados)
+    demanda = np.zeros((total_produtos, total_meses))
+    np.add.at(demanda, (produto, meses), quantidades)
+    valor = np.bincount(produto, weights=valores, minlength=total_produtos)
+
+    # ABC: ordena por almoxarifado e valor decrescente e acumula dentro de cada almoxarifado
+    ordem = np.lexsort((-valor, almox_produto))
+    valor_ordenado = valor[ordem]
+    almox_ordenado = almox_produto[ordem]
+    inicios = np.r_[0, np.flatnonzero(np.diff(almox_ordenado)) + 1]
+    tamanhos = np.diff(np.r_[inicios, total_produtos])
+    totais = np.repeat(np.add.reduceat(valor_ordenado, inicios), tamanhos)
+    acumulado = np.cumsum(valor_ordenado)
+    acumulado -= np.repeat(acumulado[inicios] - valor_ordenado[inicios], tamanhos)
+
+    # Participação antes do produto: o primeiro de cada almoxarifado é sempre A
+    anterior = np.divide(acumulado - valor_ordenado, totais, out=np.ones_like(totais), where=totais > 0)
+    abc_ordenado = np.where(anterior < LIMITE_A, 'A', np.where(anterior < LIMITE_B, 'B', 'C'))
+    classe_abc = np.empty(total_produtos, dtype=abc_ordenado.dtype)
+    classe_abc[ordem] = abc_ordenado
+
+    # XYZ: coeficiente de variação da demanda mensal
+    media = demanda.mean(axis=1)
+    variacao = np.divide(demanda.std(axis=1), media, out=np.full(total_produtos, np.inf), where=media > 0)
+    classe_xyz = np.where(variacao <= LIMITE_X, 'X', np.where(variacao <= LIMITE_Y, 'Y', 'Z'))
+
+    return almox_produto, codigo_produto, classe_abc, classe_xyz, valor
+
+
+def classificar_consumo(meses=MESES_CLASSIFICACAO, hoje=None):
+    """
+    Recalcula e grava classe_abc, classe_xyz e consumo_valor em todos os
+    itens (os lotes de um mesmo código recebem a mesma classe). Códigos
+    sem saída no período ficam sem classe. Retorna o número de produtos
+    classificados.
+    """
+    inicio, fim = periodo_classificacao(meses, hoje)
+    almoxarifados, codigos, classes_abc, classes_xyz, valores = calcular_classes(
+        *consumo_mensal(inicio, fim), total_meses=meses
+    )
+
+    # Só grava os produtos cuja classificação mudou. As colunas não vão
+    # para /api/sync/itens nem para o stream de eventos: a versão não muda
+    tabela = Item.__table__
+    classificados = set(zip(almoxarifados.tolist(), codigos.tolist()))
+    anteriores = db.session.execute(
+        select(tabela.c.almoxarifado_id, tabela.c.codigo_barras)
+        .where(tabela.c.classe_abc != None).distinct()
+    ).all()
+    sem_classe = [
+        {'b_almoxarifado_id': almoxarifado_id, 'b_codigo_barras': codigo}
+        for almoxarifado_id, codigo in anteriores if (almoxarifado_id, codigo) not in classificados
+    ]
+    if sem_classe:
+        db.session.execute(
+            update(tabela).where(
+                tabela.c.almoxarifado_id == bindparam('b_almoxarifado_id'),
+                tabela.c.codigo_barras == bindparam('b_codigo_barras')
+            ).values(classe_abc=None, classe_xyz=None, consumo_valor=None),
+            sem_classe
+        )
+    if len(codigos):
+        db.session.execute(
+            update(tabela).where(
+                tabela.c.almoxarifado_id == bindparam('b_almoxarifado_id'),
+                tabela.c.codigo_barras == bindparam('b_codigo_barras'),
+                or_(
+                    tabela.c.classe_abc.is_distinct_from(bindparam('b_classe_abc')),
+                    tabela.c.classe_xyz.is_distinct_from(bindparam('b_classe_xyz')),
+                    tabela.c.consumo_valor.is_distinct_from(bindparam('b_consumo_valor'))
+                )
+            ).values(
+                classe_abc=bindparam('b_classe_abc'),
+                classe_xyz=bindparam('b_classe_xyz'),
+                consumo_valor=bindparam('b_consumo_valor')
+            ),
+            [{
+                'b_almoxarifado_id': almoxarifado_id,
+                'b_codigo_barras': codigo,
+                'b_classe_abc': abc,
+                'b_classe_xyz': xyz,
+                'b_consumo_valor': valor
+            } for almoxarifado_id, codigo, abc, xyz, valor in zip(
+                almoxarifados.tolist(), codigos.tolist(), classes_abc.tolist(),
+                classes_xyz.tolist(), valores.tolist()
+            )]
+        )
+
+    db.session.execute(update(Almoxarifado).values(data_classificacao=datetime.utcnow()))
+    db.session.commit()
+    return len(codigos)
+
+
+def _consulta_produtos(almoxarifado_id, classe_abc=None, classe_xyz=None):
+    """Um registro por código classificado, do maior para o menor valor consumido"""
+    query = db.session.query(
+        Item.codigo_barras,
+        func.max(Item.nome).label('nome'),
+        func.max(Item.unidade_medida).label('unidade_medida'),
+        func.max(Item.classe_abc).label('classe_abc'),
+        func.max(Item.classe_xyz).label('classe_xyz'),
+        func.max(Item.consumo_valor).label('consumo_valor'),
+        func.sum(Item.estoque_atual).label('estoque_atual')
+    ).filter(
+        Item.almoxarifado_id == almoxarifado_id,
+        Item.classe_abc != None
+    )
+    if classe_abc:
+        query = query.filter(Item.classe_abc == classe_abc)
+    if classe_xyz:
+        query = query.filter(Item.classe_xyz == classe_xyz)
+    return query.group_by(Item.codigo_barras).order_by(func.max(Item.consumo_valor).desc())
+
+
+def _matriz(almoxarifado_id):
+    """Quantidade de códigos e valor consumido em cada célula ABC x XYZ"""
+    produtos = db.session.query(
+        Item.codigo_barras,
+        func.max(Item.classe_abc).label('abc'),
+        func.max(Item.classe_xyz).label('xyz'),
+        func.max(Item.consumo_valor).label('valor')
+    ).filter(
+        Item.almoxarifado_id == almoxarifado_id,
+        Item.classe_abc != None
+    ).group_by(Item.codigo_barras).subquery()
+
+    matriz = {(abc, xyz): (0, 0.0) for abc in CLASSES_ABC for xyz in CLASSES_XYZ}
+    for abc, xyz, total, valor in db.session.query(
+        produtos.c.abc, produtos.c.xyz, func.count(), func.sum(produtos.c.valor)
+    ).group_by(produtos.c.abc, produtos.c.xyz):
+        matriz[(abc, xyz)] = (total, valor or 0)
+    return matriz
+
+
+def _almoxarifado_selecionado():
+    if current_user.ve_todos_almoxarifados:
+        return request.values.get('almoxarifado_id', type=int)
+    return current_user.almoxarifado_id
+
+
+@classificacao.route('/relatorios/abc-xyz')
+@login_required
+def relatorio():
+    """Matriz ABC/XYZ e lista de códigos classificados de um almoxarifado"""
+    almoxarifado_id = _almoxarifado_selecionado()
+    classe_abc = request.args.get('classe_abc') or None
+    classe_xyz = request.args.get('classe_xyz') or None
+    page = request.args.get('page', 1, type=int)
+
+    almoxarifado = db.session.get(Almoxarifado, almoxarifado_id) if almoxarifado_id else None
+    matriz = produtos = None
+    if almoxarifado:
+        matriz = _matriz(almoxarifado.id)
+        produtos = _consulta_produtos(almoxarifado.id, classe_abc, classe_xyz).paginate(
+            page=page, per_page=50, error_out=False
+        )
+
+    almoxarifados = []
+    if current_user.ve_todos_almoxarifados:
+        almoxarifados = Almoxarifado.query.filter_by(ativo=True).order_by(Almoxarifado.nome).all()
+
+    return render_template('relatorios/abc_xyz.html',
+                         almoxarifado=almoxarifado,
+                         almoxarifados=almoxarifados,
+                         matriz=matriz,
+                         produtos=produtos,
+                         classes_abc=CLASSES_ABC,
+                         classes_xyz=CLASSES_XYZ,
+                         classe_abc=classe_abc,
+                         classe_xyz=classe_xyz,
+                         meses=MESES_CLASSIFICACAO)
+
+
+@classificacao.route('/relatorios/abc-xyz/classificar', methods=['POST'])
+@login_required
+def classificar():
+    """Refaz a classificação de todos os almoxarifados"""
+    if not current_user.ve_todos_almoxarifados:
+        flash('Apenas administradores podem refazer a classificação.', 'danger')
+        return redirect(url_for('classificacao.relatorio'))
+
+    try:
+        total = classificar_consumo()
+        flash(f'{total} código(s) classificado(s).', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Erro ao classificar o consumo: {str(e)}', 'danger')
+
+    return redirect(url_for('classificacao.relatorio', almoxarifado_id=request.form.get('almoxarifado_id')))
+
+
+@classificacao.route('/api/classificacao')
+@login_required
+def api_classificacao():
+    """API: códigos classificados de um almoxarifado (filtros classe_abc e classe_xyz)"""
+    almoxarifado_id = _almoxarifado_selecionado()
+    if not almoxarifado_id:
+        return jsonify({'erro': 'Informe o almoxarifado_id.'}), 400
+
+    limite = max(1, min(request.args.get('limite', 1000, type=int), 10000))
+    linhas = _consulta_produtos(
+        almoxarifado_id, request.args.get('classe_abc'), request.args.get('classe_xyz')
+    ).limit(limite).all()
+
+    return jsonify({
+        'almoxarifado_id': almoxarifado_id,
+        'itens': [{
+            'codigo_barras': linha.codigo_barras,
+            'nome': linha.nome,
+            'classe_abc': linha.classe_abc,
+            'classe_xyz': linha.classe_xyz,
+            'consumo_valor': linha.consumo_valor,
+            'estoque_atual': linha.estoque_atual
+        } for linha in linhas]
+    })
+
+
+@classificacao.cli.command('abc-xyz')
+@click.option('--meses', default=MESES_CLASSIFICACAO, show_default=True, help='Meses completos de consumo considerados.')
+def classificar_comando(meses):
+    """Recalcula a classificação ABC/XYZ de todos os itens (para agendar via cron)"""
+    total = classificar_consumo(meses)
+    click.echo(f'{total} código(s) classificado(s) com o consumo de {meses} mês(es).')
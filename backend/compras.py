@@ -0,0 +1,233 @@
+"""
+Histórico de compras: preço unitário pago em cada entrada, por fornecedor
+e nota fiscal, consultável em SQL (último preço e preço médio)
+"""
+
+import json
+from datetime import datetime
+
+import click
+from flask import Blueprint, render_template, request
+from flask_login import login_required, current_user
+from sqlalchemy import func, insert
+from sqlalchemy.orm import contains_eager, joinedload
+
+from models import db, Item, Compra, Fornecedor, Almoxarifado
+
+compras = Blueprint('compras', __name__)
+
+# Itens migrados por transação em migrar-historico
+LOTE_MIGRACAO = 1000
+
+
+def registrar_compra(item, quantidade, preco_unitario, movimentacao=None, **campos):
+    """
+    Grava a compra de uma entrada (fornecedor_id, nota_fiscal, data).
+    Não faz commit: quem chama controla a transação.
+    """
+    compra = Compra(
+        item_id=item.id,
+        quantidade=quantidade,
+        preco_unitario=preco_unitario,
+        movimentacao=movimentacao,
+        **campos
+    )
+    db.session.add(compra)
+    return compra
+
+
+def ultimos_precos(item_ids):
+    """
+    Última compra de cada item: {item_id: (preco_unitario, fornecedor_id, data)}.
+    Uma consulta, resolvida pelo índice (item_id, data).
+    """
+    if not item_ids:
+        return {}
+
+    ordem = func.row_number().over(
+        partition_by=Compra.item_id,
+        order_by=(Compra.data.desc(), Compra.id.desc())
+    ).label('ordem')
+    recentes = db.session.query(
+        Compra.item_id, Compra.preco_unitario, Compra.fornecedor_id, Compra.data, ordem
+    ).filter(Compra.item_id.in_(list(item_ids))).subquery()
+
+    return {
+        item_id: (preco, fornecedor_id, data)
+        for item_id, preco, fornecedor_id, data in db.session.query(
+            recentes.c.item_id, recentes.c.preco_unitario, recentes.c.fornecedor_id, recentes.c.data
+        ).filter(recentes.c.ordem == 1)
+    }
+
+
+def resumo_precos(codigo_barras, almoxarifado_id=None, desde=None):
+    """
+    Preços pagos por um código (todos os lotes): último, médio ponderado
+    pela quantidade, mínimo, máximo e número de compras.
+    """
+    filtros = [Item.codigo_barras == codigo_barras]
+    if almoxarifado_id:
+        filtros.append(Item.almoxarifado_id == almoxarifado_id)
+    if desde:
+        filtros.append(Compra.data >= desde)
+
+    total_compras, quantidade, valor, minimo, maximo = db.session.query(
+        func.count(Compra.id),
+        func.sum(Compra.quantidade),
+        func.sum(Compra.quantidade * Compra.preco_unitario),
+        func.min(Compra.preco_unitario),
+        func.max(Compra.preco_unitario)
+    ).join(Item).filter(*filtros).one()
+
+    if not total_compras:
+        return None
+
+    ultima = Compra.query.join(Item).filter(*filtros).order_by(
+        Compra.data.desc(), Compra.id.desc()
+    ).first()
+
+    return {
+        'compras': total_compras,
+        'quantidade': quantidade or 0,
+        'ultimo_preco': ultima.preco_unitario,
+        'ultima_compra': ultima,
+        'preco_medio': valor / quantidade if quantidade else None,
+        'preco_minimo': minimo,
+        'preco_maximo': maximo
+    }
+
+
+@compras.route('/compras')
+@login_required
+def historico():
+    """Histórico de preços de compra, com resumo por código de barras"""
+    page = request.args.get('page', 1, type=int)
+    codigo_barras = request.args.get('codigo_barras', '').strip()
+
+    if current_user.ve_todos_almoxarifados:
+        almoxarifado_id = request.args.get('almoxarifado_id', type=int)
+    else:
+        almoxarifado_id = current_user.almoxarifado_id
+
+    query = Compra.query.join(Item).options(contains_eager(Compra.item), joinedload(Compra.fornecedor))
+    if almoxarifado_id:
+        query = query.filter(Item.almoxarifado_id == almoxarifado_id)
+    elif not current_user.ve_todos_almoxarifados:
+        query = query.filter(Item.almoxarifado_id == None)
+    if codigo_barras:
+        query = query.filter(Item.codigo_barras == codigo_barras)
+
+    lista = query.order_by(Compra.data.desc(), Compra.id.desc()).paginate(page=page, per_page=20, error_out=False)
+    resumo = resumo_precos(codigo_barras, almoxarifado_id) if codigo_barras else None
+
+    almoxarifados = []
+    if current_user.ve_todos_almoxarifados:
+        almoxarifados = Almoxarifado.query.filter_by(ativo=True).order_by(Almoxarifado.nome).all()
+
+    return render_template('compras/historico.html',
+                         compras=lista,
+                         resumo=resumo,
+                         codigo_barras=codigo_barras,
+                         almoxarifados=almoxarifados,
+                         almoxarifado_selecionado=almoxarifado_id)
+
+
+# ====================
+# MIGRAÇÃO DO JSON historico_compras
+# ====================
+def _valor(registro, *nomes):
+    for nome in nomes:
+        if registro.get(nome) not in (None, ''):
+            return registro[nome]
+    return None
+
+
+def _numero(valor):
+    if isinstance(valor, str):
+        valor = valor.strip().replace('.', '').replace(',', '.') if ',' in valor else valor.strip()
+    return float(valor)
+
+
+def _data_compra(valor, padrao):
+    if not valor:
+        return padrao
+    valor = str(valor).strip()
+    if '/' in valor:
+        return datetime.strptime(valor[:10], '%d/%m/%Y')
+    return datetime.fromisoformat(valor)
+
+
+def ler_historico(item, fornecedores):
+    """
+    Converte o JSON legado de um item em linhas para a tabela compras.
+    Aceita uma lista de registros (ou {"compras": [...]}) com data,
+    preco/preco_unitario/valor_unitario, quantidade, fornecedor (nome ou id)
+    e nota_fiscal. Levanta ValueError se algum registro for inválido.
+    """
+    dados = json.loads(item.historico_compras)
+    if isinstance(dados, dict):
+        dados = dados.get('compras', [dados])
+
+    linhas = []
+    for registro in dados:
+        preco = _valor(registro, 'preco_unitario', 'preco', 'valor_unitario', 'valor')
+        if preco is None:
+            raise ValueError(f'registro sem preço: {registro}')
+
+        fornecedor = _valor(registro, 'fornecedor_id', 'fornecedor')
+        if isinstance(fornecedor, str) and not fornecedor.isdigit():
+            fornecedor = fornecedores.get(fornecedor.strip().lower())
+
+        linhas.append({
+            'item_id': item.id,
+            'data': _data_compra(_valor(registro, 'data', 'data_compra'), item.data_cadastro or datetime.utcnow()),
+            'quantidade': _numero(_valor(registro, 'quantidade', 'qtd') or 0),
+            'preco_unitario': _numero(preco),
+            'fornecedor_id': int(fornecedor) if fornecedor else None,
+            'nota_fiscal': _valor(registro, 'nota_fiscal', 'nf')
+        })
+    return linhas
+
+
+def migrar_historico(ao_progredir=None):
+    """
+    Copia o JSON historico_compras de todos os itens para a tabela compras,
+    em transações de LOTE_MIGRACAO itens. O JSON de um item só é apagado
+    depois de migrado, então a migração pode ser repetida sem duplicar.
+    Retorna (compras gravadas, [(item_id, erro)]).
+    """
+    fornecedores = {nome.strip().lower(): id for id, nome in db.session.query(Fornecedor.id, Fornecedor.nome)}
+    ids = [id for id, in db.session.query(Item.id).filter(
+        Item.historico_compras != None, Item.historico_compras != ''
+    ).order_by(Item.id)]
+
+    gravadas, erros = 0, []
+    for inicio in range(0, len(ids), LOTE_MIGRACAO):
+        linhas = []
+        for item in Item.query.filter(Item.id.in_(ids[inicio:inicio + LOTE_MIGRACAO])):
+            try:
+                linhas.extend(ler_historico(item, fornecedores))
+            except (ValueError, TypeError, AttributeError) as e:
+                erros.append((item.id, str(e)))
+                continue
+            item.historico_compras = None
+
+        if linhas:
+            db.session.execute(insert(Compra), linhas)
+        db.session.commit()
+        gravadas += len(linhas)
+        if ao_progredir:
+            ao_progredir(min(inicio + LOTE_MIGRACAO, len(ids)), len(ids))
+
+    return gravadas, erros
+
+
+@compras.cli.command('migrar-historico')
+def migrar_historico_comando():
+    """Migra o JSON historico_compras dos itens para a tabela compras"""
+    gravadas, erros = migrar_historico(
+        lambda feitos, total: click.echo(f'{feitos}/{total} item(ns) processado(s)...')
+    )
+    for item_id, erro in erros:
+        click.echo(f'item {item_id}: {erro}', err=True)
+    click.echo(f'{gravadas} compra(s) migrada(s); {len(erros)} item(ns) com erro mantido(s) no JSON.')
@@ -0,0 +1,112 @@
+"""
+Rotas de endereços (localização física dos lotes no almoxarifado)
+"""
+
+from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask_login import login_required, current_user
+from sqlalchemy import func
+
+from models import db, Item, Endereco, Almoxarifado
+
+enderecos = Blueprint('enderecos', __name__)
+
+
+def _almoxarifado_selecionado():
+    if current_user.ve_todos_almoxarifados:
+        return request.values.get('almoxarifado_id', type=int)
+    return current_user.almoxarifado_id
+
+
+@enderecos.route('/enderecos')
+@login_required
+def listar():
+    """Endereços de um almoxarifado em ordem de caminhada, com a quantidade de lotes"""
+    almoxarifado_id = _almoxarifado_selecionado()
+
+    lista = []
+    if almoxarifado_id:
+        lotes = db.session.query(
+            Item.endereco_id, func.count(Item.id).label('total')
+        ).filter(Item.ativo == True).group_by(Item.endereco_id).subquery()
+
+        lista = db.session.query(
+            Endereco, func.coalesce(lotes.c.total, 0)
+        ).outerjoin(lotes, lotes.c.endereco_id == Endereco.id).filter(
+            Endereco.almoxarifado_id == almoxarifado_id,
+            Endereco.ativo == True
+        ).order_by(*Endereco.ordem_caminhada()).all()
+
+    almoxarifados = []
+    if current_user.ve_todos_almoxarifados:
+        almoxarifados = Almoxarifado.query.filter_by(ativo=True).order_by(Almoxarifado.nome).all()
+
+    return render_template('enderecos/listar.html',
+                         enderecos=lista,
+                         almoxarifados=almoxarifados,
+                         almoxarifado_selecionado=almoxarifado_id)
+
+
+@enderecos.route('/enderecos/novo', methods=['POST'])
+@login_required
+def novo():
+    """Cadastra um endereço a partir do código (zona-corredor-prateleira-posição)"""
+    almoxarifado_id = _almoxarifado_selecionado()
+
+    if not current_user.pode_gerenciar_estoque:
+        flash('Você não tem permissão para cadastrar endereços.', 'danger')
+    elif not almoxarifado_id:
+        flash('Selecione o almoxarifado!', 'warning')
+    else:
+        try:
+            zona, corredor, prateleira, posicao = Endereco.partes(request.form.get('codigo'))
+            endereco = Endereco(
+                zona=zona, corredor=corredor, prateleira=prateleira, posicao=posicao,
+                ordem=request.form.get('ordem', type=int),
+                almoxarifado_id=almoxarifado_id
+            )
+            db.session.add(endereco)
+            db.session.commit()
+            flash(f'Endereço {endereco.codigo} cadastrado!', 'success')
+        except ValueError as e:
+            flash(str(e), 'warning')
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Erro ao cadastrar endereço (já existe?): {str(e)}', 'danger')
+
+    return redirect(url_for('enderecos.listar', almoxarifado_id=almoxarifado_id))
+
+
+@enderecos.route('/enderecos/buscar')
+@login_required
+def buscar():
+    """Localiza um endereço pelo código lido na etiqueta"""
+    almoxarifado_id = _almoxarifado_selecionado()
+
+    try:
+        zona, corredor, prateleira, posicao = Endereco.partes(request.args.get('codigo'))
+    except ValueError as e:
+        flash(str(e), 'warning')
+        return redirect(url_for('enderecos.listar', almoxarifado_id=almoxarifado_id))
+
+    endereco = Endereco.query.filter_by(
+        almoxarifado_id=almoxarifado_id, zona=zona, corredor=corredor,
+        prateleira=prateleira, posicao=posicao
+    ).first()
+    if not endereco:
+        flash('Endereço não encontrado.', 'warning')
+        return redirect(url_for('enderecos.listar', almoxarifado_id=almoxarifado_id))
+
+    return redirect(url_for('enderecos.ver', id=endereco.id))
+
+
+@enderecos.route('/enderecos/<int:id>')
+@login_required
+def ver(id):
+    """Lotes guardados num endereço"""
+    endereco = Endereco.query.get_or_404(id)
+    if not current_user.pode_acessar_almoxarifado(endereco.almoxarifado_id):
+        flash('Você não tem permissão para este almoxarifado.', 'danger')
+        return redirect(url_for('enderecos.listar'))
+
+    itens = endereco.itens.filter_by(ativo=True).order_by(Item.codigo_barras, Item.data_validade).all()
+    return render_template('enderecos/ver.html', endereco=endereco, itens=itens)
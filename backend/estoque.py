@@ -0,0 +1,631 @@
+"""
+Operações de estoque
+Regras compartilhadas de movimentação, saldo corrente (ledger),
+posição de estoque em uma data, conciliação de saldos e kardex
+"""
+
+import math
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, date, time, timedelta
+from itertools import repeat
+from sqlalchemy import case, func, and_, or_, select, update, create_engine
+from sqlalchemy.orm import contains_eager
+from models import (db, Item, Movimentacao, SaldoEstoque, Almoxarifado, Setor, Usuario, Reserva, Endereco, Compra,
+                    proxima_versao)
+
+
+# Quantidade com sinal: saídas subtraem, entradas somam e ajustes e
+# transferências já são gravados com sinal (positivo ou negativo)
+QUANTIDADE_ASSINADA = case(
+    (Movimentacao.tipo == 'saida', -Movimentacao.quantidade),
+    else_=Movimentacao.quantidade
+)
+
+
+def delta_estoque(tipo, quantidade):
+    """Efeito de uma movimentação no saldo do item"""
+    return -quantidade if tipo == 'saida' else quantidade
+
+
+def filtrar_por_almoxarifado(query, usuario, almoxarifado_id=None):
+    """Restringe uma consulta de itens aos almoxarifados visíveis ao usuário"""
+    if usuario.ve_todos_almoxarifados:
+        if almoxarifado_id:
+            query = query.filter(Item.almoxarifado_id == int(almoxarifado_id))
+    else:
+        # Usuário sem almoxarifado não vê nada
+        query = query.filter(Item.almoxarifado_id == usuario.almoxarifado_id)
+    return query
+
+
+def ordenar_por_endereco(query):
+    """Ordena uma consulta de itens no percurso pelo almoxarifado (lotes sem endereço no fim)"""
+    return query.outerjoin(Endereco, Item.endereco_id == Endereco.id).options(
+        contains_eager(Item.endereco)
+    ).order_by(Item.endereco_id.is_(None), *Endereco.ordem_caminhada())
+
+
+class EstoqueInsuficienteError(ValueError):
+    """Quantidade solicitada maior que o estoque disponível"""
+
+
+def registrar_movimentacao(item, tipo, quantidade, usuario_id, **campos):
+    """
+    Aplica uma movimentação ao item e grava o lançamento no ledger.
+    Não faz commit: quem chama controla a transação.
+    """
+    item.estoque_atual = (item.estoque_atual or 0) + delta_estoque(tipo, quantidade)
+
+    movimentacao = Movimentacao(
+        tipo=tipo,
+        quantidade=quantidade,
+        item_id=item.id,
+        usuario_id=usuario_id,
+        saldo_apos=item.estoque_atual,
+        **campos
+    )
+    db.session.add(movimentacao)
+    return movimentacao
+
+
+def atualizar_custo_medio(item, quantidade, custo_unitario):
+    """
+    Custo médio ponderado do item após receber quantidade a custo_unitario,
+    calculado em O(1) a partir do saldo e do custo atuais. Chamar antes de
+    registrar_movimentacao, enquanto estoque_atual é o saldo anterior.
+    Saídas e ajustes não alteram o custo médio.
+    """
+    saldo = max(item.estoque_atual or 0, 0)
+    total = saldo + quantidade
+    if total <= 0:
+        item.custo_medio = custo_unitario
+    else:
+        item.custo_medio = (saldo * (item.custo_medio or 0) + quantidade * custo_unitario) / total
+
+
+def lotes_fefo(almoxarifado_id, codigos_barras, bloquear=True):
+    """
+    Lotes utilizáveis (ativos, não vencidos, com disponível) dos códigos
+    informados, agrupados por código e em ordem FEFO, lidos numa única
+    varredura do índice (almoxarifado_id, codigo_barras, data_validade).
+    Com bloquear, as linhas ficam travadas até o fim da transação.
+    """
+    query = Item.query.filter(
+        Item.almoxarifado_id == almoxarifado_id,
+        Item.codigo_barras.in_(list(codigos_barras)),
+        Item.ativo == True,
+        Item.estoque_disponivel > 0,
+        or_(Item.data_validade == None, Item.data_validade >= date.today())
+    ).order_by(
+        Item.codigo_barras, Item.data_validade.asc().nulls_last(), Item.id
+    )
+    if bloquear:
+        query = query.with_for_update()
+
+    por_codigo = {}
+    for lote in query.all():
+        por_codigo.setdefault(lote.codigo_barras, []).append(lote)
+    return por_codigo
+
+
+def baixar_fefo(lotes, codigo_barras, quantidade, usuario_id, **campos):
+    """
+    Distribui uma saída entre lotes já em ordem FEFO (ver lotes_fefo).
+    Pode ser chamada várias vezes com a mesma lista: cada baixa reduz o
+    disponível do lote em memória. Retorna a lista de (lote, quantidade).
+    """
+    # NaN passaria pelas comparações abaixo e baixaria todos os lotes
+    if not math.isfinite(quantidade):
+        raise ValueError('Quantidade inválida.')
+    if quantidade <= 0:
+        raise ValueError('Quantidade deve ser maior que zero.')
+    disponivel = sum(max(lote.estoque_disponivel, 0) for lote in lotes)
+    if disponivel < quantidade:
+        raise EstoqueInsuficienteError(
+            f'Estoque insuficiente para {codigo_barras}: disponível {disponivel:g}, solicitado {quantidade:g}.'
+        )
+
+    alocacao = []
+    restante = quantidade
+    for lote in lotes:
+        if restante <= 0:
+            break
+        baixa = min(lote.estoque_disponivel, restante)
+        if baixa <= 0:
+            continue
+        registrar_movimentacao(lote, 'saida', baixa, usuario_id, **campos)
+        alocacao.append((lote, baixa))
+        restante -= baixa
+
+    return alocacao
+
+
+def saida_fefo(almoxarifado_id, codigo_barras, quantidade, usuario_id, **campos):
+    """
+    Saída por código de barras distribuída entre os lotes do almoxarifado,
+    primeiro o que vence primeiro (FEFO). Lotes vencidos e quantidades
+    reservadas não são usados.
+    Não faz commit. Retorna a lista de (lote, quantidade) baixada.
+    """
+    lotes = lotes_fefo(almoxarifado_id, [codigo_barras]).get(codigo_barras, [])
+    return baixar_fefo(lotes, codigo_barras, quantidade, usuario_id, **campos)
+
+
+def transferir(origem, almoxarifado_destino_id, quantidade, usuario_id, observacao=None):
+    """
+    Transfere estoque de um lote para o mesmo lote (código e lote) em outro
+    almoxarifado, cadastrando-o no destino se ainda não existir.
+    Grava um par de movimentações 'transferencia' ligadas entre si:
+    negativa na origem e positiva no destino.
+    Não faz commit. Retorna (lote_destino, movimentacao_saida, movimentacao_entrada).
+    """
+    if not math.isfinite(quantidade):
+        raise ValueError('Quantidade inválida.')
+    if quantidade <= 0:
+        raise ValueError('Quantidade deve ser maior que zero.')
+    if almoxarifado_destino_id == origem.almoxarifado_id:
+        raise ValueError('O almoxarifado de destino deve ser diferente do de origem.')
+
+    almoxarifado_destino = db.session.get(Almoxarifado, almoxarifado_destino_id)
+    if not almoxarifado_destino or not almoxarifado_destino.ativo:
+        raise ValueError('Almoxarifado de destino inválido.')
+
+    if origem.estoque_disponivel < quantidade:
+        raise EstoqueInsuficienteError(
+            f'Estoque insuficiente para {origem.codigo_barras} (lote {origem.lote}): '
+            f'disponível {origem.estoque_disponivel:g}, solicitado {quantidade:g}.'
+        )
+
+    destino = Item.query.filter_by(
+        codigo_barras=origem.codigo_barras,
+        lote=origem.lote,
+        almoxarifado_id=almoxarifado_destino_id
+    ).with_for_update().first()
+
+    if destino is None:
+        destino = Item(
+            codigo_barras=origem.codigo_barras,
+            nome=origem.nome,
+            descricao=origem.descricao,
+            marca=origem.marca,
+            unidade_medida=origem.unidade_medida,
+            estoque_minimo=origem.estoque_minimo,
+            estoque_atual=0,
+            lote=origem.lote,
+            data_validade=origem.data_validade,
+            categoria_id=origem.categoria_id,
+            almoxarifado_id=almoxarifado_destino_id
+        )
+        db.session.add(destino)
+        db.session.flush()
+    elif not destino.ativo:
+        destino.ativo = True
+
+    # O destino recebe ao custo médio da origem
+    atualizar_custo_medio(destino, quantidade, origem.custo_medio or 0)
+
+    complemento = f' - {observacao}' if observacao else ''
+    saida = registrar_movimentacao(
+        origem, 'transferencia', -quantidade, usuario_id,
+        observacao=f'Transferência para {almoxarifado_destino.nome}{complemento}'
+    )
+    entrada = registrar_movimentacao(
+        destino, 'transferencia', quantidade, usuario_id,
+        observacao=f'Transferência de {origem.almoxarifado.nome}{complemento}'
+    )
+    saida.par = entrada
+    entrada.par = saida
+
+    return destino, saida, entrada
+
+
+# ====================
+# RESERVAS
+# ====================
+def _somar_reservado(item_id, quantidade, exigir_disponivel=False):
+    """
+    Soma quantidade ao estoque_reservado do item num único UPDATE
+    condicional (sem janela entre a leitura e a gravação).
+    Retorna False se o disponível não comportava a quantidade.
+    """
+    condicoes = [Item.id == item_id]
+    if exigir_disponivel:
+        condicoes.append(Item.estoque_disponivel >= quantidade)
+
+    resultado = db.session.execute(
+        update(Item).where(*condicoes).values(
+            estoque_reservado=func.coalesce(Item.estoque_reservado, 0) + quantidade,
+            versao=proxima_versao(db.session)
+        ).execution_options(synchronize_session='fetch')
+    )
+    return resultado.rowcount == 1
+
+
+def reservar(item, quantidade, setor_id, usuario_id, observacao=None):
+    """
+    Separa quantidade do estoque disponível do item para um setor.
+    Não faz commit. Retorna a Reserva.
+    """
+    if quantidade <= 0:
+        raise ValueError('Quantidade deve ser maior que zero.')
+    if not item.ativo:
+        raise ValueError('Item inativo.')
+
+    if not _somar_reservado(item.id, quantidade, exigir_disponivel=True):
+        db.session.refresh(item)
+        raise EstoqueInsuficienteError(
+            f'Estoque insuficiente para reservar {item.codigo_barras} (lote {item.lote}): '
+            f'disponível {item.estoque_disponivel:g}, solicitado {quantidade:g}.'
+        )
+
+    reserva = Reserva(
+        item_id=item.id,
+        setor_id=setor_id,
+        usuario_id=usuario_id,
+        quantidade=quantidade,
+        observacao=observacao
+    )
+    db.session.add(reserva)
+    return reserva
+
+
+def _encerrar_reserva(reserva, status):
+    """Passa a reserva de ativa para o status final e devolve a quantidade ao disponível"""
+    resultado = db.session.execute(
+        update(Reserva).where(
+            Reserva.id == reserva.id, Reserva.status == 'ativa'
+        ).values(
+            status=status, data_encerramento=datetime.utcnow()
+        ).execution_options(synchronize_session='fetch')
+    )
+    if resultado.rowcount != 1:
+        # Outra requisição encerrou a reserva antes
+        raise ValueError(f'A reserva nº {reserva.id} não está mais ativa.')
+
+    _somar_reservado(reserva.item_id, -reserva.quantidade)
+
+
+def liberar_reserva(reserva):
+    """Cancela a reserva sem retirar o material. Não faz commit."""
+    _encerrar_reserva(reserva, 'liberada')
+
+
+def consumir_reserva(reserva, usuario_id, observacao=None):
+    """
+    Retira o material reservado: encerra a reserva e registra a saída
+    para o setor dela. Não faz commit. Retorna a Movimentacao.
+    """
+    _encerrar_reserva(reserva, 'consumida')
+
+    item = Item.query.filter_by(id=reserva.item_id).populate_existing().with_for_update().one()
+    if item.estoque_disponivel < reserva.quantidade:
+        raise EstoqueInsuficienteError(
+            f'Estoque insuficiente para {item.codigo_barras} (lote {item.lote}): '
+            f'disponível {item.estoque_disponivel:g}, reservado {reserva.quantidade:g}.'
+        )
+
+    movimentacao = registrar_movimentacao(
+        item, 'saida', reserva.quantidade, usuario_id,
+        setor_id=reserva.setor_id,
+        observacao=observacao or f'Reserva nº {reserva.id}'
+    )
+    db.session.flush()
+    reserva.movimentacao_id = movimentacao.id
+    return movimentacao
+
+
+# ====================
+# POSIÇÃO DE ESTOQUE EM UMA DATA
+# ====================
+def data_corte(data_ref):
+    """Instante de corte (exclusivo) para o saldo ao final do dia informado"""
+    return datetime.combine(data_ref + timedelta(days=1), time.min)
+
+
+def consulta_saldo_em(data_ref, usuario=None, almoxarifado_id=None, fechamento_do_dia=True):
+    """
+    Consulta (Item, saldo) ao final de data_ref.
+    Parte do fechamento mais recente até a data e soma apenas as
+    movimentações posteriores a ele, sem reprocessar todo o histórico.
+    Com fechamento_do_dia=False ignora o fechamento da própria data e
+    parte do anterior (para refazê-lo com lançamentos retroativos).
+    """
+    limite = data_corte(data_ref)
+
+    # Último fechamento de cada item até a data
+    ate_limite = SaldoEstoque.data_corte <= limite if fechamento_do_dia else SaldoEstoque.data_corte < limite
+    ultimo_corte = db.session.query(
+        SaldoEstoque.item_id,
+        func.max(SaldoEstoque.data_corte).label('data_corte')
+    ).filter(ate_limite).group_by(SaldoEstoque.item_id).subquery()
+
+    fechamento = db.session.query(
+        SaldoEstoque.item_id,
+        SaldoEstoque.data_corte,
+        SaldoEstoque.saldo
+    ).join(ultimo_corte, and_(
+        SaldoEstoque.item_id == ultimo_corte.c.item_id,
+        SaldoEstoque.data_corte == ultimo_corte.c.data_corte
+    )).subquery()
+
+    saldo = func.coalesce(fechamento.c.saldo, 0) + func.coalesce(func.sum(QUANTIDADE_ASSINADA), 0)
+
+    query = db.session.query(Item, saldo.label('saldo')).outerjoin(
+        fechamento, fechamento.c.item_id == Item.id
+    ).outerjoin(Movimentacao, and_(
+        Movimentacao.item_id == Item.id,
+        Movimentacao.data_hora < limite,
+        or_(fechamento.c.data_corte == None, Movimentacao.data_hora >= fechamento.c.data_corte)
+    )).filter(
+        or_(Item.data_cadastro == None, Item.data_cadastro < limite)
+    ).group_by(Item.id, fechamento.c.saldo)
+
+    if usuario is not None:
+        query = filtrar_por_almoxarifado(query, usuario, almoxarifado_id)
+    elif almoxarifado_id:
+        query = query.filter(Item.almoxarifado_id == int(almoxarifado_id))
+
+    return query
+
+
+def gerar_fechamento(data_ref):
+    """
+    Grava o saldo de todos os itens ao final de data_ref, que precisa
+    ser um dia já encerrado (anterior a hoje): movimentações feitas
+    depois do fechamento de um dia em aberto ficariam fora das posições.
+    Idempotente: refazer o fechamento de uma data o recalcula a partir do
+    fechamento anterior e substitui o gravado.
+    Retorna a quantidade de saldos gravados.
+    """
+    if data_ref >= date.today():
+        raise ValueError('O fechamento só pode ser gerado para dias já encerrados (anteriores a hoje).')
+    limite = data_corte(data_ref)
+
+    linhas = [
+        {'item_id': item.id, 'data_corte': limite, 'saldo': saldo, 'data_geracao': datetime.utcnow()}
+        for item, saldo in consulta_saldo_em(data_ref, fechamento_do_dia=False).all()
+    ]
+
+    SaldoEstoque.query.filter_by(data_corte=limite).delete(synchronize_session=False)
+    if linhas:
+        db.session.execute(SaldoEstoque.__table__.insert(), linhas)
+    db.session.commit()
+
+    return len(linhas)
+
+
+def ultimo_dia_mes_anterior(hoje=None):
+    """Data padrão de fechamento: último dia do mês anterior"""
+    hoje = hoje or date.today()
+    return hoje.replace(day=1) - timedelta(days=1)
+
+
+# ====================
+# CONCILIAÇÃO DE SALDOS
+# ====================
+# Diferenças menores que isso são ruído de ponto flutuante
+TOLERANCIA_CONCILIACAO = 1e-6
+
+# Quantidade de ajustes gravados por transação na correção
+LOTE_CORRECAO = 1000
+
+
+def _consulta_divergencias(almoxarifado_id=None):
+    """Itens cujo estoque_atual difere da soma das suas movimentações"""
+    soma = func.coalesce(func.sum(QUANTIDADE_ASSINADA), 0)
+
+    consulta = select(
+        Item.id,
+        Item.almoxarifado_id,
+        func.coalesce(Item.estoque_atual, 0),
+        soma
+    ).select_from(Item).outerjoin(
+        Movimentacao, Movimentacao.item_id == Item.id
+    ).group_by(Item.id).having(
+        func.abs(func.coalesce(Item.estoque_atual, 0) - soma) > TOLERANCIA_CONCILIACAO
+    )
+
+    if almoxarifado_id:
+        consulta = consulta.where(Item.almoxarifado_id == int(almoxarifado_id))
+    return consulta
+
+
+def _divergencias_particao(uri, almoxarifado_id):
+    """Executa a conciliação de um almoxarifado em um processo separado"""
+    engine = create_engine(uri)
+    try:
+        with engine.connect() as conn:
+            return [tuple(linha) for linha in conn.execute(_consulta_divergencias(almoxarifado_id))]
+    finally:
+        engine.dispose()
+
+
+def levantar_divergencias(almoxarifado_id=None, processos=1):
+    """
+    Compara estoque_atual com a soma das movimentações de cada item
+    em uma única passada agrupada. Com processos > 1, cada almoxarifado
+    é conciliado em um processo separado.
+    """
+    if processos <= 1 or almoxarifado_id:
+        linhas = [tuple(linha) for linha in db.session.execute(_consulta_divergencias(almoxarifado_id))]
+    else:
+        uri = db.engine.url.render_as_string(hide_password=False)
+        almoxarifados_ids = [a_id for (a_id,) in db.session.query(Almoxarifado.id).all()]
+        with ProcessPoolExecutor(max_workers=processos) as executor:
+            partes = executor.map(_divergencias_particao, repeat(uri), almoxarifados_ids)
+            linhas = [linha for parte in partes for linha in parte]
+
+    return [{
+        'item_id': item_id,
+        'almoxarifado_id': almox_id,
+        'estoque_atual': float(estoque_atual),
+        'soma_movimentacoes': float(soma),
+        'diferenca': float(estoque_atual) - float(soma)
+    } for item_id, almox_id, estoque_atual, soma in linhas]
+
+
+def corrigir_divergencias(divergencias, usuario_id):
+    """
+    Grava um ajuste compensatório para cada divergência, de modo que a
+    soma das movimentações volte a bater com estoque_atual (o saldo do
+    item não é alterado). Commit a cada LOTE_CORRECAO ajustes.
+    """
+    agora = datetime.utcnow()
+    total = 0
+
+    for inicio in range(0, len(divergencias), LOTE_CORRECAO):
+        lote = divergencias[inicio:inicio + LOTE_CORRECAO]
+        db.session.execute(Movimentacao.__table__.insert(), [{
+            'tipo': 'ajuste',
+            'quantidade': d['diferenca'],
+            'data_hora': agora,
+            'observacao': f"Conciliação automática: estoque {d['estoque_atual']:g}, "
+                          f"soma das movimentações {d['soma_movimentacoes']:g}",
+            'saldo_apos': d['estoque_atual'],
+            'item_id': d['item_id'],
+            'usuario_id': usuario_id
+        } for d in lote])
+        db.session.commit()
+        total += len(lote)
+
+    return total
+
+
+# ====================
+# VALOR DO ESTOQUE
+# ====================
+def valores_por_almoxarifado(usuario=None):
+    """Valor do estoque de cada almoxarifado visível: [(almoxarifado, valor)]"""
+    query = Almoxarifado.query.filter_by(ativo=True)
+    if usuario is not None and not usuario.ve_todos_almoxarifados:
+        query = query.filter(Almoxarifado.id == usuario.almoxarifado_id)
+    return [(almox, almox.valor_estoque or 0) for almox in query.order_by(Almoxarifado.nome)]
+
+
+def recalcular_valor_estoque(inicializar_custos=False):
+    """
+    Refaz valor_estoque de todos os almoxarifados somando os itens
+    (corrige desvios do total mantido incrementalmente).
+    Com inicializar_custos, itens sem custo médio recebem antes o preço
+    da sua última compra. Retorna {almoxarifado_id: valor}.
+    """
+    # Trava os totais: gravações em andamento terminam antes da soma
+    # e as seguintes somam sua variação sobre o valor recalculado
+    almoxarifados = [id for id, in db.session.query(Almoxarifado.id).with_for_update()]
+
+    if inicializar_custos:
+        ultimo_preco = select(Compra.preco_unitario).where(
+            Compra.item_id == Item.id
+        ).order_by(Compra.data.desc(), Compra.id.desc()).limit(1).scalar_subquery()
+        db.session.execute(
+            update(Item).where(Item.custo_medio == 0, ultimo_preco != None).values(
+                custo_medio=ultimo_preco, versao=proxima_versao(db.session)
+            ).execution_options(synchronize_session=False)
+        )
+
+    valores = dict(db.session.query(
+        Item.almoxarifado_id, func.sum(Item.valor_estoque)
+    ).group_by(Item.almoxarifado_id).all())
+
+    tabela = Almoxarifado.__table__
+    for almoxarifado_id in almoxarifados:
+        db.session.execute(
+            update(tabela).where(tabela.c.id == almoxarifado_id)
+            .values(valor_estoque=valores.get(almoxarifado_id) or 0)
+        )
+    db.session.commit()
+
+    return {almoxarifado_id: valores.get(almoxarifado_id) or 0 for almoxarifado_id in almoxarifados}
+
+
+# ====================
+# KARDEX (FICHA DE ESTOQUE)
+# ====================
+KARDEX_POR_PAGINA = 100
+
+
+def _kardex_select(movimentos, saldo_inicial=0):
+    """Colunas do kardex com saldo corrente calculado por função de janela"""
+    saldo = saldo_inicial + func.sum(movimentos.c.quantidade_assinada).over(
+        order_by=(movimentos.c.data_hora, movimentos.c.id)
+    )
+    return select(
+        movimentos.c.id,
+        movimentos.c.data_hora,
+        movimentos.c.tipo,
+        movimentos.c.quantidade,
+        movimentos.c.quantidade_assinada,
+        saldo.label('saldo'),
+        movimentos.c.nota_fiscal,
+        movimentos.c.observacao,
+        Item.lote,
+        Item.codigo_barras,
+        Setor.nome.label('setor'),
+        Usuario.nome.label('usuario')
+    ).select_from(movimentos).join(
+        Item, Item.id == movimentos.c.item_id
+    ).join(
+        Usuario, Usuario.id == movimentos.c.usuario_id
+    ).outerjoin(
+        Setor, Setor.id == movimentos.c.setor_id
+    ).order_by(movimentos.c.data_hora, movimentos.c.id)
+
+
+def _movimentos_kardex(itens_ids):
+    return select(
+        Movimentacao.id,
+        Movimentacao.data_hora,
+        Movimentacao.tipo,
+        Movimentacao.quantidade,
+        QUANTIDADE_ASSINADA.label('quantidade_assinada'),
+        Movimentacao.nota_fiscal,
+        Movimentacao.observacao,
+        Movimentacao.item_id,
+        Movimentacao.setor_id,
+        Movimentacao.usuario_id
+    ).where(Movimentacao.item_id.in_(itens_ids))
+
+
+def pagina_kardex(itens_ids, apos_id=None, por_pagina=KARDEX_POR_PAGINA):
+    """
+    Uma página do kardex em ordem cronológica (paginação por chave).
+    apos_id é o id da última movimentação da página anterior. O saldo
+    anterior à página vem de uma soma no índice (item_id, data_hora) e a
+    janela roda apenas sobre as linhas da página.
+    Retorna (linhas, id_da_ultima_linha_ou_None).
+    """
+    movimentos = _movimentos_kardex(itens_ids)
+    saldo_inicial = 0
+
+    if apos_id:
+        cursor = db.session.get(Movimentacao, apos_id)
+        if cursor is not None:
+            depois = or_(
+                Movimentacao.data_hora > cursor.data_hora,
+                and_(Movimentacao.data_hora == cursor.data_hora, Movimentacao.id > cursor.id)
+            )
+            saldo_inicial = db.session.query(
+                func.coalesce(func.sum(QUANTIDADE_ASSINADA), 0)
+            ).filter(Movimentacao.item_id.in_(itens_ids), ~depois).scalar()
+            movimentos = movimentos.where(depois)
+
+    pagina = movimentos.order_by(
+        Movimentacao.data_hora, Movimentacao.id
+    ).limit(por_pagina + 1).subquery()
+
+    linhas = db.session.execute(_kardex_select(pagina, saldo_inicial)).all()
+
+    proximo = None
+    if len(linhas) > por_pagina:
+        linhas = linhas[:por_pagina]
+        proximo = linhas[-1].id
+    return linhas, proximo
+
+
+def kardex_completo(itens_ids):
+    """Kardex inteiro em fluxo (para CSV/PDF), sem carregar tudo na memória"""
+    movimentos = _movimentos_kardex(itens_ids).subquery()
+    return db.session.execute(
+        _kardex_select(movimentos),
+        execution_options={'yield_per': 1000}
+    )
@@ -0,0 +1,342 @@
+"""
+Atualizações ao vivo (Server-Sent Events)
+Stream por almoxarifado com as alterações de estoque e as novas
+movimentações, para o dashboard e o histórico se atualizarem sem recarregar.
+
+O registro de eventos são as próprias tabelas já gravadas: itens
+alterados por versao (contador em ordem de commit) e movimentações por
+id. Cada processo tem uma única thread (o distribuidor) que lê o registro
+a cada INTERVALO_EVENTOS e repassa o lote às filas das conexões abertas,
+cada uma filtrando o seu almoxarifado; o custo no banco não cresce com o
+número de abas. Como cada worker lê os commits de todos, não é preciso
+comunicação entre eles.
+
+O cursor "versao:item:movimentacao" vai no id de cada evento e o navegador
+o devolve em Last-Event-ID ao reconectar. A conexão que chega atrás do
+distribuidor consulta o que perdeu antes de passar a ler da fila, sem
+perder nem repetir eventos.
+
+Cada conexão ocupa uma thread do servidor; acima de EVENTOS_MAX_CONEXOES
+por processo o stream responde só com um intervalo de reconexão maior.
+"""
+
+import json
+import queue
+import threading
+import time
+
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
+from flask_login import login_required, current_user
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import joinedload
+
+from models import db, Item, Movimentacao, Almoxarifado, coluna_status_validade
+
+eventos = Blueprint('eventos', __name__)
+
+# Segundos entre duas leituras do registro de eventos
+INTERVALO_EVENTOS = 2
+# Comentário de keep-alive para proxies não derrubarem a conexão ociosa
+INTERVALO_KEEPALIVE = 15
+# Duração máxima de cada conexão; o navegador reconecta sozinho em seguida,
+# o que também reveza as vagas quando o limite de conexões é atingido
+DURACAO_STREAM = 120
+# Intervalo de reconexão sugerido quando não há vaga (segundos)
+INTERVALO_SEM_VAGA = 30
+# Máximo de linhas por evento (o restante sai na leitura seguinte)
+LIMITE_EVENTOS = 200
+
+
+def cursor_atual():
+    """Cursor do momento: a página o recebe ao renderizar e o stream continua dali"""
+    versao, item = db.session.query(func.max(Item.versao), func.max(Item.id)).one()
+    movimentacao = db.session.query(func.max(Movimentacao.id)).scalar()
+    return f'{versao or 0}:{item or 0}:{movimentacao or 0}'
+
+
+def _ler_cursor(valor):
+    try:
+        versao, item, movimentacao = (int(parte) for parte in valor.split(':'))
+        return versao, item, movimentacao
+    except (AttributeError, ValueError):
+        return None
+
+
+def itens_alterados(almoxarifado_id, versao, apos=0):
+    """Lotes alterados depois de (versao, apos), paginados como em /api/sync/itens (None: todos os almoxarifados)"""
+    query = Item.query.filter(or_(
+        Item.versao > versao,
+        and_(Item.versao == versao, Item.id > apos)
+    ))
+    if almoxarifado_id:
+        query = query.filter(Item.almoxarifado_id == almoxarifado_id)
+    return query.order_by(Item.versao, Item.id).limit(LIMITE_EVENTOS).all()
+
+
+def movimentacoes_novas(almoxarifado_id, desde):
+    """Movimentações registradas depois do id desde (None: todos os almoxarifados)"""
+    query = Movimentacao.query.join(Item).options(
+        joinedload(Movimentacao.item), joinedload(Movimentacao.setor), joinedload(Movimentacao.usuario)
+    ).filter(Movimentacao.id > desde)
+    if almoxarifado_id:
+        query = query.filter(Item.almoxarifado_id == almoxarifado_id)
+    return query.order_by(Movimentacao.id).limit(LIMITE_EVENTOS).all()
+
+
+def resumo_estoque(almoxarifado_id):
+    """Contadores do dashboard, pelas colunas de situação indexadas (None: todos os almoxarifados)"""
+    base = Item.query.filter_by(ativo=True)
+    almoxarifados = Almoxarifado.query.filter_by(ativo=True)
+    if almoxarifado_id:
+        base = base.filter(Item.almoxarifado_id == almoxarifado_id)
+        almoxarifados = almoxarifados.filter(Almoxarifado.id == almoxarifado_id)
+
+    status_validade = coluna_status_validade()
+    validade = dict(base.with_entities(status_validade, func.count(Item.id)).group_by(status_validade).all())
+
+    return {
+        'total_itens': sum(validade.values()),
+        'estoque_baixo': base.filter(Item.estoque_disponivel < Item.estoque_minimo).count(),
+        'vencidos': validade.get('vencido', 0),
+        'a_vencer': validade.get('vence_em_breve', 0),
+        'valor_estoque': round(sum(almox.valor_estoque or 0 for almox in almoxarifados), 2)
+    }
+
+
+def _dados_item(item):
+    return {
+        'id': item.id,
+        'codigo_barras': item.codigo_barras,
+        'lote': item.lote,
+        'nome': item.nome,
+        'unidade_medida': item.unidade_medida,
+        'estoque_atual': item.estoque_atual,
+        'estoque_disponivel': item.estoque_disponivel,
+        'estoque_minimo': item.estoque_minimo,
+        'status_estoque': item.status_estoque,
+        'status_validade': item.status_validade,
+        'ativo': item.ativo,
+        'almoxarifado_id': item.almoxarifado_id
+    }
+
+
+def _dados_movimentacao(mov):
+    return {
+        'id': mov.id,
+        'tipo': mov.tipo,
+        'quantidade': mov.quantidade,
+        'data_hora': mov.data_hora.strftime('%d/%m/%Y %H:%M'),
+        'item_id': mov.item_id,
+        'codigo_barras': mov.item.codigo_barras,
+        'item': mov.item.nome,
+        'unidade_medida': mov.item.unidade_medida,
+        'almoxarifado_id': mov.item.almoxarifado_id,
+        'setor': mov.setor.nome if mov.setor else None,
+        'usuario': mov.usuario.nome if mov.usuario else None,
+        'observacao': mov.observacao
+    }
+
+
+def _evento(nome, cursor, dados):
+    return f'event: {nome}\nid: {cursor}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n'
+
+
+class Assinatura:
+    """Conexão aberta no distribuidor: almoxarifado acompanhado (None: todos) e a fila de lotes"""
+
+    def __init__(self, almoxarifado_id, com_resumo):
+        self.almoxarifado_id = almoxarifado_id
+        self.com_resumo = com_resumo
+        self.fila = queue.Queue()
+
+
+class Distribuidor:
+    """
+    Leitor único do registro de eventos no processo. A thread sobe com a
+    primeira conexão e para quando não resta nenhuma. Cada lote publicado
+    traz os lotes de itens e as movimentações depois do cursor anterior,
+    de todos os almoxarifados, e os resumos pedidos pelas conexões.
+    """
+
+    def __init__(self):
+        self._trava = threading.Lock()
+        self._assinaturas = set()
+        self._thread = None
+        self.cursor = None
+
+    @property
+    def conexoes(self):
+        return len(self._assinaturas)
+
+    def assinar(self, app, almoxarifado_id, com_resumo):
+        """Registra uma conexão; retorna (assinatura, cursor do distribuidor) ou None sem vaga"""
+        with self._trava:
+            if len(self._assinaturas) >= app.config['EVENTOS_MAX_CONEXOES']:
+                return None
+            if self._thread is None:
+                self.cursor = _ler_cursor(cursor_atual())
+                self._thread = threading.Thread(target=self._executar, args=(app,),
+                                                name='eventos-distribuidor', daemon=True)
+                self._thread.start()
+            assinatura = Assinatura(almoxarifado_id, com_resumo)
+            self._assinaturas.add(assinatura)
+            return assinatura, self.cursor
+
+    def cancelar(self, assinatura):
+        with self._trava:
+            self._assinaturas.discard(assinatura)
+
+    def _executar(self, app):
+        with app.app_context():
+            while True:
+                time.sleep(INTERVALO_EVENTOS)
+                with self._trava:
+                    if not self._assinaturas:
+                        self._thread = None
+                        return
+                    cursor = self.cursor
+                    resumos = {a.almoxarifado_id for a in self._assinaturas if a.com_resumo}
+
+                try:
+                    lote = self._ler(cursor, resumos)
+                except Exception:
+                    app.logger.exception('Falha ao ler o registro de eventos')
+                    lote = None
+                finally:
+                    # Não segura a transação de leitura (e o lock do SQLite) entre as leituras
+                    db.session.remove()
+
+                if lote:
+                    with self._trava:
+                        self.cursor = lote['cursor']
+                        for assinatura in self._assinaturas:
+                            assinatura.fila.put(lote)
+
+    def _ler(self, cursor, resumos):
+        versao, ultimo_item, ultima_movimentacao = cursor
+        itens = itens_alterados(None, versao, ultimo_item)
+        movimentacoes = movimentacoes_novas(None, ultima_movimentacao)
+        if not itens and not movimentacoes:
+            return None
+
+        if itens:
+            versao, ultimo_item = itens[-1].versao, itens[-1].id
+        if movimentacoes:
+            ultima_movimentacao = movimentacoes[-1].id
+
+        # Resumo só de quem o pediu e teve lote alterado
+        alterados = {item.almoxarifado_id for item in itens}
+        return {
+            'cursor': (versao, ultimo_item, ultima_movimentacao),
+            'itens': [(item.versao, item.id, _dados_item(item)) for item in itens],
+            'movimentacoes': [(mov.id, _dados_movimentacao(mov)) for mov in movimentacoes],
+            'resumos': {almoxarifado_id: resumo_estoque(almoxarifado_id) for almoxarifado_id in resumos
+                        if alterados and (almoxarifado_id is None or almoxarifado_id in alterados)}
+        }
+
+
+distribuidor = Distribuidor()
+
+
+@eventos.route('/api/eventos')
+@login_required
+def stream():
+    """
+    Stream SSE de um almoxarifado (almoxarifado_id; para quem vê todos,
+    sem ele acompanha todos). Eventos:
+    - estoque: {'itens': [...], 'resumo': {...}} com os lotes alterados
+      (os contadores do dashboard só com resumo=1)
+    - movimentacao: {'movimentacoes': [...]} com as novas movimentações
+    O cursor inicial vem de Last-Event-ID, do parâmetro desde ou, sem
+    eles, do momento da conexão.
+    """
+    almoxarifado_id = request.args.get('almoxarifado_id', type=int)
+    com_resumo = request.args.get('resumo', 0, type=int) == 1
+    if not current_user.ve_todos_almoxarifados:
+        almoxarifado_id = almoxarifado_id or current_user.almoxarifado_id
+    if (not current_user.ve_todos_almoxarifados and not almoxarifado_id) or \
+            (almoxarifado_id and not current_user.pode_acessar_almoxarifado(almoxarifado_id)):
+        return jsonify({'erro': 'Sem acesso a este almoxarifado.'}), 403
+
+    cabecalhos = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    inscricao = distribuidor.assinar(current_app._get_current_object(), almoxarifado_id, com_resumo)
+    if inscricao is None:
+        # Sem vaga: o EventSource só reconecta sozinho após uma resposta 200,
+        # então responde o stream vazio com um intervalo de reconexão maior
+        return Response(f'retry: {INTERVALO_SEM_VAGA * 1000}\n\n', mimetype='text/event-stream',
+                        headers=cabecalhos)
+    assinatura, cursor_distribuidor = inscricao
+
+    cursor = _ler_cursor(request.headers.get('Last-Event-ID')) or _ler_cursor(request.args.get('desde')) \
+        or cursor_distribuidor
+
+    def gerar():
+        versao, ultimo_item, ultima_movimentacao = cursor
+        # A conexão do banco volta ao pool; o stream só consulta ao recuperar eventos
+        db.session.remove()
+        # Intervalo de reconexão sugerido ao EventSource (ms)
+        yield f'retry: {int(INTERVALO_EVENTOS * 1000)}\n\n'
+
+        # Recupera o que ficou antes do cursor do distribuidor; daí em diante
+        # tudo chega pela fila (o que vier repetido é descartado pelo cursor)
+        if cursor != cursor_distribuidor:
+            while True:
+                try:
+                    itens = itens_alterados(almoxarifado_id, versao, ultimo_item)
+                    movimentacoes = movimentacoes_novas(almoxarifado_id, ultima_movimentacao)
+                    lotes = [_dados_item(item) for item in itens]
+                    dados_movimentacoes = [_dados_movimentacao(mov) for mov in movimentacoes]
+                    resumo = resumo_estoque(almoxarifado_id) if lotes and com_resumo else None
+                    if itens:
+                        versao, ultimo_item = itens[-1].versao, itens[-1].id
+                    if movimentacoes:
+                        ultima_movimentacao = movimentacoes[-1].id
+                finally:
+                    db.session.remove()
+
+                marcador = f'{versao}:{ultimo_item}:{ultima_movimentacao}'
+                if lotes:
+                    yield _evento('estoque', marcador, {'itens': lotes, 'resumo': resumo})
+                if dados_movimentacoes:
+                    yield _evento('movimentacao', marcador, {'movimentacoes': dados_movimentacoes})
+                if len(itens) < LIMITE_EVENTOS and len(movimentacoes) < LIMITE_EVENTOS:
+                    break
+
+        inicio = time.monotonic()
+        while True:
+            restante = DURACAO_STREAM - (time.monotonic() - inicio)
+            if restante <= 0:
+                break
+            try:
+                lote = assinatura.fila.get(timeout=min(INTERVALO_KEEPALIVE, restante))
+            except queue.Empty:
+                yield ': keep-alive\n\n'
+                continue
+
+            lotes = [dados for v, i, dados in lote['itens']
+                     if (v, i) > (versao, ultimo_item) and almoxarifado_id in (None, dados['almoxarifado_id'])]
+            movimentacoes = [dados for id, dados in lote['movimentacoes']
+                             if id > ultima_movimentacao and almoxarifado_id in (None, dados['almoxarifado_id'])]
+            versao, ultimo_item = max((versao, ultimo_item), lote['cursor'][:2])
+            ultima_movimentacao = max(ultima_movimentacao, lote['cursor'][2])
+
+            resumo = None
+            if lotes and com_resumo:
+                resumo = lote['resumos'].get(almoxarifado_id)
+                if resumo is None:
+                    # Conexão aberta depois que o distribuidor separou os resumos do lote
+                    try:
+                        resumo = resumo_estoque(almoxarifado_id)
+                    finally:
+                        db.session.remove()
+
+            marcador = f'{versao}:{ultimo_item}:{ultima_movimentacao}'
+            if lotes:
+                yield _evento('estoque', marcador, {'itens': lotes, 'resumo': resumo})
+            if movimentacoes:
+                yield _evento('movimentacao', marcador, {'movimentacoes': movimentacoes})
+
+    resposta = Response(stream_with_context(gerar()), mimetype='text/event-stream', headers=cabecalhos)
+    # Libera a vaga quando o servidor fecha a resposta, mesmo que o stream nem tenha começado
+    resposta.call_on_close(lambda: distribuidor.cancelar(assinatura))
+    return resposta
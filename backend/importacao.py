@@ -0,0 +1,607 @@
+"""
+Importações em massa por planilha CSV
+- Contagem de inventário físico: prévia das diferenças e ajustes em lote
+- Catálogo de itens: cadastro/atualização de lotes em lote (upsert)
+"""
+
+import csv
+import io
+import json
+import math
+import os
+import threading
+import unicodedata
+import uuid
+from datetime import datetime
+
+import click
+from flask import (Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app,
+                   Response, stream_with_context)
+from flask_login import login_required, current_user
+from sqlalchemy import insert, update
+
+from models import (db, Item, Movimentacao, Almoxarifado, Usuario, Categoria, Endereco, proxima_versao,
+                    somar_valor_estoque, sincronizar_status)
+from estoque import ordenar_por_endereco
+
+importacao = Blueprint('importacao', __name__)
+
+# Itens processados por transação ao aplicar um inventário
+LOTE_INVENTARIO = 1000
+
+# Linhas exibidas na prévia
+LIMITE_PREVIA = 500
+
+# Nomes aceitos para a coluna de quantidade contada
+COLUNAS_QUANTIDADE = ('quantidade_contada', 'quantidade', 'contado', 'qtd')
+
+
+# ====================
+# LEITURA DE CSV
+# ====================
+def _normalizar(texto):
+    """Cabeçalho sem acentos, minúsculo e com _ no lugar de espaços"""
+    texto = unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode()
+    return texto.strip().lower().replace(' ', '_')
+
+
+def numero(valor):
+    """Converte '1.234,5', '1234,5' ou '1234.5' em float (nan e inf são inválidos)"""
+    valor = (valor or '').strip()
+    if ',' in valor:
+        valor = valor.replace('.', '').replace(',', '.')
+    convertido = float(valor)
+    if not math.isfinite(convertido):
+        raise ValueError(f'Número inválido: {valor}')
+    return convertido
+
+
+def ler_csv(arquivo):
+    """
+    Lê um CSV em fluxo (sem carregar o arquivo inteiro), detectando ';' ou ','
+    como separador. Gera (numero_da_linha, {coluna: valor}).
+    """
+    texto = io.TextIOWrapper(arquivo, encoding='utf-8-sig', newline='')
+    primeira = texto.readline()
+    delimitador = ';' if primeira.count(';') >= primeira.count(',') else ','
+    cabecalho = [_normalizar(c) for c in next(csv.reader([primeira], delimiter=delimitador), [])]
+
+    for numero_linha, valores in enumerate(csv.reader(texto, delimiter=delimitador), start=2):
+        if not any(v.strip() for v in valores):
+            continue
+        yield numero_linha, dict(zip(cabecalho, (v.strip() for v in valores)))
+
+
+# ====================
+# INVENTÁRIO (CONTAGEM FÍSICA)
+# ====================
+def _pasta_inventarios():
+    pasta = os.path.join(current_app.instance_path, 'inventarios')
+    os.makedirs(pasta, exist_ok=True)
+    return pasta
+
+
+def _caminho_inventario(token):
+    return os.path.join(_pasta_inventarios(), f'{uuid.UUID(token).hex}.json')
+
+
+def carregar_inventario(token):
+    """Lê um inventário pendente/em andamento; None se não existir"""
+    try:
+        with open(_caminho_inventario(token), encoding='utf-8') as f:
+            return json.load(f)
+    except (ValueError, OSError):
+        return None
+
+
+def salvar_inventario(token, dados):
+    """Grava o estado do inventário de forma atômica (lido por qualquer worker)"""
+    caminho = _caminho_inventario(token)
+    temporario = f'{caminho}.tmp'
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(dados, f)
+    os.replace(temporario, caminho)
+
+
+def comparar_contagem(almoxarifado_id, linhas):
+    """
+    Confronta a planilha de contagem com os lotes do almoxarifado.
+    Os lotes são carregados de uma vez (um mapa (codigo, lote) -> item) e
+    as linhas da planilha são consumidas em fluxo. Contagens repetidas
+    do mesmo lote são somadas.
+    """
+    lotes = {
+        (codigo, lote): (item_id, estoque or 0)
+        for item_id, codigo, lote, estoque in db.session.query(
+            Item.id, Item.codigo_barras, Item.lote, Item.estoque_atual
+        ).filter(Item.almoxarifado_id == almoxarifado_id, Item.ativo == True)
+    }
+
+    contagens = {}
+    nao_encontrados = []
+    invalidas = []
+    total_linhas = 0
+
+    for numero_linha, linha in linhas:
+        total_linhas += 1
+        codigo = linha.get('codigo_barras') or linha.get('codigo', '')
+        lote = linha.get('lote', '')
+        valor = next((linha[c] for c in COLUNAS_QUANTIDADE if linha.get(c)), None)
+
+        try:
+            contado = numero(valor)
+            if contado < 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            invalidas.append({'linha': numero_linha, 'codigo_barras': codigo, 'lote': lote, 'valor': valor})
+            continue
+
+        encontrado = lotes.get((codigo, lote))
+        if encontrado is None:
+            nao_encontrados.append({'linha': numero_linha, 'codigo_barras': codigo, 'lote': lote})
+            continue
+
+        contagens[encontrado[0]] = contagens.get(encontrado[0], 0) + contado
+
+    estoque_de = {item_id: estoque for item_id, estoque in lotes.values()}
+    diferencas = [
+        (item_id, estoque_de[item_id], contado)
+        for item_id, contado in contagens.items()
+        if abs(contado - estoque_de[item_id]) > 1e-9
+    ]
+
+    return {
+        'almoxarifado_id': almoxarifado_id,
+        'total_linhas': total_linhas,
+        'contagens': sorted(contagens.items()),
+        'diferencas': diferencas,
+        'nao_encontrados': nao_encontrados,
+        'invalidas': invalidas
+    }
+
+
+def aplicar_inventario(token, usuario_id, ao_progredir=None):
+    """
+    Grava os ajustes do inventário em transações de LOTE_INVENTARIO itens:
+    movimentações por INSERT em lote e estoques por UPDATE em lote.
+    A diferença é recalculada contra o estoque no momento da gravação.
+    """
+    dados = carregar_inventario(token)
+    contagens = dados['contagens']
+    observacao = f"Inventário físico importado em {dados['criado_em']}"
+
+    dados.update(status='aplicando', processados=0, ajustes=0, total=len(contagens))
+    salvar_inventario(token, dados)
+
+    for inicio in range(0, len(contagens), LOTE_INVENTARIO):
+        lote = contagens[inicio:inicio + LOTE_INVENTARIO]
+        atuais = {item_id: (estoque, custo, almox_id) for item_id, estoque, custo, almox_id in db.session.query(
+            Item.id, Item.estoque_atual, Item.custo_medio, Item.almoxarifado_id
+        ).filter(
+            Item.id.in_([item_id for item_id, _ in lote])
+        ).with_for_update().all()}
+
+        agora = datetime.utcnow()
+        movimentacoes = []
+        estoques = []
+        valores = {}
+        for item_id, contado in lote:
+            if item_id not in atuais:
+                continue
+            estoque, custo, almox_id = atuais[item_id]
+            diferenca = contado - (estoque or 0)
+            if abs(diferenca) <= 1e-9:
+                continue
+            valores[almox_id] = valores.get(almox_id, 0) + diferenca * (custo or 0)
+            movimentacoes.append({
+                'tipo': 'ajuste',
+                'quantidade': diferenca,
+                'data_hora': agora,
+                'observacao': observacao,
+                'saldo_apos': contado,
+                'item_id': item_id,
+                'usuario_id': usuario_id
+            })
+            estoques.append({'id': item_id, 'estoque_atual': contado})
+
+        if estoques:
+            # UPDATE em lote não passa pelo flush: a versão e o valor dos almoxarifados são atualizados aqui
+            versao = proxima_versao(db.session)
+            for estoque in estoques:
+                estoque['versao'] = versao
+            db.session.execute(insert(Movimentacao), movimentacoes)
+            db.session.execute(update(Item), estoques)
+            sincronizar_status(db.session, Item.versao == versao)
+            somar_valor_estoque(db.session, valores)
+        db.session.commit()
+
+        dados['processados'] += len(lote)
+        dados['ajustes'] += len(estoques)
+        salvar_inventario(token, dados)
+        if ao_progredir:
+            ao_progredir(len(lote))
+
+    dados['status'] = 'concluido'
+    salvar_inventario(token, dados)
+    return dados
+
+
+def _aplicar_em_segundo_plano(app, token, usuario_id):
+    with app.app_context():
+        try:
+            aplicar_inventario(token, usuario_id)
+        except Exception as e:
+            db.session.rollback()
+            dados = carregar_inventario(token) or {}
+            dados.update(status='erro', erro=str(e))
+            salvar_inventario(token, dados)
+        finally:
+            db.session.remove()
+
+
+def _almoxarifado_do_formulario():
+    if current_user.ve_todos_almoxarifados:
+        return request.form.get('almoxarifado_id', type=int)
+    return current_user.almoxarifado_id
+
+
+@importacao.route('/movimentacoes/inventario', methods=['GET', 'POST'])
+@login_required
+def inventario():
+    """Importa uma planilha de contagem física e mostra a prévia das diferenças"""
+    if not current_user.pode_gerenciar_estoque:
+        flash('Você não tem permissão para acessar esta página.', 'danger')
+        return redirect(url_for('dashboard'))
+
+    almoxarifados = []
+    if current_user.ve_todos_almoxarifados:
+        almoxarifados = Almoxarifado.query.filter_by(ativo=True).order_by(Almoxarifado.nome).all()
+
+    if request.method == 'POST':
+        arquivo = request.files.get('arquivo')
+        almoxarifado_id = _almoxarifado_do_formulario()
+
+        if not arquivo or not arquivo.filename:
+            flash('Selecione a planilha de contagem (CSV).', 'warning')
+        elif not almoxarifado_id:
+            flash('Selecione o almoxarifado!', 'warning')
+        else:
+            try:
+                resultado = comparar_contagem(almoxarifado_id, ler_csv(arquivo.stream))
+            except (UnicodeDecodeError, csv.Error) as e:
+                flash(f'Não foi possível ler a planilha: {str(e)}', 'danger')
+                return render_template('importacao/inventario.html', almoxarifados=almoxarifados)
+
+            token = str(uuid.uuid4())
+            salvar_inventario(token, {
+                'almoxarifado_id': almoxarifado_id,
+                'usuario_id': current_user.id,
+                'criado_em': datetime.now().strftime('%d/%m/%Y %H:%M'),
+                'contagens': resultado['contagens'],
+                'status': 'pendente'
+            })
+
+            # Prévia na ordem de caminhada, para a recontagem seguir o percurso
+            diferencas = {item_id: (sistema, contado) for item_id, sistema, contado in resultado['diferencas']}
+            lotes = ordenar_por_endereco(
+                Item.query.filter(Item.id.in_(list(diferencas)))
+            ).limit(LIMITE_PREVIA).all() if diferencas else []
+            exibidas = [(item.id, *diferencas[item.id]) for item in lotes]
+            itens = {item.id: item for item in lotes}
+
+            return render_template('importacao/inventario.html',
+                                 almoxarifados=almoxarifados,
+                                 token=token,
+                                 resultado=resultado,
+                                 diferencas=exibidas,
+                                 itens=itens,
+                                 limite_previa=LIMITE_PREVIA)
+
+    return render_template('importacao/inventario.html', almoxarifados=almoxarifados)
+
+
+@importacao.route('/movimentacoes/inventario/planilha')
+@login_required
+def planilha_contagem():
+    """Planilha de contagem em branco, com os lotes na ordem de caminhada"""
+    if not current_user.pode_gerenciar_estoque:
+        flash('Você não tem permissão para acessar esta página.', 'danger')
+        return redirect(url_for('dashboard'))
+
+    if current_user.ve_todos_almoxarifados:
+        almoxarifado_id = request.args.get('almoxarifado_id', type=int)
+    else:
+        almoxarifado_id = current_user.almoxarifado_id
+    if not almoxarifado_id:
+        flash('Selecione o almoxarifado!', 'warning')
+        return redirect(url_for('importacao.inventario'))
+
+    query = ordenar_por_endereco(
+        Item.query.filter(Item.almoxarifado_id == almoxarifado_id, Item.ativo == True)
+    ).order_by(Item.codigo_barras, Item.lote)
+
+    def gerar():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, delimiter=';')
+        writer.writerow(['endereco', 'codigo_barras', 'lote', 'nome', 'unidade_medida', 'quantidade_contada'])
+        for item in query.yield_per(1000):
+            writer.writerow([
+                item.endereco.codigo if item.endereco else '',
+                item.codigo_barras, item.lote, item.nome, item.unidade_medida, ''
+            ])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+
+    return Response(
+        stream_with_context(gerar()),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename=contagem_{datetime.now().strftime("%Y%m%d")}.csv'}
+    )
+
+
+@importacao.route('/movimentacoes/inventario/<token>/confirmar', methods=['POST'])
+@login_required
+def confirmar_inventario(token):
+    """Inicia a gravação dos ajustes em segundo plano"""
+    dados = carregar_inventario(token)
+    if not dados or dados.get('usuario_id') != current_user.id:
+        flash('Inventário não encontrado.', 'danger')
+        return redirect(url_for('importacao.inventario'))
+
+    if dados.get('status') == 'pendente':
+        dados['status'] = 'na_fila'
+        salvar_inventario(token, dados)
+        threading.Thread(
+            target=_aplicar_em_segundo_plano,
+            args=(current_app._get_current_object(), token, current_user.id),
+            daemon=True
+        ).start()
+
+    return render_template('importacao/progresso.html', token=token)
+
+
+@importacao.route('/movimentacoes/inventario/<token>/progresso')
+@login_required
+def progresso_inventario(token):
+    """Progresso da gravação de um inventário (consultado pela página)"""
+    dados = carregar_inventario(token)
+    if not dados or dados.get('usuario_id') != current_user.id:
+        return jsonify({'erro': 'Inventário não encontrado.'}), 404
+
+    return jsonify({
+        'status': dados.get('status'),
+        'processados': dados.get('processados', 0),
+        'total': dados.get('total', len(dados.get('contagens', []))),
+        'ajustes': dados.get('ajustes', 0),
+        'erro': dados.get('erro')
+    })
+
+
+@importacao.cli.command('inventario')
+@click.argument('arquivo', type=click.File('rb'))
+@click.option('--almoxarifado', 'almoxarifado_id', type=int, required=True, help='Almoxarifado contado.')
+@click.option('--usuario', 'username', default='admin', show_default=True, help='Usuário registrado nos ajustes.')
+@click.option('--confirmar', is_flag=True, help='Grava os ajustes (sem isso, apenas mostra a prévia).')
+def inventario_comando(arquivo, almoxarifado_id, username, confirmar):
+    """Importa uma planilha de contagem física (codigo_barras;lote;quantidade_contada)"""
+    usuario = Usuario.query.filter_by(username=username).first()
+    if not usuario:
+        raise click.ClickException(f'Usuário "{username}" não encontrado.')
+
+    resultado = comparar_contagem(almoxarifado_id, ler_csv(arquivo))
+    click.echo(f"{resultado['total_linhas']} linha(s) lida(s), {len(resultado['contagens'])} lote(s) contado(s), "
+               f"{len(resultado['diferencas'])} com diferença, {len(resultado['nao_encontrados'])} não encontrado(s), "
+               f"{len(resultado['invalidas'])} inválida(s).")
+
+    if not confirmar:
+        return
+
+    token = str(uuid.uuid4())
+    salvar_inventario(token, {
+        'almoxarifado_id': almoxarifado_id,
+        'usuario_id': usuario.id,
+        'criado_em': datetime.now().strftime('%d/%m/%Y %H:%M'),
+        'contagens': resultado['contagens'],
+        'status': 'pendente'
+    })
+    with click.progressbar(length=len(resultado['contagens']), label='Gravando ajustes') as barra:
+        dados = aplicar_inventario(token, usuario.id, barra.update)
+    click.echo(f"{dados['ajustes']} ajuste(s) registrado(s).")
+
+
+# ====================
+# CATÁLOGO DE ITENS
+# ====================
+# Lotes gravados por transação na importação do catálogo
+LOTE_CATALOGO = 1000
+
+# Colunas obrigatórias e opcionais da planilha de catálogo
+COLUNAS_OBRIGATORIAS_CATALOGO = ('codigo_barras', 'lote', 'nome', 'unidade_medida')
+COLUNAS_OPCIONAIS_CATALOGO = ('descricao', 'marca', 'estoque_minimo', 'data_validade', 'categoria', 'endereco')
+
+
+def _data(valor):
+    """Aceita AAAA-MM-DD ou DD/MM/AAAA"""
+    formato = '%d/%m/%Y' if '/' in valor else '%Y-%m-%d'
+    return datetime.strptime(valor, formato).date()
+
+
+def _insert_upsert():
+    """INSERT do dialeto em uso (suporta ON CONFLICT)"""
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as insert_dialeto
+    else:
+        from sqlalchemy.dialects.sqlite import insert as insert_dialeto
+    return insert_dialeto(Item.__table__)
+
+
+def _gravar_catalogo(registros):
+    """Grava um lote de itens: insere os novos e atualiza os existentes pela chave uix_codigo_lote_almox"""
+    versao = proxima_versao(db.session)
+    for registro in registros:
+        registro['versao'] = versao
+
+    stmt = _insert_upsert()
+    colunas = [c for c in registros[0] if c not in ('codigo_barras', 'lote', 'almoxarifado_id')]
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['codigo_barras', 'lote', 'almoxarifado_id'],
+        set_={c: stmt.excluded[c] for c in colunas}
+    )
+    db.session.execute(stmt, registros)
+    sincronizar_status(db.session, Item.versao == versao)
+    db.session.commit()
+
+
+def importar_catalogo(almoxarifado_id, linhas, ao_progredir=None):
+    """
+    Cadastra ou atualiza os lotes de um almoxarifado a partir das linhas
+    da planilha, em transações de LOTE_CATALOGO. Só as colunas presentes
+    na planilha são gravadas; o estoque nunca é alterado (use entradas).
+    Categorias são resolvidas pelo nome e criadas se não existirem;
+    endereços precisam estar cadastrados no almoxarifado.
+    """
+    categorias = {_normalizar(nome): cat_id for cat_id, nome in db.session.query(Categoria.id, Categoria.nome)}
+    enderecos = {
+        (zona, corredor, prateleira, posicao): endereco_id
+        for endereco_id, zona, corredor, prateleira, posicao in db.session.query(
+            Endereco.id, Endereco.zona, Endereco.corredor, Endereco.prateleira, Endereco.posicao
+        ).filter(Endereco.almoxarifado_id == almoxarifado_id, Endereco.ativo == True)
+    }
+    resultado = {'total_linhas': 0, 'gravados': 0, 'categorias_criadas': [], 'erros': []}
+    pendentes = {}
+    colunas = None
+
+    for numero_linha, linha in linhas:
+        resultado['total_linhas'] += 1
+        if colunas is None:
+            colunas = [c for c in COLUNAS_OPCIONAIS_CATALOGO if c in linha]
+
+        faltando = [c for c in COLUNAS_OBRIGATORIAS_CATALOGO if not linha.get(c)]
+        if faltando:
+            resultado['erros'].append({'linha': numero_linha, 'erro': f"Campo(s) obrigatório(s) vazio(s): {', '.join(faltando)}"})
+            continue
+
+        registro = {
+            'codigo_barras': linha['codigo_barras'],
+            'lote': linha['lote'],
+            'almoxarifado_id': almoxarifado_id,
+            'nome': linha['nome'],
+            'unidade_medida': linha['unidade_medida'].upper(),
+            'ativo': True
+        }
+        try:
+            if 'descricao' in colunas:
+                registro['descricao'] = linha.get('descricao') or None
+            if 'marca' in colunas:
+                registro['marca'] = linha.get('marca') or None
+            if 'estoque_minimo' in colunas:
+                registro['estoque_minimo'] = numero(linha['estoque_minimo']) if linha.get('estoque_minimo') else 0
+            if 'data_validade' in colunas:
+                registro['data_validade'] = _data(linha['data_validade']) if linha.get('data_validade') else None
+        except ValueError:
+            resultado['erros'].append({'linha': numero_linha, 'erro': 'Estoque mínimo ou data de validade inválidos.'})
+            continue
+
+        if 'endereco' in colunas:
+            endereco_id = None
+            if linha.get('endereco'):
+                try:
+                    endereco_id = enderecos.get(Endereco.partes(linha['endereco']))
+                except ValueError:
+                    pass
+                if endereco_id is None:
+                    resultado['erros'].append({'linha': numero_linha, 'erro': f"Endereço {linha['endereco']} não cadastrado."})
+                    continue
+            registro['endereco_id'] = endereco_id
+
+        if 'categoria' in colunas:
+            nome_categoria = linha.get('categoria')
+            categoria_id = None
+            if nome_categoria:
+                categoria_id = categorias.get(_normalizar(nome_categoria))
+                if categoria_id is None:
+                    categoria = Categoria(nome=nome_categoria)
+                    db.session.add(categoria)
+                    db.session.flush()
+                    categoria_id = categorias[_normalizar(nome_categoria)] = categoria.id
+                    resultado['categorias_criadas'].append(nome_categoria)
+            registro['categoria_id'] = categoria_id
+
+        # A mesma chave repetida no arquivo: vale a última linha
+        pendentes[(registro['codigo_barras'], registro['lote'])] = registro
+        if len(pendentes) >= LOTE_CATALOGO:
+            _gravar_catalogo(list(pendentes.values()))
+            resultado['gravados'] += len(pendentes)
+            if ao_progredir:
+                ao_progredir(len(pendentes))
+            pendentes = {}
+
+    if pendentes:
+        _gravar_catalogo(list(pendentes.values()))
+        resultado['gravados'] += len(pendentes)
+        if ao_progredir:
+            ao_progredir(len(pendentes))
+    db.session.commit()
+
+    return resultado
+
+
+@importacao.route('/itens/importar', methods=['GET', 'POST'])
+@login_required
+def catalogo():
+    """Importa (cadastra ou atualiza) itens a partir de uma planilha CSV"""
+    if not current_user.pode_gerenciar_estoque:
+        flash('Você não tem permissão para acessar esta página.', 'danger')
+        return redirect(url_for('dashboard'))
+
+    almoxarifados = []
+    if current_user.ve_todos_almoxarifados:
+        almoxarifados = Almoxarifado.query.filter_by(ativo=True).order_by(Almoxarifado.nome).all()
+
+    resultado = None
+    if request.method == 'POST':
+        arquivo = request.files.get('arquivo')
+        almoxarifado_id = _almoxarifado_do_formulario()
+
+        if not arquivo or not arquivo.filename:
+            flash('Selecione a planilha de itens (CSV).', 'warning')
+        elif not almoxarifado_id:
+            flash('Selecione o almoxarifado!', 'warning')
+        else:
+            try:
+                resultado = importar_catalogo(almoxarifado_id, ler_csv(arquivo.stream))
+                flash(f"{resultado['gravados']} lote(s) cadastrado(s) ou atualizado(s).", 'success')
+            except Exception as e:
+                db.session.rollback()
+                flash(f'Erro ao importar itens: {str(e)}', 'danger')
+
+    return render_template('importacao/catalogo.html',
+                         almoxarifados=almoxarifados,
+                         resultado=resultado,
+                         limite_previa=LIMITE_PREVIA)
+
+
+@importacao.cli.command('catalogo')
+@click.argument('arquivo', type=click.File('rb'))
+@click.option('--almoxarifado', 'almoxarifado_id', type=int, required=True, help='Almoxarifado dos itens.')
+def catalogo_comando(arquivo, almoxarifado_id):
+    """Importa itens de uma planilha (codigo_barras;lote;nome;unidade_medida;...)"""
+    if not db.session.get(Almoxarifado, almoxarifado_id):
+        raise click.ClickException(f'Almoxarifado {almoxarifado_id} não encontrado.')
+
+    gravados = 0
+
+    def ao_progredir(quantidade):
+        nonlocal gravados
+        gravados += quantidade
+        click.echo(f'{gravados} lote(s) gravado(s)...')
+
+    resultado = importar_catalogo(almoxarifado_id, ler_csv(arquivo), ao_progredir)
+
+    for erro in resultado['erros']:
+        click.echo(f"linha {erro['linha']}: {erro['erro']}")
+    if resultado['categorias_criadas']:
+        click.echo(f"Categorias criadas: {', '.join(resultado['categorias_criadas'])}")
+    click.echo(f"{resultado['total_linhas']} linha(s) lida(s), {resultado['gravados']} lote(s) gravado(s), "
+               f"{len(resultado['erros'])} erro(s).")
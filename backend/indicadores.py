@@ -0,0 +1,237 @@
+"""
+Indicadores de estoque calculados em SQL
+Perda por vencimento por período e giro de estoque com dias de
+cobertura, agregados por almoxarifado e categoria em consultas
+agrupadas sobre as colunas de data indexadas
+"""
+
+from datetime import date, datetime, time, timedelta
+
+from flask import Blueprint, request, jsonify
+from flask_login import login_required, current_user
+from sqlalchemy import and_, case, extract, func
+
+from models import db, Item, Movimentacao, Categoria
+from estoque import QUANTIDADE_ASSINADA, data_corte, filtrar_por_almoxarifado
+
+indicadores = Blueprint('indicadores', __name__)
+
+# Período padrão dos indicadores quando inicio/fim não são informados
+DIAS_PADRAO_VENCIDOS = 365
+DIAS_PADRAO_GIRO = 90
+
+AGRUPAMENTOS = ('mes', 'trimestre')
+
+
+def _periodo(dias_padrao):
+    """Lê inicio/fim (AAAA-MM-DD) da query string; padrão: os últimos dias_padrao dias até ontem"""
+    fim = request.args.get('fim')
+    fim = datetime.strptime(fim, '%Y-%m-%d').date() if fim else date.today() - timedelta(days=1)
+    inicio = request.args.get('inicio')
+    inicio = datetime.strptime(inicio, '%Y-%m-%d').date() if inicio else fim - timedelta(days=dias_padrao - 1)
+    if inicio > fim:
+        raise ValueError('inicio posterior a fim')
+    return inicio, fim
+
+
+def _somar_grupos(linhas, campos):
+    """Soma as linhas (almoxarifado, categoria) por almoxarifado e no total"""
+    por_almoxarifado, total = {}, dict.fromkeys(campos, 0)
+    for linha in linhas:
+        grupo = por_almoxarifado.setdefault(linha['almoxarifado_id'], dict.fromkeys(campos, 0))
+        for campo in campos:
+            grupo[campo] += linha[campo]
+            total[campo] += linha[campo]
+    return por_almoxarifado, total
+
+
+# ====================
+# PERDA POR VENCIMENTO
+# ====================
+def consulta_vencidos(inicio, fim, agrupar='mes', usuario=None, almoxarifado_id=None):
+    """
+    Quantidade e valor perdidos por vencimento: lotes com data_validade
+    entre inicio e fim (e já vencidos), pelo saldo que tinham no fim do
+    dia do vencimento (saldo atual menos as movimentações posteriores).
+    Agrupa por período da validade, almoxarifado e categoria.
+    """
+    hoje = date.today()
+    posteriores = func.coalesce(func.sum(QUANTIDADE_ASSINADA), 0)
+
+    query = db.session.query(
+        Item.almoxarifado_id,
+        Item.categoria_id,
+        Item.data_validade,
+        Item.custo_medio,
+        (func.coalesce(Item.estoque_atual, 0) - posteriores).label('quantidade')
+    ).outerjoin(Movimentacao, and_(
+        Movimentacao.item_id == Item.id,
+        func.date(Movimentacao.data_hora) > Item.data_validade
+    )).filter(
+        Item.data_validade >= inicio,
+        Item.data_validade <= min(fim, hoje - timedelta(days=1))
+    )
+    if usuario is not None:
+        query = filtrar_por_almoxarifado(query, usuario, almoxarifado_id)
+    lotes = query.group_by(Item.id).subquery()
+
+    ano = extract('year', lotes.c.data_validade)
+    mes = extract('month', lotes.c.data_validade)
+    if agrupar == 'trimestre':
+        periodo = ano * 10 + case((mes <= 3, 1), (mes <= 6, 2), (mes <= 9, 3), else_=4)
+    else:
+        periodo = ano * 100 + mes
+    perdida = case((lotes.c.quantidade > 0, lotes.c.quantidade), else_=0)
+
+    return db.session.query(
+        periodo.label('periodo'),
+        lotes.c.almoxarifado_id,
+        Categoria.nome.label('categoria'),
+        func.sum(case((lotes.c.quantidade > 0, 1), else_=0)).label('lotes'),
+        func.sum(perdida).label('quantidade'),
+        func.sum(perdida * func.coalesce(lotes.c.custo_medio, 0)).label('valor')
+    ).outerjoin(Categoria, Categoria.id == lotes.c.categoria_id).group_by(
+        periodo, lotes.c.almoxarifado_id, Categoria.nome
+    ).order_by(periodo, lotes.c.almoxarifado_id, Categoria.nome)
+
+
+def _rotulo_periodo(periodo, agrupar):
+    periodo = int(periodo)
+    if agrupar == 'trimestre':
+        return f'{periodo // 10}-T{periodo % 10}'
+    return f'{periodo // 100}-{periodo % 100:02d}'
+
+
+@indicadores.route('/api/indicadores/vencidos')
+@login_required
+def api_vencidos():
+    """API: quantidade e valor vencidos por período (mes ou trimestre), almoxarifado e categoria"""
+    agrupar = request.args.get('agrupar', 'mes')
+    if agrupar not in AGRUPAMENTOS:
+        return jsonify({'erro': 'agrupar deve ser mes ou trimestre.'}), 400
+    try:
+        inicio, fim = _periodo(DIAS_PADRAO_VENCIDOS)
+    except ValueError:
+        return jsonify({'erro': 'Período inválido. Use inicio e fim no formato AAAA-MM-DD.'}), 400
+
+    linhas = [{
+        'periodo': _rotulo_periodo(periodo, agrupar),
+        'almoxarifado_id': almoxarifado_id,
+        'categoria': categoria,
+        'lotes': int(lotes or 0),
+        'quantidade': float(quantidade or 0),
+        'valor': float(valor or 0)
+    } for periodo, almoxarifado_id, categoria, lotes, quantidade, valor in consulta_vencidos(
+        inicio, fim, agrupar, current_user, request.args.get('almoxarifado_id')
+    )]
+
+    campos = ('lotes', 'quantidade', 'valor')
+    por_periodo = {}
+    for linha in linhas:
+        grupo = por_periodo.setdefault(linha['periodo'], dict.fromkeys(campos, 0))
+        for campo in campos:
+            grupo[campo] += linha[campo]
+    por_almoxarifado, total = _somar_grupos(linhas, campos)
+
+    return jsonify({
+        'inicio': inicio.isoformat(),
+        'fim': fim.isoformat(),
+        'agrupar': agrupar,
+        'detalhe': linhas,
+        'periodos': [{'periodo': p, **valores} for p, valores in por_periodo.items()],
+        'almoxarifados': [{'almoxarifado_id': a, **valores} for a, valores in por_almoxarifado.items()],
+        'total': total
+    })
+
+
+# ====================
+# GIRO E COBERTURA
+# ====================
+def consulta_giro(inicio, fim, usuario=None, almoxarifado_id=None):
+    """
+    Por almoxarifado e categoria, ao custo médio atual: valor consumido
+    (saídas) entre inicio e fim, valor do estoque no início e no fim do
+    período (saldo atual menos as movimentações posteriores) e valor
+    atual. Só as movimentações desde o início do período são lidas.
+    """
+    abertura = datetime.combine(inicio, time.min)
+    encerramento = data_corte(fim)
+
+    query = db.session.query(
+        Item.almoxarifado_id,
+        Item.categoria_id,
+        func.coalesce(Item.custo_medio, 0).label('custo'),
+        func.coalesce(Item.estoque_atual, 0).label('atual'),
+        func.coalesce(func.sum(QUANTIDADE_ASSINADA), 0).label('desde_inicio'),
+        func.coalesce(func.sum(case(
+            (Movimentacao.data_hora >= encerramento, QUANTIDADE_ASSINADA), else_=0
+        )), 0).label('desde_fim'),
+        func.coalesce(func.sum(case(
+            (and_(Movimentacao.tipo == 'saida', Movimentacao.data_hora < encerramento), Movimentacao.quantidade),
+            else_=0
+        )), 0).label('saidas')
+    ).outerjoin(Movimentacao, and_(
+        Movimentacao.item_id == Item.id,
+        Movimentacao.data_hora >= abertura
+    ))
+    if usuario is not None:
+        query = filtrar_por_almoxarifado(query, usuario, almoxarifado_id)
+    lotes = query.group_by(Item.id).subquery()
+
+    return db.session.query(
+        lotes.c.almoxarifado_id,
+        Categoria.nome.label('categoria'),
+        func.sum(lotes.c.saidas * lotes.c.custo).label('consumo'),
+        func.sum((lotes.c.atual - lotes.c.desde_inicio) * lotes.c.custo).label('estoque_inicial'),
+        func.sum((lotes.c.atual - lotes.c.desde_fim) * lotes.c.custo).label('estoque_final'),
+        func.sum(lotes.c.atual * lotes.c.custo).label('estoque_atual')
+    ).outerjoin(Categoria, Categoria.id == lotes.c.categoria_id).group_by(
+        lotes.c.almoxarifado_id, Categoria.nome
+    ).order_by(lotes.c.almoxarifado_id, Categoria.nome)
+
+
+def _indices_giro(valores, dias):
+    """Giro no período, dias médios de estoque e dias de cobertura do estoque atual"""
+    medio = (valores['estoque_inicial'] + valores['estoque_final']) / 2
+    giro = valores['consumo'] / medio if medio > 0 else None
+    consumo_diario = valores['consumo'] / dias
+    return {
+        **valores,
+        'giro': round(giro, 4) if giro is not None else None,
+        'dias_estoque': round(dias / giro, 1) if giro else None,
+        'dias_cobertura': round(valores['estoque_atual'] / consumo_diario, 1) if consumo_diario > 0 else None
+    }
+
+
+@indicadores.route('/api/indicadores/giro')
+@login_required
+def api_giro():
+    """API: giro de estoque e dias de cobertura por almoxarifado e categoria"""
+    try:
+        inicio, fim = _periodo(DIAS_PADRAO_GIRO)
+    except ValueError:
+        return jsonify({'erro': 'Período inválido. Use inicio e fim no formato AAAA-MM-DD.'}), 400
+    dias = (fim - inicio).days + 1
+
+    linhas = [{
+        'almoxarifado_id': almoxarifado_id,
+        'categoria': categoria,
+        'consumo': float(consumo or 0),
+        'estoque_inicial': float(inicial or 0),
+        'estoque_final': float(final or 0),
+        'estoque_atual': float(atual or 0)
+    } for almoxarifado_id, categoria, consumo, inicial, final, atual in consulta_giro(
+        inicio, fim, current_user, request.args.get('almoxarifado_id')
+    )]
+    por_almoxarifado, total = _somar_grupos(
+        linhas, ('consumo', 'estoque_inicial', 'estoque_final', 'estoque_atual')
+    )
+
+    return jsonify({
+        'inicio': inicio.isoformat(),
+        'fim': fim.isoformat(),
+        'dias': dias,
+        'detalhe': [_indices_giro(linha, dias) for linha in linhas],
+        'almoxarifados': [{'almoxarifado_id': a, **_indices_giro(v, dias)} for a, v in por_almoxarifado.items()],
+        'total': _indices_giro(total, dias)
+    })
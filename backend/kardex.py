@@ -0,0 +1,117 @@
+"""
+Rotas do kardex (ficha de estoque por item ou código de barras)
+"""
+
+import csv
+from io import BytesIO, StringIO
+from datetime import datetime
+from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, Response, stream_with_context
+from flask_login import login_required, current_user
+
+from models import Item
+from estoque import filtrar_por_almoxarifado, pagina_kardex, kardex_completo
+from relatorios import gerar_relatorio_kardex
+
+kardex = Blueprint('kardex', __name__)
+
+
+def _itens_do_kardex():
+    """Lotes consultados: um item (item_id) ou todos os lotes de um código de barras"""
+    item_id = request.args.get('item_id', type=int)
+    codigo_barras = request.args.get('codigo_barras', '').strip()
+
+    if item_id:
+        item = Item.query.get_or_404(item_id)
+        if not current_user.pode_acessar_almoxarifado(item.almoxarifado_id):
+            return []
+        return [item]
+
+    if codigo_barras:
+        query = filtrar_por_almoxarifado(
+            Item.query.filter_by(codigo_barras=codigo_barras),
+            current_user,
+            request.args.get('almoxarifado_id')
+        )
+        return query.order_by(Item.data_validade, Item.lote).all()
+
+    return []
+
+
+def _nome_arquivo(itens, extensao):
+    codigo = itens[0].codigo_barras if itens else 'kardex'
+    return f'kardex_{codigo}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{extensao}'
+
+
+@kardex.route('/kardex')
+@login_required
+def ver():
+    """Kardex com saldo corrente, paginado por chave"""
+    itens = _itens_do_kardex()
+    linhas, proximo = [], None
+
+    if itens:
+        linhas, proximo = pagina_kardex([i.id for i in itens], request.args.get('apos', type=int))
+    elif request.args.get('item_id') or request.args.get('codigo_barras'):
+        flash('Nenhum item encontrado para o kardex.', 'warning')
+
+    return render_template('kardex/index.html',
+                         itens=itens,
+                         linhas=linhas,
+                         proximo=proximo)
+
+
+@kardex.route('/kardex/csv')
+@login_required
+def exportar_csv():
+    """Exporta o kardex completo em CSV (gerado em fluxo)"""
+    itens = _itens_do_kardex()
+    if not itens:
+        flash('Nenhum item encontrado para o kardex.', 'warning')
+        return redirect(url_for('kardex.ver'))
+
+    def gerar():
+        buffer = StringIO()
+        writer = csv.writer(buffer, delimiter=';')
+        writer.writerow(['Data/Hora', 'Código', 'Lote', 'Tipo', 'Quantidade', 'Saldo',
+                         'Setor', 'Usuário', 'Nota Fiscal', 'Observação'])
+        for linha in kardex_completo([i.id for i in itens]):
+            writer.writerow([
+                linha.data_hora.strftime('%d/%m/%Y %H:%M:%S') if linha.data_hora else '',
+                linha.codigo_barras,
+                linha.lote,
+                linha.tipo,
+                f'{linha.quantidade_assinada:.2f}',
+                f'{linha.saldo:.2f}',
+                linha.setor or '',
+                linha.usuario,
+                linha.nota_fiscal or '',
+                linha.observacao or ''
+            ])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+
+    return Response(
+        stream_with_context(gerar()),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={_nome_arquivo(itens, "csv")}'}
+    )
+
+
+@kardex.route('/kardex/pdf')
+@login_required
+def exportar_pdf():
+    """Gera o kardex completo em PDF"""
+    itens = _itens_do_kardex()
+    if not itens:
+        flash('Nenhum item encontrado para o kardex.', 'warning')
+        return redirect(url_for('kardex.ver'))
+
+    pdf = gerar_relatorio_kardex(current_user, itens, kardex_completo([i.id for i in itens]))
+
+    return send_file(
+        BytesIO(pdf),
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=_nome_arquivo(itens, 'pdf')
+    )
@@ -5,7 +5,10 @@ Estrutura completa do banco de dados com relacionamentos
 
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from datetime import datetime
+from datetime import datetime, date, timedelta
+from sqlalchemy import event, update, insert, select, inspect, case, func, literal, or_
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.hybrid import hybrid_property
 from werkzeug.security import generate_password_hash, check_password_hash
 
 db = SQLAlchemy()
@@ -26,6 +29,16 @@ class Almoxarifado(db.Model):
     ativo = db.Column(db.Boolean, default=True)
     data_criacao = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Soma de estoque_atual x custo_medio dos itens, mantida a cada gravação
+    # de item (ver _versionar_itens); `flask saldos valorizar` recalcula
+    valor_estoque = db.Column(db.Float, nullable=False, default=0)
+    
+    # Última execução da classificação ABC/XYZ dos itens
+    data_classificacao = db.Column(db.DateTime)
+    
+    # Dia da última varredura de validade (ver alertas.varrer_status)
+    data_varredura = db.Column(db.Date)
+    
     # Relacionamentos
     usuarios = db.relationship('Usuario', backref='almoxarifado', lazy=True)
     itens = db.relationship('Item', backref='almoxarifado', lazy=True)
@@ -55,7 +68,7 @@ class Usuario(UserMixin, db.Model):
     nivel_acesso = db.Column(db.String(20), nullable=False)
     
     # Almoxarifado ao qual o usuário pertence (NULL para admin_geral)
-    almoxarifado_id = db.Column(db.Integer, db.ForeignKey('almoxarifados.id'))
+    almoxarifado_id = db.Column(db.Integer, db.ForeignKey('almoxarifados.id'), index=True)
     
     ativo = db.Column(db.Boolean, default=True)
     data_criacao = db.Column(db.DateTime, default=datetime.utcnow)
@@ -183,6 +196,7 @@ class Fornecedor(db.Model):
     contato = db.Column(db.String(100))
     telefone = db.Column(db.String(20))
     email = db.Column(db.String(100))
+    prazo_entrega_dias = db.Column(db.Integer)  # Prazo médio entre o pedido e a entrega (reposição)
     ativo = db.Column(db.Boolean, default=True)
     
     # Relacionamento removido pois não usamos mais fornecedor nos itens
@@ -191,6 +205,71 @@ class Fornecedor(db.Model):
         return f'<Fornecedor {self.nome}>'
 
 
+# ====================
+# TABELA DE ENDEREÇOS (LOCALIZAÇÃO FÍSICA)
+# ====================
+class Endereco(db.Model):
+    """Posição física no almoxarifado: zona / corredor / prateleira / posição"""
+    __tablename__ = 'enderecos'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    zona = db.Column(db.String(10), nullable=False)
+    corredor = db.Column(db.String(10), nullable=False)
+    prateleira = db.Column(db.String(10), nullable=False)
+    posicao = db.Column(db.String(10), nullable=False)
+    
+    # Ordem de caminhada opcional (sobrepõe a ordem zona/corredor/prateleira/posição)
+    ordem = db.Column(db.Integer)
+    ativo = db.Column(db.Boolean, default=True)
+    
+    almoxarifado_id = db.Column(db.Integer, db.ForeignKey('almoxarifados.id'), nullable=False)
+    
+    # Relacionamentos
+    itens = db.relationship('Item', backref='endereco', lazy='dynamic')
+    almoxarifado = db.relationship('Almoxarifado')
+    
+    # Busca pelo endereço e listagem em ordem de caminhada
+    __table_args__ = (
+        db.UniqueConstraint('almoxarifado_id', 'zona', 'corredor', 'prateleira', 'posicao', name='uix_endereco_almox'),
+        db.Index('ix_enderecos_almox_ordem', 'almoxarifado_id', 'ordem'),
+    )
+    
+    SEPARADOR = '-'
+    
+    def __repr__(self):
+        return f'<Endereco {self.codigo}>'
+    
+    @property
+    def codigo(self):
+        """Endereço no formato impresso nas etiquetas (ex.: A-01-03-B)"""
+        return self.SEPARADOR.join([self.zona, self.corredor, self.prateleira, self.posicao])
+    
+    @classmethod
+    def partes(cls, codigo):
+        """Separa um código A-01-03-B em (zona, corredor, prateleira, posicao)"""
+        partes = [p.strip().upper() for p in (codigo or '').split(cls.SEPARADOR)]
+        if len(partes) != 4 or not all(partes):
+            raise ValueError(f'Endereço inválido: {codigo} (use zona-corredor-prateleira-posição).')
+        return tuple(partes)
+    
+    @classmethod
+    def ordem_caminhada(cls):
+        """Colunas para ORDER BY no sentido do percurso pelo almoxarifado"""
+        return (cls.ordem.asc().nulls_last(), cls.zona, cls.corredor, cls.prateleira, cls.posicao)
+    
+    @property
+    def chave_caminhada(self):
+        """Mesma ordem de ordem_caminhada(), para ordenar listas já carregadas"""
+        return (self.ordem is None, self.ordem or 0, self.zona, self.corredor, self.prateleira, self.posicao)
+
+
+def chave_caminhada_item(item):
+    """Ordena lotes pelo endereço; lotes sem endereço vão para o fim"""
+    if item.endereco is None:
+        return (True, (), item.codigo_barras, item.lote)
+    return (False, item.endereco.chave_caminhada, item.codigo_barras, item.lote)
+
+
 # ====================
 # TABELA DE ITENS
 # ====================
@@ -206,25 +285,51 @@ class Item(db.Model):
     unidade_medida = db.Column(db.String(20), nullable=False)  # UN, CX, PCT, L, KG, etc
     estoque_minimo = db.Column(db.Float, default=0)
     estoque_atual = db.Column(db.Float, default=0)
+    estoque_reservado = db.Column(db.Float, nullable=False, default=0)  # Soma das reservas ativas
+    custo_medio = db.Column(db.Float, nullable=False, default=0)  # Custo unitário médio ponderado das entradas
     lote = db.Column(db.String(50), nullable=False)  # Obrigatório
     data_validade = db.Column(db.Date)
     
-    # Histórico de compras (JSON string com datas e preços)
-    historico_compras = db.Column(db.Text)  # NOVO: Armazena JSON com histórico
+    # Histórico de compras legado (JSON); as compras ficam na tabela compras
+    # e o conteúdo é migrado com `flask compras migrar-historico`
+    historico_compras = db.Column(db.Text)
     
     # Chaves estrangeiras
     categoria_id = db.Column(db.Integer, db.ForeignKey('categorias.id'))
     almoxarifado_id = db.Column(db.Integer, db.ForeignKey('almoxarifados.id'), nullable=False)
+    endereco_id = db.Column(db.Integer, db.ForeignKey('enderecos.id'), index=True)  # Onde o lote está guardado
     
     ativo = db.Column(db.Boolean, default=True)
     data_cadastro = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Classificação de consumo do código no almoxarifado (igual em todos os lotes):
+    # ABC pelo valor consumido, XYZ pela variação da demanda mensal
+    classe_abc = db.Column(db.String(1))
+    classe_xyz = db.Column(db.String(1))
+    consumo_valor = db.Column(db.Float)  # Valor consumido no período da classificação
+    
+    # Situação gravada do lote, para listagens e filtros sem recalcular por linha:
+    # atualizada a cada gravação do item e, para a validade, pela varredura diária
+    status_validade = db.Column(db.String(20), nullable=False, default='sem_validade')  # sem_validade, vencido, vence_em_breve, ok
+    status_estoque = db.Column(db.String(20), nullable=False, default='zerado')  # zerado, critico, baixo, ok
+    
+    # Versão de alteração: cresce a cada gravação do item (inclusive de estoque)
+    # e permite a caches e dispositivos buscarem só o que mudou
+    versao = db.Column(db.BigInteger, default=0, index=True)
+    
     # Relacionamentos
     movimentacoes = db.relationship('Movimentacao', backref='item', lazy=True)
     
     # Índice composto para garantir unicidade de codigo_barras+lote+almoxarifado
+    # e índice para localizar os lotes de um código em ordem de validade (FEFO)
     __table_args__ = (
         db.UniqueConstraint('codigo_barras', 'lote', 'almoxarifado_id', name='uix_codigo_lote_almox'),
+        db.Index('ix_itens_almox_codigo_validade', 'almoxarifado_id', 'codigo_barras', 'data_validade'),
+        db.Index('ix_itens_almox_versao', 'almoxarifado_id', 'versao'),
+        db.Index('ix_itens_almox_classe', 'almoxarifado_id', 'classe_abc', 'classe_xyz'),
+        db.Index('ix_itens_almox_validade', 'almoxarifado_id', 'data_validade'),
+        db.Index('ix_itens_almox_status_validade', 'almoxarifado_id', 'status_validade'),
+        db.Index('ix_itens_almox_status_estoque', 'almoxarifado_id', 'status_estoque'),
     )
     
     def __repr__(self):
@@ -235,32 +340,249 @@ class Item(db.Model):
         """Retorna código com lote para identificação única"""
         return f"{self.codigo_barras}-{self.lote}"
     
-    @property
-    def status_estoque(self):
-        """Retorna status do estoque: crítico, baixo, ok"""
-        if self.estoque_atual <= 0:
-            return 'zerado'
-        elif self.estoque_atual < self.estoque_minimo * 0.5:
-            return 'critico'
-        elif self.estoque_atual < self.estoque_minimo:
-            return 'baixo'
-        else:
-            return 'ok'
+    @hybrid_property
+    def estoque_disponivel(self):
+        """Estoque livre para saídas: atual menos o reservado (também usável em filtros)"""
+        return (self.estoque_atual or 0) - (self.estoque_reservado or 0)
     
-    @property
-    def status_validade(self):
-        """Retorna status da validade"""
-        if not self.data_validade:
-            return 'sem_validade'
-        
-        dias_restantes = (self.data_validade - datetime.now().date()).days
-        
-        if dias_restantes < 0:
-            return 'vencido'
-        elif dias_restantes <= 30:
-            return 'vence_em_breve'
+    @estoque_disponivel.expression
+    def estoque_disponivel(cls):
+        return db.func.coalesce(cls.estoque_atual, 0) - db.func.coalesce(cls.estoque_reservado, 0)
+    
+    @hybrid_property
+    def valor_estoque(self):
+        """Valor do estoque do lote ao custo médio"""
+        return (self.estoque_atual or 0) * (self.custo_medio or 0)
+    
+    @valor_estoque.expression
+    def valor_estoque(cls):
+        return db.func.coalesce(cls.estoque_atual, 0) * db.func.coalesce(cls.custo_medio, 0)
+    
+    def atualizar_status(self, hoje=None):
+        """Recalcula status_validade e status_estoque a partir dos valores do lote"""
+        self.status_validade = calcular_status_validade(self.data_validade, hoje)
+        self.status_estoque = calcular_status_estoque(self.estoque_atual, self.estoque_minimo)
+
+
+# ====================
+# SITUAÇÃO DE VALIDADE E DE ESTOQUE
+# ====================
+# Lotes que vencem em até tantos dias ficam como 'vence_em_breve'
+DIAS_VENCE_EM_BREVE = 30
+
+
+def calcular_status_validade(data_validade, hoje=None):
+    """Retorna status da validade"""
+    if not data_validade:
+        return 'sem_validade'
+    
+    dias_restantes = (data_validade - (hoje or date.today())).days
+    
+    if dias_restantes < 0:
+        return 'vencido'
+    elif dias_restantes <= DIAS_VENCE_EM_BREVE:
+        return 'vence_em_breve'
+    else:
+        return 'ok'
+
+
+def calcular_status_estoque(estoque_atual, estoque_minimo):
+    """Retorna status do estoque: zerado, crítico, baixo, ok"""
+    estoque_atual, estoque_minimo = estoque_atual or 0, estoque_minimo or 0
+    if estoque_atual <= 0:
+        return 'zerado'
+    elif estoque_atual < estoque_minimo * 0.5:
+        return 'critico'
+    elif estoque_atual < estoque_minimo:
+        return 'baixo'
+    else:
+        return 'ok'
+
+
+def expressao_status_validade(hoje=None):
+    """calcular_status_validade em SQL, para atualizações em lote"""
+    hoje = hoje or date.today()
+    coluna = Item.__table__.c.data_validade
+    return case(
+        (coluna == None, 'sem_validade'),
+        (coluna < hoje, 'vencido'),
+        (coluna <= hoje + timedelta(days=DIAS_VENCE_EM_BREVE), 'vence_em_breve'),
+        else_='ok'
+    )
+
+
+def varredura_atrasada(hoje=None):
+    """Algum almoxarifado ativo ainda não passou pela varredura de validade do dia"""
+    hoje = hoje or date.today()
+    return db.session.query(Almoxarifado.query.filter(
+        Almoxarifado.ativo == True,
+        or_(Almoxarifado.data_varredura == None, Almoxarifado.data_varredura < hoje)
+    ).exists()).scalar()
+
+
+def coluna_status_validade(hoje=None):
+    """
+    Situação de validade para filtros e agrupamentos: a coluna gravada
+    (indexada) quando a varredura do dia já rodou e, se ela estiver
+    atrasada, a comparação da validade com hoje (lotes vencidos desde a
+    última varredura não ficam de fora).
+    """
+    if varredura_atrasada(hoje):
+        return expressao_status_validade(hoje)
+    return Item.status_validade
+
+
+def expressao_status_estoque():
+    """calcular_status_estoque em SQL, para atualizações em lote"""
+    tabela = Item.__table__
+    atual = func.coalesce(tabela.c.estoque_atual, 0)
+    minimo = func.coalesce(tabela.c.estoque_minimo, 0)
+    return case(
+        (atual <= 0, 'zerado'),
+        (atual < minimo * 0.5, 'critico'),
+        (atual < minimo, 'baixo'),
+        else_='ok'
+    )
+
+
+def cruzou_estoque_minimo(anterior, novo, estoque_minimo):
+    """O lote tinha estoque ok e ficou abaixo do mínimo cadastrado (gera notificação)"""
+    return anterior == 'ok' and novo != 'ok' and (estoque_minimo or 0) > 0
+
+
+def sincronizar_status(session, *condicoes, hoje=None):
+    """
+    Regrava status_validade e status_estoque dos itens que atendem às
+    condições e estão desatualizados, enfileirando as notificações de
+    estoque abaixo do mínimo. Usar depois de INSERTs e UPDATEs em lote,
+    que não passam pelo flush. Não altera a versão: a situação é derivada
+    de campos já versionados. Retorna o número de itens regravados.
+    """
+    tabela = Item.__table__
+    validade, estoque = expressao_status_validade(hoje), expressao_status_estoque()
+    session.execute(insert(Notificacao).from_select(
+        ['almoxarifado_id', 'tipo', 'item_id', 'quantidade', 'data_hora'],
+        select(
+            tabela.c.almoxarifado_id, literal('estoque_baixo'), tabela.c.id,
+            func.coalesce(tabela.c.estoque_atual, 0), literal(datetime.utcnow())
+        ).where(
+            *condicoes,
+            tabela.c.status_estoque == 'ok',
+            estoque != 'ok',
+            tabela.c.estoque_minimo > 0
+        )
+    ))
+    return session.execute(
+        update(tabela).where(
+            *condicoes,
+            (tabela.c.status_validade != validade) | (tabela.c.status_estoque != estoque)
+        ).values(status_validade=validade, status_estoque=estoque)
+    ).rowcount
+
+
+# ====================
+# CONTROLE DE VERSÕES
+# ====================
+class ControleVersao(db.Model):
+    """Contadores monotônicos de versão (um por tipo de registro)"""
+    __tablename__ = 'controle_versoes'
+    
+    nome = db.Column(db.String(50), primary_key=True)
+    valor = db.Column(db.BigInteger, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<ControleVersao {self.nome}={self.valor}>'
+
+
+def proxima_versao(session, nome='itens'):
+    """
+    Incrementa e retorna o contador de versão. O UPDATE bloqueia a linha
+    do contador até o fim da transação, então as versões seguem a ordem
+    dos commits.
+    """
+    tabela = ControleVersao.__table__
+    resultado = session.execute(
+        update(tabela).where(tabela.c.nome == nome).values(valor=tabela.c.valor + 1)
+    )
+    if resultado.rowcount == 0:
+        session.execute(insert(tabela).values(nome=nome, valor=1))
+    return session.execute(select(tabela.c.valor).where(tabela.c.nome == nome)).scalar()
+
+
+def somar_valor_estoque(session, deltas):
+    """
+    Soma a variação de valor {almoxarifado_id: delta} aos totais dos
+    almoxarifados. UPDATE relativo: gravações concorrentes não se perdem.
+    """
+    tabela = Almoxarifado.__table__
+    for almoxarifado_id, delta in deltas.items():
+        if almoxarifado_id is not None and abs(delta) > 1e-9:
+            session.execute(
+                update(tabela).where(tabela.c.id == almoxarifado_id)
+                .values(valor_estoque=tabela.c.valor_estoque + delta)
+            )
+
+
+_CAMPOS_VALOR = ('almoxarifado_id', 'estoque_atual', 'custo_medio')
+
+
+def _valor_anterior(session, item):
+    """(almoxarifado_id, valor) do item como está no banco, antes deste flush"""
+    estado = inspect(item)
+    anteriores = []
+    for campo in _CAMPOS_VALOR:
+        historico = estado.attrs[campo].history
+        if historico.deleted:
+            anteriores.append(historico.deleted[0])
+        elif historico.added:
+            # Alterado sem o valor antigo carregado: lê do banco
+            with session.no_autoflush:
+                anteriores = session.execute(
+                    select(*[Item.__table__.c[c] for c in _CAMPOS_VALOR])
+                    .where(Item.__table__.c.id == item.id)
+                ).one()
+            break
         else:
-            return 'ok'
+            anteriores.append(getattr(item, campo))
+    almoxarifado_id, estoque, custo = anteriores
+    return almoxarifado_id, (estoque or 0) * (custo or 0)
+
+
+@event.listens_for(Session, 'before_flush')
+def _versionar_itens(session, flush_context, instances):
+    """
+    Atribui uma nova versão aos itens criados ou alterados neste flush
+    e repassa a variação de valor deles aos totais dos almoxarifados
+    """
+    alterados = [
+        obj for obj in list(session.new) + list(session.dirty)
+        if isinstance(obj, Item) and (obj in session.new or session.is_modified(obj))
+    ]
+    if alterados:
+        versao = proxima_versao(session)
+        for item in alterados:
+            item.versao = versao
+            anterior = item.status_estoque
+            item.atualizar_status()
+            if item not in session.new and cruzou_estoque_minimo(anterior, item.status_estoque, item.estoque_minimo):
+                session.add(Notificacao(
+                    almoxarifado_id=item.almoxarifado_id,
+                    tipo='estoque_baixo',
+                    item_id=item.id,
+                    quantidade=item.estoque_atual or 0
+                ))
+    
+    deltas = {}
+    for item in alterados:
+        if item not in session.new:
+            almoxarifado_id, valor = _valor_anterior(session, item)
+            deltas[almoxarifado_id] = deltas.get(almoxarifado_id, 0) - valor
+        deltas[item.almoxarifado_id] = deltas.get(item.almoxarifado_id, 0) + item.valor_estoque
+    for item in session.deleted:
+        if isinstance(item, Item):
+            almoxarifado_id, valor = _valor_anterior(session, item)
+            deltas[almoxarifado_id] = deltas.get(almoxarifado_id, 0) - valor
+    somar_valor_estoque(session, deltas)
 
 
 # ====================
@@ -271,21 +593,293 @@ class Movimentacao(db.Model):
     __tablename__ = 'movimentacoes'
     
     id = db.Column(db.Integer, primary_key=True)
-    tipo = db.Column(db.String(20), nullable=False)  # entrada, saida, ajuste
+    tipo = db.Column(db.String(20), nullable=False)  # entrada, saida, ajuste, transferencia
     quantidade = db.Column(db.Float, nullable=False)
     data_hora = db.Column(db.DateTime, default=datetime.utcnow)
     observacao = db.Column(db.Text)
     nota_fiscal = db.Column(db.String(50))
     
+    # Saldo do item logo após esta movimentação (ledger com saldo corrente)
+    saldo_apos = db.Column(db.Float)
+    
+    # UUID gerado pelo coletor offline: impede lançar a mesma movimentação duas vezes
+    chave_idempotencia = db.Column(db.String(36), unique=True)
+    
     # Chaves estrangeiras
     item_id = db.Column(db.Integer, db.ForeignKey('itens.id'), nullable=False)
-    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False)
-    setor_id = db.Column(db.Integer, db.ForeignKey('setores.id'))  # Apenas para saídas
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False, index=True)
+    setor_id = db.Column(db.Integer, db.ForeignKey('setores.id'), index=True)  # Apenas para saídas
+    
+    # Transferências: a saída da origem e a entrada do destino apontam uma para a outra
+    movimentacao_par_id = db.Column(db.Integer, db.ForeignKey('movimentacoes.id'))
+    par = db.relationship('Movimentacao', remote_side=[id], foreign_keys=[movimentacao_par_id], post_update=True)
+    
+    # Índice para históricos por item em ordem cronológica (cobre também buscas por item_id)
+    # e índice para somar um tipo de movimentação num período (consumo, indicadores)
+    __table_args__ = (
+        db.Index('ix_movimentacoes_item_data', 'item_id', 'data_hora'),
+        db.Index('ix_movimentacoes_tipo_data', 'tipo', 'data_hora'),
+    )
     
     def __repr__(self):
         return f'<Movimentacao {self.tipo} - {self.quantidade}>'
 
 
+# ====================
+# TABELA DE COMPRAS (HISTÓRICO DE PREÇOS)
+# ====================
+class Compra(db.Model):
+    """Compra de um lote: quantidade e preço unitário pagos, por fornecedor e nota fiscal"""
+    __tablename__ = 'compras'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    data = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    quantidade = db.Column(db.Float, nullable=False)
+    preco_unitario = db.Column(db.Float, nullable=False)
+    nota_fiscal = db.Column(db.String(50))
+    
+    # Chaves estrangeiras
+    item_id = db.Column(db.Integer, db.ForeignKey('itens.id'), nullable=False)
+    fornecedor_id = db.Column(db.Integer, db.ForeignKey('fornecedores.id'), index=True)
+    movimentacao_id = db.Column(db.Integer, db.ForeignKey('movimentacoes.id'))  # Entrada que registrou a compra
+    
+    # Relacionamentos
+    item = db.relationship('Item', backref=db.backref('compras', lazy='dynamic'))
+    fornecedor = db.relationship('Fornecedor', backref=db.backref('compras', lazy='dynamic'))
+    movimentacao = db.relationship('Movimentacao')
+    
+    # Último preço e preço médio de um item: varredura do índice em ordem de data
+    __table_args__ = (
+        db.Index('ix_compras_item_data', 'item_id', 'data'),
+    )
+    
+    @property
+    def valor_total(self):
+        return self.quantidade * self.preco_unitario
+    
+    def __repr__(self):
+        return f'<Compra item {self.item_id} - {self.quantidade} x {self.preco_unitario}>'
+
+
+# ====================
+# TABELA DE RESERVAS
+# ====================
+class Reserva(db.Model):
+    """Quantidade de um lote separada para um setor até ser retirada ou liberada"""
+    __tablename__ = 'reservas'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    quantidade = db.Column(db.Float, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='ativa')  # ativa, consumida, liberada
+    observacao = db.Column(db.Text)
+    data_criacao = db.Column(db.DateTime, default=datetime.utcnow)
+    data_encerramento = db.Column(db.DateTime)
+    
+    # Chaves estrangeiras
+    item_id = db.Column(db.Integer, db.ForeignKey('itens.id'), nullable=False)
+    setor_id = db.Column(db.Integer, db.ForeignKey('setores.id'), nullable=False)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False)
+    movimentacao_id = db.Column(db.Integer, db.ForeignKey('movimentacoes.id'))  # Saída gerada ao consumir
+    
+    # Relacionamentos
+    item = db.relationship('Item', backref=db.backref('reservas', lazy='dynamic'))
+    setor = db.relationship('Setor')
+    usuario = db.relationship('Usuario')
+    
+    # Reservas ativas de um item
+    __table_args__ = (
+        db.Index('ix_reservas_item_status', 'item_id', 'status'),
+    )
+    
+    def __repr__(self):
+        return f'<Reserva {self.id} item={self.item_id} {self.quantidade} ({self.status})>'
+
+
+# ====================
+# TABELAS DE REQUISIÇÕES E ONDAS DE SEPARAÇÃO
+# ====================
+class OndaSeparacao(db.Model):
+    """Grupo de requisições separadas e baixadas de uma só vez"""
+    __tablename__ = 'ondas_separacao'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), nullable=False, default='aberta')  # aberta, concluida
+    data_criacao = db.Column(db.DateTime, default=datetime.utcnow)
+    data_conclusao = db.Column(db.DateTime)
+    
+    # Chaves estrangeiras
+    almoxarifado_id = db.Column(db.Integer, db.ForeignKey('almoxarifados.id'), nullable=False)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False)
+    
+    # Relacionamentos
+    requisicoes = db.relationship('Requisicao', backref='onda', lazy=True)
+    almoxarifado = db.relationship('Almoxarifado')
+    usuario = db.relationship('Usuario')
+    
+    def __repr__(self):
+        return f'<OndaSeparacao {self.id} ({self.status})>'
+
+
+class Requisicao(db.Model):
+    """Pedido de material de um setor a um almoxarifado"""
+    __tablename__ = 'requisicoes'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), nullable=False, default='aberta')  # aberta, em_separacao, atendida, cancelada
+    observacao = db.Column(db.Text)
+    data_criacao = db.Column(db.DateTime, default=datetime.utcnow)
+    data_atendimento = db.Column(db.DateTime)
+    
+    # Chaves estrangeiras
+    setor_id = db.Column(db.Integer, db.ForeignKey('setores.id'), nullable=False)
+    almoxarifado_id = db.Column(db.Integer, db.ForeignKey('almoxarifados.id'), nullable=False)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False)
+    onda_id = db.Column(db.Integer, db.ForeignKey('ondas_separacao.id'), index=True)
+    
+    # Relacionamentos
+    itens = db.relationship('ItemRequisicao', backref='requisicao', lazy=True, cascade='all, delete-orphan')
+    setor = db.relationship('Setor')
+    almoxarifado = db.relationship('Almoxarifado')
+    usuario = db.relationship('Usuario')
+    
+    # Fila de requisições de um almoxarifado por situação
+    __table_args__ = (
+        db.Index('ix_requisicoes_almox_status', 'almoxarifado_id', 'status'),
+    )
+    
+    def __repr__(self):
+        return f'<Requisicao {self.id} setor={self.setor_id} ({self.status})>'
+
+
+class ItemRequisicao(db.Model):
+    """Linha de uma requisição: um código de barras (qualquer lote) e a quantidade"""
+    __tablename__ = 'itens_requisicao'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    requisicao_id = db.Column(db.Integer, db.ForeignKey('requisicoes.id'), nullable=False, index=True)
+    codigo_barras = db.Column(db.String(50), nullable=False)
+    quantidade = db.Column(db.Float, nullable=False)
+    
+    def __repr__(self):
+        return f'<ItemRequisicao {self.codigo_barras} x {self.quantidade}>'
+
+
+# ====================
+# TABELA DE SALDOS (FECHAMENTOS PERIÓDICOS)
+# ====================
+class SaldoEstoque(db.Model):
+    """Fotografia do saldo de cada item em uma data de corte"""
+    __tablename__ = 'saldos_estoque'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    item_id = db.Column(db.Integer, db.ForeignKey('itens.id'), nullable=False)
+    
+    # Saldo considera as movimentações com data_hora < data_corte
+    data_corte = db.Column(db.DateTime, nullable=False)
+    saldo = db.Column(db.Float, nullable=False, default=0)
+    data_geracao = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('item_id', 'data_corte', name='uix_saldo_item_corte'),
+    )
+    
+    def __repr__(self):
+        return f'<SaldoEstoque item={self.item_id} {self.data_corte} = {self.saldo}>'
+
+
+# ====================
+# TABELA DE ALERTAS DE VALIDADE
+# ====================
+class AlertaValidade(db.Model):
+    """Lote que venceu ou entrou na janela de vencimento no dia da varredura"""
+    __tablename__ = 'alertas_validade'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    data = db.Column(db.Date, nullable=False)  # Dia da varredura
+    tipo = db.Column(db.String(20), nullable=False)  # vencido, vence_em_breve
+    item_id = db.Column(db.Integer, db.ForeignKey('itens.id'), nullable=False)
+    almoxarifado_id = db.Column(db.Integer, db.ForeignKey('almoxarifados.id'), nullable=False)
+    quantidade = db.Column(db.Float, nullable=False, default=0)  # Estoque do lote na varredura
+    
+    item = db.relationship('Item')
+    
+    __table_args__ = (
+        db.UniqueConstraint('data', 'item_id', 'tipo', name='uix_alerta_data_item_tipo'),
+        db.Index('ix_alertas_validade_almox_data', 'almoxarifado_id', 'data'),
+    )
+    
+    def __repr__(self):
+        return f'<AlertaValidade {self.data} item={self.item_id} ({self.tipo})>'
+
+
+# ====================
+# FILA DE NOTIFICAÇÕES
+# ====================
+class Notificacao(db.Model):
+    """Evento a notificar no próximo resumo do almoxarifado (ver notificacoes.py)"""
+    __tablename__ = 'notificacoes'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    almoxarifado_id = db.Column(db.Integer, db.ForeignKey('almoxarifados.id'), nullable=False)
+    tipo = db.Column(db.String(20), nullable=False)  # estoque_baixo, vencido, vence_em_breve
+    item_id = db.Column(db.Integer, db.ForeignKey('itens.id'), nullable=False)
+    quantidade = db.Column(db.Float, nullable=False, default=0)  # Estoque do lote no evento
+    data_hora = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    enviada_em = db.Column(db.DateTime)  # NULL enquanto pendente
+    
+    item = db.relationship('Item')
+    
+    # Pendentes de um almoxarifado: enviada_em IS NULL
+    __table_args__ = (
+        db.Index('ix_notificacoes_almox_enviada', 'almoxarifado_id', 'enviada_em'),
+    )
+    
+    def __repr__(self):
+        return f'<Notificacao {self.tipo} item={self.item_id}>'
+
+
+# ====================
+# TABELA DE PREVISÕES DE CONSUMO
+# ====================
+class PrevisaoConsumo(db.Model):
+    """Previsão de consumo de um código por setor, gravada pelo ajuste em lote"""
+    __tablename__ = 'previsoes_consumo'
+
+    id = db.Column(db.Integer, primary_key=True)
+    almoxarifado_id = db.Column(db.Integer, db.ForeignKey('almoxarifados.id'), nullable=False)
+    setor_id = db.Column(db.Integer, db.ForeignKey('setores.id'), nullable=False)
+    codigo_barras = db.Column(db.String(50), nullable=False)
+
+    # Modelo escolhido: 'suavizacao' (exponencial simples) ou 'sazonal' (ingênuo sazonal)
+    metodo = db.Column(db.String(20), nullable=False)
+    alfa = db.Column(db.Float)  # Apenas para suavização
+    erro_medio = db.Column(db.Float)  # Erro absoluto médio na validação
+
+    # Quantidade prevista acumulada para os próximos 30, 60 e 90 dias
+    previsao_30 = db.Column(db.Float, nullable=False, default=0)
+    previsao_60 = db.Column(db.Float, nullable=False, default=0)
+    previsao_90 = db.Column(db.Float, nullable=False, default=0)
+    custo_unitario = db.Column(db.Float, default=0)  # Custo médio na data do ajuste
+
+    # JSON com o consumo dos períodos de 30 dias usados no ajuste (do mais antigo ao mais recente)
+    historico = db.Column(db.Text)
+    data_ajuste = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    # Relacionamentos
+    setor = db.relationship('Setor')
+
+    __table_args__ = (
+        db.UniqueConstraint('almoxarifado_id', 'setor_id', 'codigo_barras', name='uix_previsao_almox_setor_codigo'),
+    )
+
+    @property
+    def valor_90(self):
+        return self.previsao_90 * (self.custo_unitario or 0)
+
+    def __repr__(self):
+        return f'<PrevisaoConsumo {self.codigo_barras} setor={self.setor_id} ({self.metodo})>'
+
+
 # ====================
 # TABELA DE CONFIGURAÇÕES DO SISTEMA
 # ====================
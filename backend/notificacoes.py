@@ -0,0 +1,149 @@
+"""
+Notificações por e-mail
+Os eventos (estoque abaixo do mínimo, lote vencido ou entrando na janela
+de vencimento) entram na fila notificacoes na mesma transação de quem os
+gerou; um processo separado envia um resumo por almoxarifado via SMTP:
+
+    flask --app app notificacoes enviar --continuo
+
+As requisições web só gravam na fila e nunca esperam pelo SMTP. Para
+desenvolvimento, o padrão (localhost:1025) aponta para um servidor SMTP
+local de testes, por exemplo: python -m aiosmtpd -n -l localhost:1025
+"""
+
+import smtplib
+import time
+from datetime import datetime
+from email.message import EmailMessage
+
+import click
+from flask import Blueprint, current_app, render_template
+from sqlalchemy import or_, update
+from sqlalchemy.orm import joinedload
+
+from models import db, Almoxarifado, Usuario, Notificacao
+
+notificacoes = Blueprint('notificacoes', __name__)
+
+TIPOS_NOTIFICACAO = ('estoque_baixo', 'vencido', 'vence_em_breve')
+
+# Segundos entre duas rodadas de envio no modo contínuo
+INTERVALO_ENVIO = 300
+
+
+def destinatarios(almoxarifado_id):
+    """E-mails dos usuários ativos do almoxarifado e dos administradores que veem todos"""
+    return [email for email, in db.session.query(Usuario.email).filter(
+        Usuario.ativo == True,
+        Usuario.email != None,
+        Usuario.email != '',
+        or_(Usuario.almoxarifado_id == almoxarifado_id, Usuario.nivel_acesso.in_(['admin_geral', 'admin']))
+    ).order_by(Usuario.email).distinct()]
+
+
+def montar_resumo(pendentes):
+    """
+    Agrupa as notificações pendentes de um almoxarifado por tipo, com um
+    lote por linha (o evento mais recente). Estoque baixo já resolvido
+    (lote de volta a 'ok') fica de fora. Retorna {tipo: [(item, notificacao)]}.
+    """
+    ultimos = {}
+    for notificacao in pendentes:
+        ultimos[(notificacao.tipo, notificacao.item_id)] = notificacao
+
+    resumo = {tipo: [] for tipo in TIPOS_NOTIFICACAO}
+    for (tipo, _), notificacao in sorted(ultimos.items(), key=lambda par: par[1].item.nome):
+        if tipo == 'estoque_baixo' and notificacao.item.status_estoque == 'ok':
+            continue
+        resumo[tipo].append((notificacao.item, notificacao))
+    return resumo
+
+
+def _mensagem(almoxarifado, resumo, para, agora):
+    config = current_app.config
+    mensagem = EmailMessage()
+    mensagem['Subject'] = f'[{almoxarifado.nome}] Resumo de alertas do almoxarifado - {agora.strftime("%d/%m/%Y %H:%M")}'
+    mensagem['From'] = config['SMTP_REMETENTE']
+    mensagem['To'] = ', '.join(para)
+    mensagem.set_content(render_template('notificacoes/resumo.txt', almoxarifado=almoxarifado, resumo=resumo, agora=agora))
+    return mensagem
+
+
+def _conectar():
+    config = current_app.config
+    smtp = smtplib.SMTP(config['SMTP_HOST'], config['SMTP_PORT'], timeout=config['SMTP_TIMEOUT'])
+    if config['SMTP_TLS']:
+        smtp.starttls()
+    if config['SMTP_USUARIO']:
+        smtp.login(config['SMTP_USUARIO'], config['SMTP_SENHA'])
+    return smtp
+
+
+def enviar_resumos(agora=None):
+    """
+    Envia um resumo por almoxarifado com as notificações pendentes, numa
+    única conexão SMTP, e marca as enviadas (commit por almoxarifado).
+    Se o SMTP falhar, as notificações daquele almoxarifado continuam
+    pendentes para a próxima rodada. Retorna (resumos enviados, notificações baixadas).
+    """
+    agora = agora or datetime.utcnow()
+    almoxarifados = [id for id, in db.session.query(Notificacao.almoxarifado_id).filter(
+        Notificacao.enviada_em == None
+    ).distinct()]
+    if not almoxarifados:
+        return 0, 0
+
+    enviados = baixadas = 0
+    smtp = None
+    try:
+        for almoxarifado_id in almoxarifados:
+            pendentes = Notificacao.query.options(joinedload(Notificacao.item)).filter(
+                Notificacao.almoxarifado_id == almoxarifado_id,
+                Notificacao.enviada_em == None
+            ).order_by(Notificacao.id).all()
+            resumo = montar_resumo(pendentes)
+            para = destinatarios(almoxarifado_id)
+
+            # Sem destinatário ou sem nada em aberto: baixa sem enviar
+            if para and any(resumo.values()):
+                smtp = smtp or _conectar()
+                smtp.send_message(_mensagem(db.session.get(Almoxarifado, almoxarifado_id), resumo, para, agora))
+                enviados += 1
+
+            db.session.execute(
+                update(Notificacao).where(Notificacao.id.in_([n.id for n in pendentes])).values(enviada_em=agora)
+            )
+            db.session.commit()
+            baixadas += len(pendentes)
+    finally:
+        if smtp:
+            try:
+                smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                # Conexão já caída: fecha sem esconder o erro original
+                smtp.close()
+
+    return enviados, baixadas
+
+
+@notificacoes.cli.command('enviar')
+@click.option('--continuo', is_flag=True, help='Continua enviando a cada --intervalo segundos (processo de serviço).')
+@click.option('--intervalo', default=INTERVALO_ENVIO, show_default=True, help='Segundos entre as rodadas no modo contínuo.')
+def enviar_comando(continuo, intervalo):
+    """Envia os resumos de notificações pendentes por almoxarifado"""
+    while True:
+        try:
+            enviados, baixadas = enviar_resumos()
+            if enviados or baixadas or not continuo:
+                click.echo(f'{enviados} resumo(s) enviado(s); {baixadas} notificação(ões) baixada(s).')
+        except (smtplib.SMTPException, OSError) as e:
+            db.session.rollback()
+            click.echo(f'Erro ao enviar os resumos: {e}', err=True)
+            if not continuo:
+                raise SystemExit(1)
+        finally:
+            db.session.remove()
+
+        if not continuo:
+            break
+        time.sleep(intervalo)
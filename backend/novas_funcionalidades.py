@@ -13,7 +13,7 @@ from datetime import datetime, timedelta
 from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, jsonify, current_app
 from flask_login import login_required, current_user
 from functools import wraps
-from models import db, Usuario, Item, Movimentacao, Setor, Configuracao, Categoria
+from models import db, Usuario, Item, Movimentacao, Setor, Configuracao, Categoria, Almoxarifado, coluna_status_validade
 from sqlalchemy import or_, func
 from werkzeug.utils import secure_filename
 
@@ -195,8 +195,8 @@ def excluir_usuario(id):
         flash('Você não pode excluir a si mesmo!', 'danger')
         return redirect(url_for('listar_usuarios'))
     
-    # Verificar se o usuário tem movimentações
-    if usuario.movimentacoes:
+    # Verificar se o usuário tem movimentações (EXISTS no índice de usuario_id)
+    if db.session.query(Movimentacao.query.filter_by(usuario_id=usuario.id).exists()).scalar():
         flash(f'Não é possível excluir {usuario.nome} pois existem movimentações registradas por ele. Use a opção "Bloquear" em vez disso.', 'warning')
         return redirect(url_for('listar_usuarios'))
     
@@ -331,14 +331,12 @@ def dashboard_stats():
         Movimentacao.data_hora >= data_limite
     ).group_by(Setor.nome).all()
     
-    # Itens próximos do vencimento
-    hoje = datetime.now().date()
-    data_limite_validade = hoje + timedelta(days=30)
+    # Itens próximos do vencimento (situação gravada; pela data se a varredura atrasar)
     itens_vencimento = db.session.query(
         func.count(Item.id)
     ).filter(
         Item.ativo == True,
-        Item.data_validade.between(hoje, data_limite_validade)
+        coluna_status_validade() == 'vence_em_breve'
     ).scalar()
     
     return jsonify({
@@ -360,12 +358,16 @@ def estatisticas():
     # Total de itens
     total_itens = Item.query.filter_by(ativo=True).count()
     
-    # Valor total do estoque (se tiver preços implementados)
-    # Por enquanto, apenas quantidade
+    # Quantidade total em estoque
     total_estoque = db.session.query(
         func.sum(Item.estoque_atual)
     ).filter(Item.ativo == True).scalar() or 0
     
+    # Valor do estoque ao custo médio, mantido por almoxarifado
+    valor_estoque = db.session.query(
+        func.sum(Almoxarifado.valor_estoque)
+    ).filter(Almoxarifado.ativo == True).scalar() or 0
+    
     # Movimentações do mês
     inicio_mes = datetime.now().replace(day=1, hour=0, minute=0, second=0)
     movimentacoes_mes = Movimentacao.query.filter(
@@ -384,5 +386,6 @@ def estatisticas():
     return render_template('relatorios/estatisticas.html',
                          total_itens=total_itens,
                          total_estoque=total_estoque,
+                         valor_estoque=valor_estoque,
                          movimentacoes_mes=movimentacoes_mes,
                          setores_ativos=setores_ativos)
@@ -0,0 +1,345 @@
+"""
+Previsão de consumo por setor
+Ajuste em lote, em NumPy, de todas as séries (setor, código) com
+suavização exponencial simples e ingênuo sazonal; o melhor modelo de
+cada série é gravado em previsoes_consumo e as telas só leem esse cache
+"""
+
+import json
+import threading
+from datetime import date, datetime, timedelta
+
+import click
+import numpy as np
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
+from flask_login import login_required, current_user
+from sqlalchemy import delete, func, insert
+
+from models import db, Item, Movimentacao, Almoxarifado, Setor, PrevisaoConsumo
+
+previsao = Blueprint('previsao', __name__)
+
+# Períodos de 30 dias de consumo usados no ajuste (24 = cerca de dois anos)
+DIAS_PERIODO = 30
+PERIODOS_HISTORICO = 24
+
+# Últimos períodos usados para comparar os modelos (erro de um passo à frente)
+PERIODOS_VALIDACAO = 6
+
+# Sazonalidade anual em períodos de 30 dias
+SAZONALIDADE = 12
+
+# Constantes de suavização testadas em cada série
+ALFAS = (0.1, 0.2, 0.3, 0.5, 0.8)
+
+# Horizonte da previsão, em períodos (30, 60 e 90 dias)
+HORIZONTE = 3
+
+# Um ajuste disparado pela tela por vez em cada processo
+_ajuste_em_andamento = threading.Lock()
+
+
+def consumo_por_periodo(periodos=PERIODOS_HISTORICO, hoje=None):
+    """
+    Saídas com setor dos últimos `periodos` períodos de 30 dias (até
+    ontem), somadas por (almoxarifado, setor, código) e período, como
+    matriz NumPy série x período (o último período termina ontem).
+    Retorna (chaves, codigos, demanda): chaves é um array n x 2 com
+    almoxarifado_id e setor_id de cada série.
+    """
+    fim = hoje or date.today()
+    inicio = fim - timedelta(days=periodos * DIAS_PERIODO)
+    dia = func.date(Movimentacao.data_hora)
+
+    linhas = db.session.query(
+        Item.almoxarifado_id, Movimentacao.setor_id, Item.codigo_barras, dia, func.sum(Movimentacao.quantidade)
+    ).join(Item, Movimentacao.item_id == Item.id).filter(
+        Movimentacao.tipo == 'saida',
+        Movimentacao.setor_id != None,
+        Item.almoxarifado_id != None,
+        Movimentacao.data_hora >= inicio,
+        Movimentacao.data_hora < fim
+    ).group_by(Item.almoxarifado_id, Movimentacao.setor_id, Item.codigo_barras, dia).all()
+
+    if not linhas:
+        return np.zeros((0, 2), dtype=np.int64), np.array([], dtype=str), np.zeros((0, periodos))
+
+    almoxarifados, setores, codigos, datas, quantidades = zip(*linhas)
+    nomes, indice_codigo = np.unique(np.asarray(codigos, dtype=str), return_inverse=True)
+    chaves, serie = np.unique(
+        np.column_stack([almoxarifados, setores, indice_codigo.ravel()]).astype(np.int64),
+        axis=0, return_inverse=True
+    )
+    periodo = (np.asarray([str(d)[:10] for d in datas], dtype='datetime64[D]')
+               - np.datetime64(inicio, 'D')).astype(np.int64) // DIAS_PERIODO
+
+    demanda = np.zeros((len(chaves), periodos))
+    np.add.at(demanda, (serie.ravel(), periodo), np.asarray(quantidades, dtype=np.float64))
+    return chaves[:, :2], nomes[chaves[:, 2]], demanda
+
+
+def ajustar_modelos(demanda):
+    """
+    Ajusta os dois modelos a todas as séries de uma vez e fica, em cada
+    uma, com o de menor erro absoluto médio nos últimos PERIODOS_VALIDACAO
+    períodos. Retorna (metodo, alfa, erro, previsto): previsto é a matriz
+    série x HORIZONTE com a quantidade acumulada prevista.
+    """
+    total_series, periodos = demanda.shape
+    validacao = min(PERIODOS_VALIDACAO, periodos - 1)
+
+    # Suavização exponencial simples: um nível por série e por alfa
+    alfas = np.asarray(ALFAS)[:, None]
+    nivel = np.repeat(demanda[None, :, 0], len(ALFAS), axis=0)
+    erros = np.zeros((len(ALFAS), total_series))
+    for t in range(1, periodos):
+        if t >= periodos - validacao:
+            erros += np.abs(demanda[:, t] - nivel)
+        nivel = alfas * demanda[:, t] + (1 - alfas) * nivel
+    melhor = erros.argmin(axis=0)
+    series = np.arange(total_series)
+    erro = erros[melhor, series] / max(validacao, 1)
+    previsto = nivel[melhor, series][:, None] * np.arange(1, HORIZONTE + 1)
+    metodo = np.full(total_series, 'suavizacao', dtype=object)
+    alfa = np.asarray(ALFAS)[melhor].astype(object)
+
+    # Ingênuo sazonal: repete o consumo do mesmo período do ano anterior
+    if periodos >= SAZONALIDADE + validacao:
+        erro_sazonal = np.abs(
+            demanda[:, periodos - validacao:] - demanda[:, periodos - validacao - SAZONALIDADE:periodos - SAZONALIDADE]
+        ).mean(axis=1)
+        inicio = periodos - SAZONALIDADE
+        previsto_sazonal = np.cumsum(demanda[:, inicio:inicio + HORIZONTE], axis=1)
+
+        sazonal = erro_sazonal < erro
+        metodo[sazonal] = 'sazonal'
+        alfa[sazonal] = None
+        erro = np.where(sazonal, erro_sazonal, erro)
+        previsto[sazonal] = previsto_sazonal[sazonal]
+
+    return metodo, alfa, erro, previsto
+
+
+def ajustar_previsoes(periodos=PERIODOS_HISTORICO, hoje=None):
+    """
+    Refaz o cache de previsões de todos os almoxarifados: ajusta todas
+    as séries e substitui previsoes_consumo numa única transação (as
+    telas continuam lendo o ajuste anterior até o commit). Retorna o
+    número de séries ajustadas.
+    """
+    if periodos < 1:
+        raise ValueError('Informe ao menos um período de consumo.')
+    chaves, codigos, demanda = consumo_por_periodo(periodos, hoje)
+    metodo, alfa, erro, previsto = ajustar_modelos(demanda)
+
+    custos = {
+        (almoxarifado_id, codigo): custo or 0
+        for almoxarifado_id, codigo, custo in db.session.query(
+            Item.almoxarifado_id, Item.codigo_barras, func.avg(Item.custo_medio)
+        ).group_by(Item.almoxarifado_id, Item.codigo_barras)
+    }
+
+    data_ajuste = datetime.utcnow()
+    db.session.execute(delete(PrevisaoConsumo))
+    if len(codigos):
+        db.session.execute(insert(PrevisaoConsumo), [{
+            'almoxarifado_id': almoxarifado_id,
+            'setor_id': setor_id,
+            'codigo_barras': codigo,
+            'metodo': m,
+            'alfa': a,
+            'erro_medio': round(e, 4),
+            'previsao_30': round(p[0], 2),
+            'previsao_60': round(p[1], 2),
+            'previsao_90': round(p[2], 2),
+            'custo_unitario': custos.get((almoxarifado_id, codigo), 0),
+            'historico': json.dumps([round(q, 2) for q in h]),
+            'data_ajuste': data_ajuste
+        } for (almoxarifado_id, setor_id), codigo, m, a, e, p, h in zip(
+            chaves.tolist(), codigos.tolist(), metodo.tolist(), alfa.tolist(),
+            erro.tolist(), previsto.tolist(), demanda.tolist()
+        )])
+
+    db.session.commit()
+    return len(codigos)
+
+
+# ====================
+# CONSULTAS AO CACHE
+# ====================
+def data_ultimo_ajuste(almoxarifado_id):
+    return db.session.query(func.max(PrevisaoConsumo.data_ajuste)).filter(
+        PrevisaoConsumo.almoxarifado_id == almoxarifado_id
+    ).scalar()
+
+
+def resumo_setores(almoxarifado_id):
+    """Valor previsto por setor (30/60/90 dias) e número de códigos com previsão"""
+    custo = func.coalesce(PrevisaoConsumo.custo_unitario, 0)
+    return db.session.query(
+        Setor.id,
+        Setor.nome,
+        func.count(PrevisaoConsumo.id).label('codigos'),
+        func.sum(PrevisaoConsumo.previsao_30 * custo).label('valor_30'),
+        func.sum(PrevisaoConsumo.previsao_60 * custo).label('valor_60'),
+        func.sum(PrevisaoConsumo.previsao_90 * custo).label('valor_90')
+    ).join(PrevisaoConsumo, PrevisaoConsumo.setor_id == Setor.id).filter(
+        PrevisaoConsumo.almoxarifado_id == almoxarifado_id
+    ).group_by(Setor.id, Setor.nome).order_by(Setor.nome).all()
+
+
+def _consulta_previsoes(almoxarifado_id, setor_id=None, codigo_barras=None):
+    query = PrevisaoConsumo.query.filter_by(almoxarifado_id=almoxarifado_id)
+    if setor_id:
+        query = query.filter_by(setor_id=setor_id)
+    if codigo_barras:
+        query = query.filter_by(codigo_barras=codigo_barras)
+    return query.order_by(
+        (PrevisaoConsumo.previsao_90 * func.coalesce(PrevisaoConsumo.custo_unitario, 0)).desc(),
+        PrevisaoConsumo.codigo_barras
+    )
+
+
+def _nomes(almoxarifado_id, codigos):
+    if not codigos:
+        return {}
+    return dict(db.session.query(Item.codigo_barras, func.max(Item.nome)).filter(
+        Item.almoxarifado_id == almoxarifado_id,
+        Item.codigo_barras.in_(codigos)
+    ).group_by(Item.codigo_barras).all())
+
+
+def _serie_grafico(prev):
+    """Histórico e previsão por período de 30 dias, para o gráfico"""
+    acumulado = [prev.previsao_30, prev.previsao_60, prev.previsao_90]
+    return {
+        'historico': json.loads(prev.historico or '[]'),
+        'previsao': [round(b - a, 2) for a, b in zip([0] + acumulado, acumulado)]
+    }
+
+
+def _almoxarifado_selecionado():
+    if current_user.ve_todos_almoxarifados:
+        return request.values.get('almoxarifado_id', type=int)
+    return current_user.almoxarifado_id
+
+
+@previsao.route('/relatorios/previsao')
+@login_required
+def relatorio():
+    """Previsão de consumo por setor e, escolhido o setor, por código"""
+    almoxarifado_id = _almoxarifado_selecionado()
+    setor_id = request.args.get('setor_id', type=int)
+    codigo_barras = request.args.get('codigo_barras', '').strip() or None
+    page = request.args.get('page', 1, type=int)
+
+    almoxarifado = db.session.get(Almoxarifado, almoxarifado_id) if almoxarifado_id else None
+    setores = previsoes = selecionada = None
+    nomes = {}
+    data_ajuste = None
+    if almoxarifado:
+        data_ajuste = data_ultimo_ajuste(almoxarifado.id)
+        setores = resumo_setores(almoxarifado.id)
+        if setor_id:
+            previsoes = _consulta_previsoes(almoxarifado.id, setor_id).paginate(
+                page=page, per_page=50, error_out=False
+            )
+            nomes = _nomes(almoxarifado.id, [p.codigo_barras for p in previsoes.items])
+            if codigo_barras:
+                selecionada = _consulta_previsoes(almoxarifado.id, setor_id, codigo_barras).first()
+                if selecionada and codigo_barras not in nomes:
+                    nomes.update(_nomes(almoxarifado.id, [codigo_barras]))
+
+    almoxarifados = []
+    if current_user.ve_todos_almoxarifados:
+        almoxarifados = Almoxarifado.query.filter_by(ativo=True).order_by(Almoxarifado.nome).all()
+
+    return render_template('relatorios/previsao.html',
+                         almoxarifado=almoxarifado,
+                         almoxarifados=almoxarifados,
+                         data_ajuste=data_ajuste,
+                         setores=setores,
+                         setor_id=setor_id,
+                         previsoes=previsoes,
+                         nomes=nomes,
+                         selecionada=selecionada,
+                         serie=_serie_grafico(selecionada) if selecionada else None,
+                         dias_periodo=DIAS_PERIODO,
+                         periodos=PERIODOS_HISTORICO)
+
+
+def _ajustar_em_segundo_plano(app):
+    with app.app_context():
+        try:
+            total = ajustar_previsoes()
+            app.logger.info('Previsões de consumo ajustadas: %d série(s).', total)
+        except Exception:
+            db.session.rollback()
+            app.logger.exception('Erro ao ajustar as previsões de consumo')
+        finally:
+            db.session.remove()
+            _ajuste_em_andamento.release()
+
+
+@previsao.route('/relatorios/previsao/ajustar', methods=['POST'])
+@login_required
+def ajustar():
+    """Refaz o ajuste das previsões de todos os almoxarifados"""
+    if not current_user.ve_todos_almoxarifados:
+        flash('Apenas administradores podem refazer as previsões.', 'danger')
+        return redirect(url_for('previsao.relatorio'))
+
+    # O ajuste nunca roda dentro da requisição: segue numa thread e a
+    # tela continua lendo o cache anterior até o commit
+    if _ajuste_em_andamento.acquire(blocking=False):
+        threading.Thread(
+            target=_ajustar_em_segundo_plano,
+            args=(current_app._get_current_object(),),
+            daemon=True
+        ).start()
+        flash('Ajuste das previsões iniciado em segundo plano. A data do ajuste muda quando terminar.', 'info')
+    else:
+        flash('Já existe um ajuste das previsões em andamento.', 'warning')
+
+    return redirect(url_for('previsao.relatorio', almoxarifado_id=request.form.get('almoxarifado_id')))
+
+
+@previsao.route('/api/previsao')
+@login_required
+def api_previsao():
+    """API: previsões gravadas de um almoxarifado (filtros setor_id e codigo_barras)"""
+    almoxarifado_id = _almoxarifado_selecionado()
+    if not almoxarifado_id:
+        return jsonify({'erro': 'Informe o almoxarifado_id.'}), 400
+
+    limite = max(1, min(request.args.get('limite', 1000, type=int), 10000))
+    linhas = _consulta_previsoes(
+        almoxarifado_id, request.args.get('setor_id', type=int), request.args.get('codigo_barras')
+    ).limit(limite).all()
+    data_ajuste = data_ultimo_ajuste(almoxarifado_id)
+
+    return jsonify({
+        'almoxarifado_id': almoxarifado_id,
+        'data_ajuste': data_ajuste.isoformat() if data_ajuste else None,
+        'dias_periodo': DIAS_PERIODO,
+        'previsoes': [{
+            'setor_id': p.setor_id,
+            'codigo_barras': p.codigo_barras,
+            'metodo': p.metodo,
+            'alfa': p.alfa,
+            'erro_medio': p.erro_medio,
+            'previsao_30': p.previsao_30,
+            'previsao_60': p.previsao_60,
+            'previsao_90': p.previsao_90,
+            'custo_unitario': p.custo_unitario,
+            **_serie_grafico(p)
+        } for p in linhas]
+    })
+
+
+@previsao.cli.command('ajustar')
+@click.option('--periodos', default=PERIODOS_HISTORICO, show_default=True, type=click.IntRange(min=1), help='Períodos de 30 dias de consumo considerados.')
+def ajustar_comando(periodos):
+    """Ajusta as previsões de consumo de todos os setores (para agendar via cron)"""
+    total = ajustar_previsoes(periodos)
+    click.echo(f'{total} série(s) de consumo ajustada(s) com {periodos} período(s) de {DIAS_PERIODO} dias.')
@@ -14,16 +14,11 @@ import os
 import requests
 
 from models import Item, Movimentacao, Configuracao, Almoxarifado
+from estoque import consulta_saldo_em
 
 
-def gerar_relatorio_estoque(current_user):
-    """Gera relatório de estoque atual em PDF filtrado por almoxarifado"""
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    elements = []
-    
-    styles = getSampleStyleSheet()
-    
+def _cabecalho(elements, styles, current_user, titulo_relatorio, complemento=""):
+    """Logo, hospital, almoxarifado, título e data comuns a todos os relatórios"""
     # Buscar configurações
     config = Configuracao.query.first()
     nome_hospital = config.nome_hospital if config and config.nome_hospital else "Almoxarifado Hospitalar"
@@ -82,7 +77,7 @@ def gerar_relatorio_estoque(current_user):
         alignment=1
     )
     
-    titulo = Paragraph("Relatório de Estoque", titulo_style)
+    titulo = Paragraph(titulo_relatorio, titulo_style)
     elements.append(titulo)
     
     # Data do relatório
@@ -95,11 +90,22 @@ def gerar_relatorio_estoque(current_user):
     )
     
     data_relatorio = Paragraph(
-        f"Gerado em: {datetime.now().strftime('%d/%m/%Y às %H:%M')}",
+        f"Gerado em: {datetime.now().strftime('%d/%m/%Y às %H:%M')}{complemento}",
         data_style
     )
     elements.append(data_relatorio)
     elements.append(Spacer(1, 20))
+
+
+def gerar_relatorio_estoque(current_user):
+    """Gera relatório de estoque atual em PDF filtrado por almoxarifado"""
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    elements = []
+    
+    styles = getSampleStyleSheet()
+    
+    _cabecalho(elements, styles, current_user, "Relatório de Estoque")
     
     # Buscar itens com filtro por almoxarifado
     query = Item.query.filter_by(ativo=True)
@@ -196,86 +202,11 @@ def gerar_relatorio_movimentacoes(current_user, data_inicio=None, data_fim=None)
     
     styles = getSampleStyleSheet()
     
-    # Buscar configurações
-    config = Configuracao.query.first()
-    nome_hospital = config.nome_hospital if config and config.nome_hospital else "Almoxarifado Hospitalar"
-    
-    # Determinar almoxarifado
-    almoxarifado_nome = "Todos os Almoxarifados"
-    if not current_user.ve_todos_almoxarifados and current_user.almoxarifado_id:
-        almoxarifado = Almoxarifado.query.get(current_user.almoxarifado_id)
-        if almoxarifado:
-            almoxarifado_nome = almoxarifado.nome
-    
-    # Logo (se existir)
-    if config and config.logo_url:
-        try:
-            # Tentar baixar o logo
-            if config.logo_url.startswith('http'):
-                response = requests.get(config.logo_url, timeout=5)
-                if response.status_code == 200:
-                    logo_buffer = BytesIO(response.content)
-                    logo = Image(logo_buffer, width=3*cm, height=3*cm)
-                    logo.hAlign = 'CENTER'
-                    elements.append(logo)
-                    elements.append(Spacer(1, 10))
-        except:
-            pass  # Se falhar, continua sem logo
-    
-    # Nome do Hospital
-    hospital_style = ParagraphStyle(
-        'HospitalStyle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        textColor=colors.HexColor('#2C3E50'),
-        spaceAfter=5,
-        alignment=1
-    )
-    elements.append(Paragraph(nome_hospital, hospital_style))
-    
-    # Nome do Almoxarifado
-    almox_style = ParagraphStyle(
-        'AlmoxStyle',
-        parent=styles['Heading2'],
-        fontSize=14,
-        textColor=colors.HexColor('#3498DB'),
-        spaceAfter=20,
-        alignment=1
-    )
-    elements.append(Paragraph(almoxarifado_nome, almox_style))
-    
-    # Título
-    titulo_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=18,
-        textColor=colors.HexColor('#2C3E50'),
-        spaceAfter=10,
-        alignment=1
-    )
-    
-    titulo = Paragraph("Relatório de Movimentações", titulo_style)
-    elements.append(titulo)
-    
-    # Data do relatório
-    data_style = ParagraphStyle(
-        'DataStyle',
-        parent=styles['Normal'],
-        fontSize=10,
-        textColor=colors.gray,
-        alignment=1
-    )
-    
     periodo = ""
     if data_inicio and data_fim:
         periodo = f"<br/>Período: {data_inicio} a {data_fim}"
     
-    data_relatorio = Paragraph(
-        f"Gerado em: {datetime.now().strftime('%d/%m/%Y às %H:%M')}{periodo}",
-        data_style
-    )
-    elements.append(data_relatorio)
-    elements.append(Spacer(1, 20))
+    _cabecalho(elements, styles, current_user, "Relatório de Movimentações", periodo)
     
     # Buscar movimentações com filtro
     query = Movimentacao.query
@@ -347,6 +278,7 @@ def gerar_relatorio_movimentacoes(current_user, data_inicio=None, data_fim=None)
     entradas = sum(1 for m in movimentacoes if m.tipo == 'entrada')
     saidas = sum(1 for m in movimentacoes if m.tipo == 'saida')
     ajustes = sum(1 for m in movimentacoes if m.tipo == 'ajuste')
+    transferencias = sum(1 for m in movimentacoes if m.tipo == 'transferencia')
     
     resumo_style = ParagraphStyle(
         'ResumoStyle',
@@ -360,7 +292,8 @@ def gerar_relatorio_movimentacoes(current_user, data_inicio=None, data_fim=None)
     Total de movimentações: {total_mov}<br/>
     Entradas: {entradas}<br/>
     Saídas: {saidas}<br/>
-    Ajustes: {ajustes}
+    Ajustes: {ajustes}<br/>
+    Transferências: {transferencias}
     """
     
     elements.append(Paragraph(resumo, resumo_style))
@@ -370,3 +303,141 @@ def gerar_relatorio_movimentacoes(current_user, data_inicio=None, data_fim=None)
     
     buffer.seek(0)
     return buffer.getvalue()
+
+
+def _estilo_tabela(fonte_cabecalho=10, fonte_corpo=9):
+    """Estilo padrão das tabelas dos relatórios"""
+    return TableStyle([
+        # Cabeçalho
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#34495E')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), fonte_cabecalho),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        
+        # Corpo
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 1), (-1, -1), fonte_corpo),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#F8F9FA')]),
+    ])
+
+
+def gerar_relatorio_posicao_estoque(current_user, data_ref, almoxarifado_id=None):
+    """Gera relatório de posição de estoque ao final de uma data (fechamento de período)"""
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    elements = []
+    
+    styles = getSampleStyleSheet()
+    
+    _cabecalho(elements, styles, current_user, "Posição de Estoque",
+               f"<br/>Saldo ao final de {data_ref.strftime('%d/%m/%Y')}")
+    
+    linhas = consulta_saldo_em(data_ref, current_user, almoxarifado_id).order_by(Item.nome).all()
+    
+    dados = [['Código', 'Lote', 'Nome', 'Saldo', 'Un.']]
+    for item, saldo in linhas:
+        dados.append([
+            item.codigo_barras or '-',
+            item.lote[:15],
+            item.nome[:35],
+            f'{saldo:.2f}',
+            item.unidade_medida
+        ])
+    
+    tabela = Table(dados, colWidths=[3*cm, 3*cm, 7.5*cm, 2.5*cm, 1.5*cm])
+    tabela.setStyle(_estilo_tabela())
+    elements.append(tabela)
+    
+    elements.append(Spacer(1, 30))
+    
+    resumo_style = ParagraphStyle(
+        'ResumoStyle',
+        parent=styles['Normal'],
+        fontSize=10,
+        textColor=colors.HexColor('#2C3E50')
+    )
+    
+    resumo = f"""
+    <b>Resumo:</b><br/>
+    Itens listados: {len(linhas)}<br/>
+    Itens com saldo positivo: {sum(1 for _, saldo in linhas if saldo > 0)}
+    """
+    elements.append(Paragraph(resumo, resumo_style))
+    
+    doc.build(elements)
+    
+    buffer.seek(0)
+    return buffer.getvalue()
+
+
+# Linhas por tabela nos relatórios longos
+LINHAS_POR_TABELA = 500
+
+
+def gerar_relatorio_kardex(current_user, itens, linhas):
+    """Gera o kardex (ficha de estoque) de um item ou código de barras em PDF"""
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    elements = []
+    
+    styles = getSampleStyleSheet()
+    
+    item = itens[0]
+    lotes = ', '.join(i.lote for i in itens[:10]) + ('...' if len(itens) > 10 else '')
+    _cabecalho(elements, styles, current_user, "Kardex - Ficha de Estoque",
+               f"<br/>{item.codigo_barras} - {item.nome}<br/>Lote(s): {lotes}")
+    
+    cabecalho = ['Data/Hora', 'Lote', 'Tipo', 'Qtd', 'Saldo', 'Setor', 'Usuário']
+    larguras = [3*cm, 2.5*cm, 2*cm, 2*cm, 2*cm, 3*cm, 3*cm]
+    dados = [cabecalho]
+    total_mov = 0
+    saldo_final = '0.00'
+    
+    for linha in linhas:
+        total_mov += 1
+        saldo_final = f'{linha.saldo:.2f}'
+        dados.append([
+            linha.data_hora.strftime('%d/%m/%Y %H:%M') if linha.data_hora else '-',
+            linha.lote[:12],
+            linha.tipo.upper(),
+            f'{linha.quantidade_assinada:+.2f}',
+            saldo_final,
+            (linha.setor or '-')[:15],
+            linha.usuario[:15]
+        ])
+        
+        # Tabelas em blocos: uma única tabela gigante deixa o ReportLab muito lento
+        if len(dados) > LINHAS_POR_TABELA:
+            tabela = Table(dados, colWidths=larguras, repeatRows=1)
+            tabela.setStyle(_estilo_tabela(fonte_cabecalho=9, fonte_corpo=8))
+            elements.append(tabela)
+            dados = [cabecalho]
+    
+    if len(dados) > 1 or total_mov == 0:
+        tabela = Table(dados, colWidths=larguras, repeatRows=1)
+        tabela.setStyle(_estilo_tabela(fonte_cabecalho=9, fonte_corpo=8))
+        elements.append(tabela)
+    
+    elements.append(Spacer(1, 30))
+    
+    resumo_style = ParagraphStyle(
+        'ResumoStyle',
+        parent=styles['Normal'],
+        fontSize=10,
+        textColor=colors.HexColor('#2C3E50')
+    )
+    
+    resumo = f"""
+    <b>Resumo:</b><br/>
+    Total de movimentações: {total_mov}<br/>
+    Saldo final: {saldo_final} {item.unidade_medida}
+    """
+    elements.append(Paragraph(resumo, resumo_style))
+    
+    doc.build(elements)
+    
+    buffer.seek(0)
+    return buffer.getvalue()
@@ -0,0 +1,305 @@
+"""
+Reposição de estoque
+Ponto de pedido e estoque de segurança de todos os códigos de um
+almoxarifado, calculados em NumPy a partir do consumo diário, com
+proposta de estoque mínimo e lista de compras por fornecedor
+"""
+
+from datetime import date, timedelta
+
+import click
+import numpy as np
+from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask_login import login_required, current_user
+from sqlalchemy import bindparam, case, distinct, func, or_, select, update
+
+from models import (db, Item, Movimentacao, Almoxarifado, Compra, Fornecedor, proxima_versao,
+                    sincronizar_status)
+
+reposicao = Blueprint('reposicao', __name__)
+
+# Dias de consumo usados no cálculo
+DIAS_HISTORICO = 90
+
+# Prazo de entrega quando o fornecedor não informa o seu
+PRAZO_ENTREGA_PADRAO = 7
+
+# Dias de consumo que um pedido deve cobrir além do ponto de pedido
+DIAS_COBERTURA = 30
+
+# Fator z do nível de serviço por classe ABC (98%, 95%, 90%); sem classe: 95%
+NIVEL_SERVICO = {'A': 2.05, 'B': 1.65, 'C': 1.28}
+NIVEL_SERVICO_PADRAO = 1.65
+
+# Propostas de estoque mínimo exibidas na tela (as de maior consumo em valor)
+LIMITE_PROPOSTAS = 500
+
+
+def consumo_diario(almoxarifado_id, dias=DIAS_HISTORICO, hoje=None):
+    """
+    Saídas dos últimos `dias` dias (até ontem) somadas por código e dia,
+    numa consulta agrupada, como matriz NumPy código x dia.
+    Retorna (codigos, demanda).
+    """
+    fim = hoje or date.today()
+    inicio = fim - timedelta(days=dias)
+    dia = func.date(Movimentacao.data_hora)
+
+    linhas = db.session.query(
+        Item.codigo_barras, dia, func.sum(Movimentacao.quantidade)
+    ).join(Item, Movimentacao.item_id == Item.id).filter(
+        Item.almoxarifado_id == almoxarifado_id,
+        Movimentacao.tipo == 'saida',
+        Movimentacao.data_hora >= inicio,
+        Movimentacao.data_hora < fim
+    ).group_by(Item.codigo_barras, dia).all()
+
+    if not linhas:
+        return np.array([], dtype=str), np.zeros((0, dias))
+
+    codigos, datas, quantidades = zip(*linhas)
+    codigos, produto = np.unique(np.asarray(codigos, dtype=str), return_inverse=True)
+    indice_dia = (np.asarray([str(d)[:10] for d in datas], dtype='datetime64[D]')
+                  - np.datetime64(inicio, 'D')).astype(np.int64)
+
+    demanda = np.zeros((len(codigos), dias))
+    np.add.at(demanda, (produto.ravel(), indice_dia), np.asarray(quantidades, dtype=np.float64))
+    return codigos, demanda
+
+
+def _situacao_codigos(almoxarifado_id, hoje):
+    """Nome, unidade, classe ABC, estoque mínimo e disponível (lotes válidos) de cada código"""
+    disponivel_valido = func.sum(case(
+        (or_(Item.data_validade == None, Item.data_validade >= hoje), Item.estoque_disponivel),
+        else_=0
+    ))
+    return {
+        codigo: (nome, unidade, classe, minimo or 0, disponivel or 0, custo or 0)
+        for codigo, nome, unidade, classe, minimo, disponivel, custo in db.session.query(
+            Item.codigo_barras,
+            func.max(Item.nome),
+            func.max(Item.unidade_medida),
+            func.max(Item.classe_abc),
+            func.max(Item.estoque_minimo),
+            disponivel_valido,
+            func.max(Item.custo_medio)
+        ).filter(
+            Item.almoxarifado_id == almoxarifado_id,
+            Item.ativo == True
+        ).group_by(Item.codigo_barras)
+    }
+
+
+def _ultimas_compras(almoxarifado_id):
+    """Fornecedor e preço da última compra de cada código: {codigo: (fornecedor_id, preco)}"""
+    ordem = func.row_number().over(
+        partition_by=Item.codigo_barras,
+        order_by=(Compra.data.desc(), Compra.id.desc())
+    ).label('ordem')
+    recentes = db.session.query(
+        Item.codigo_barras.label('codigo_barras'), Compra.fornecedor_id, Compra.preco_unitario, ordem
+    ).join(Item, Compra.item_id == Item.id).filter(
+        Item.almoxarifado_id == almoxarifado_id
+    ).subquery()
+
+    return {
+        codigo: (fornecedor_id, preco)
+        for codigo, fornecedor_id, preco in db.session.query(
+            recentes.c.codigo_barras, recentes.c.fornecedor_id, recentes.c.preco_unitario
+        ).filter(recentes.c.ordem == 1)
+    }
+
+
+def calcular_reposicao(almoxarifado_id, dias=DIAS_HISTORICO, hoje=None):
+    """
+    Para cada código com consumo no período: consumo médio diário,
+    desvio padrão, estoque de segurança (z x desvio x raiz do prazo),
+    ponto de pedido (estoque mínimo proposto) e quantidade sugerida
+    para voltar a cobrir DIAS_COBERTURA dias além do ponto de pedido.
+    Retorna uma lista de dicts, do maior para o menor consumo em valor.
+    """
+    hoje = hoje or date.today()
+    codigos, demanda = consumo_diario(almoxarifado_id, dias, hoje)
+    if not len(codigos):
+        return []
+
+    situacao = _situacao_codigos(almoxarifado_id, hoje)
+    compras = _ultimas_compras(almoxarifado_id)
+    prazos = dict(db.session.query(Fornecedor.id, Fornecedor.prazo_entrega_dias).filter(
+        Fornecedor.prazo_entrega_dias != None
+    ))
+
+    # Códigos sem lote ativo não entram na reposição
+    ativos = np.array([codigo in situacao for codigo in codigos.tolist()], dtype=bool)
+    codigos, demanda = codigos[ativos], demanda[ativos]
+    if not len(codigos):
+        return []
+
+    dados = [situacao[codigo] for codigo in codigos.tolist()]
+    fornecedores = [compras.get(codigo, (None, None))[0] for codigo in codigos.tolist()]
+    precos = np.array([compras.get(codigo, (None, None))[1] or dado[5]
+                       for codigo, dado in zip(codigos.tolist(), dados)], dtype=np.float64)
+    z = np.array([NIVEL_SERVICO.get(dado[2], NIVEL_SERVICO_PADRAO) for dado in dados])
+    prazo = np.array([prazos.get(fornecedor, PRAZO_ENTREGA_PADRAO) for fornecedor in fornecedores], dtype=np.float64)
+    minimo_atual = np.array([dado[3] for dado in dados], dtype=np.float64)
+    disponivel = np.array([dado[4] for dado in dados], dtype=np.float64)
+
+    media = demanda.mean(axis=1)
+    desvio = demanda.std(axis=1, ddof=1) if demanda.shape[1] > 1 else np.zeros(len(codigos))
+    seguranca = z * desvio * np.sqrt(prazo)
+    ponto_pedido = np.ceil(media * prazo + seguranca)
+    alvo = ponto_pedido + media * DIAS_COBERTURA
+    sugerido = np.where(disponivel <= ponto_pedido, np.ceil(np.maximum(alvo - disponivel, 0)), 0)
+
+    ordem = np.argsort(-(media * precos), kind='stable')
+    return [{
+        'codigo_barras': str(codigos[i]),
+        'nome': dados[i][0],
+        'unidade_medida': dados[i][1],
+        'classe_abc': dados[i][2],
+        'consumo_medio': float(media[i]),
+        'desvio': float(desvio[i]),
+        'prazo_entrega': int(prazo[i]),
+        'estoque_seguranca': float(seguranca[i]),
+        'estoque_minimo_atual': float(minimo_atual[i]),
+        'estoque_minimo_proposto': float(ponto_pedido[i]),
+        'disponivel': float(disponivel[i]),
+        'quantidade_sugerida': float(sugerido[i]),
+        'fornecedor_id': fornecedores[i],
+        'preco_unitario': float(precos[i])
+    } for i in ordem.tolist()]
+
+
+def pedidos_por_fornecedor(linhas):
+    """Agrupa as linhas com quantidade sugerida por fornecedor da última compra"""
+    nomes = dict(db.session.query(Fornecedor.id, Fornecedor.nome))
+    pedidos = {}
+    for linha in linhas:
+        if linha['quantidade_sugerida'] <= 0:
+            continue
+        pedido = pedidos.setdefault(linha['fornecedor_id'], {
+            'fornecedor_id': linha['fornecedor_id'],
+            'fornecedor': nomes.get(linha['fornecedor_id'], 'Sem fornecedor registrado'),
+            'itens': [],
+            'valor_estimado': 0
+        })
+        pedido['itens'].append(linha)
+        pedido['valor_estimado'] += linha['quantidade_sugerida'] * linha['preco_unitario']
+    return sorted(pedidos.values(), key=lambda p: (p['fornecedor_id'] is None, p['fornecedor']))
+
+
+def aplicar_estoque_minimo(almoxarifado_id, propostas):
+    """
+    Grava o estoque mínimo proposto {codigo: minimo} nos lotes ativos de
+    cada código, num UPDATE em lote. Lotes que já têm esse mínimo não são
+    regravados (nem mudam de versão). Retorna quantos códigos mudaram.
+    """
+    if not propostas:
+        return 0
+
+    # UPDATE em lote não passa pelo flush: a versão é atribuída aqui
+    versao = proxima_versao(db.session)
+    tabela = Item.__table__
+    db.session.execute(
+        update(tabela).where(
+            tabela.c.almoxarifado_id == almoxarifado_id,
+            tabela.c.codigo_barras == bindparam('b_codigo_barras'),
+            tabela.c.ativo == True,
+            tabela.c.estoque_minimo.is_distinct_from(bindparam('b_estoque_minimo'))
+        ).values(estoque_minimo=bindparam('b_estoque_minimo'), versao=versao),
+        [{'b_codigo_barras': codigo, 'b_estoque_minimo': minimo} for codigo, minimo in propostas.items()]
+    )
+    alterados = db.session.execute(
+        select(func.count(distinct(tabela.c.codigo_barras))).where(tabela.c.versao == versao)
+    ).scalar()
+    sincronizar_status(db.session, tabela.c.versao == versao)
+    db.session.commit()
+    return alterados
+
+
+def _almoxarifado_selecionado():
+    if current_user.ve_todos_almoxarifados:
+        return request.values.get('almoxarifado_id', type=int)
+    return current_user.almoxarifado_id
+
+
+@reposicao.route('/reposicao')
+@login_required
+def sugestao():
+    """Ponto de pedido proposto e lista de compras sugerida por fornecedor"""
+    if not current_user.pode_gerenciar_estoque:
+        flash('Você não tem permissão para acessar esta página.', 'danger')
+        return redirect(url_for('dashboard'))
+
+    almoxarifado_id = _almoxarifado_selecionado()
+    almoxarifado = db.session.get(Almoxarifado, almoxarifado_id) if almoxarifado_id else None
+
+    linhas = calcular_reposicao(almoxarifado.id) if almoxarifado else []
+    divergentes = [l for l in linhas if abs(l['estoque_minimo_proposto'] - l['estoque_minimo_atual']) >= 1]
+
+    almoxarifados = []
+    if current_user.ve_todos_almoxarifados:
+        almoxarifados = Almoxarifado.query.filter_by(ativo=True).order_by(Almoxarifado.nome).all()
+
+    return render_template('reposicao/sugestao.html',
+                         almoxarifado=almoxarifado,
+                         almoxarifados=almoxarifados,
+                         pedidos=pedidos_por_fornecedor(linhas),
+                         divergentes=divergentes[:LIMITE_PROPOSTAS],
+                         total_divergentes=len(divergentes),
+                         total_codigos=len(linhas),
+                         dias=DIAS_HISTORICO,
+                         dias_cobertura=DIAS_COBERTURA)
+
+
+@reposicao.route('/reposicao/estoque-minimo', methods=['POST'])
+@login_required
+def aplicar():
+    """Aplica o estoque mínimo proposto aos códigos marcados"""
+    almoxarifado_id = _almoxarifado_selecionado()
+
+    if not current_user.pode_gerenciar_estoque:
+        flash('Você não tem permissão para alterar o estoque mínimo.', 'danger')
+    elif not almoxarifado_id:
+        flash('Selecione o almoxarifado!', 'warning')
+    else:
+        marcados = set(request.form.getlist('codigos'))
+        try:
+            # Recalcula no servidor: a tela pode estar desatualizada
+            propostas = {
+                linha['codigo_barras']: linha['estoque_minimo_proposto']
+                for linha in calcular_reposicao(almoxarifado_id)
+                if linha['codigo_barras'] in marcados
+            }
+            total = aplicar_estoque_minimo(almoxarifado_id, propostas)
+            flash(f'Estoque mínimo atualizado em {total} código(s).', 'success')
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Erro ao atualizar o estoque mínimo: {str(e)}', 'danger')
+
+    return redirect(url_for('reposicao.sugestao', almoxarifado_id=almoxarifado_id))
+
+
+@reposicao.cli.command('calcular')
+@click.option('--almoxarifado', 'almoxarifado_id', type=int, default=None, help='Apenas este almoxarifado (padrão: todos).')
+@click.option('--aplicar', is_flag=True, help='Gravar o estoque mínimo proposto em todos os códigos.')
+def calcular_comando(almoxarifado_id, aplicar):
+    """Calcula o ponto de pedido e a compra sugerida de cada código"""
+    query = Almoxarifado.query.filter_by(ativo=True)
+    if almoxarifado_id:
+        query = query.filter_by(id=almoxarifado_id)
+
+    for almoxarifado in query.order_by(Almoxarifado.nome):
+        linhas = calcular_reposicao(almoxarifado.id)
+        click.echo(f'== {almoxarifado.nome}: {len(linhas)} código(s) com consumo')
+        for pedido in pedidos_por_fornecedor(linhas):
+            click.echo(f"  {pedido['fornecedor']}: {len(pedido['itens'])} item(ns), "
+                       f"R$ {pedido['valor_estimado']:.2f} estimado(s)")
+            for linha in pedido['itens']:
+                click.echo(f"    {linha['codigo_barras']} {linha['nome']}: "
+                           f"{linha['quantidade_sugerida']:g} {linha['unidade_medida']}")
+        if aplicar:
+            total = aplicar_estoque_minimo(almoxarifado.id, {
+                linha['codigo_barras']: linha['estoque_minimo_proposto'] for linha in linhas
+            })
+            click.echo(f'  estoque mínimo atualizado em {total} código(s)')
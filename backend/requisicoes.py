@@ -0,0 +1,367 @@
+"""
+Requisições de material dos setores e ondas de separação
+Várias requisições são agrupadas numa onda, separadas por uma única
+lista consolidada e baixadas juntas numa só transação
+"""
+
+import math
+from datetime import datetime
+from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask_login import login_required, current_user
+from sqlalchemy import func, update
+from sqlalchemy.orm import selectinload
+
+from models import (db, Item, Categoria, Setor, Almoxarifado, Requisicao, ItemRequisicao, OndaSeparacao,
+                    chave_caminhada_item)
+from estoque import lotes_fefo, baixar_fefo, EstoqueInsuficienteError
+
+requisicoes = Blueprint('requisicoes', __name__)
+
+
+def _verificar_permissao():
+    if not current_user.pode_gerenciar_estoque:
+        flash('Você não tem permissão para acessar esta página.', 'danger')
+        return redirect(url_for('dashboard'))
+    return None
+
+
+def _almoxarifados_visiveis(query, modelo):
+    if not current_user.ve_todos_almoxarifados:
+        query = query.filter(modelo.almoxarifado_id == current_user.almoxarifado_id)
+    return query
+
+
+def lista_separacao(onda, ordem=None):
+    """
+    Lista consolidada da onda: uma linha por código de barras com a soma
+    pedida por todas as requisições e os lotes a separar (FEFO),
+    ordenada por categoria e código ou, com ordem='endereco', pelo
+    endereço do primeiro lote a separar (percurso de caminhada).
+    """
+    totais = dict(db.session.query(
+        ItemRequisicao.codigo_barras, func.sum(ItemRequisicao.quantidade)
+    ).join(Requisicao).filter(
+        Requisicao.onda_id == onda.id
+    ).group_by(ItemRequisicao.codigo_barras).all())
+
+    if not totais:
+        return []
+
+    lotes = lotes_fefo(onda.almoxarifado_id, totais, bloquear=False)
+    descricoes = {
+        codigo: (nome, unidade, categoria)
+        for codigo, nome, unidade, categoria in db.session.query(
+            Item.codigo_barras, Item.nome, Item.unidade_medida, Categoria.nome
+        ).outerjoin(Categoria).filter(
+            Item.almoxarifado_id == onda.almoxarifado_id,
+            Item.codigo_barras.in_(list(totais))
+        )
+    }
+
+    linhas = []
+    for codigo, total in totais.items():
+        sugestao = []
+        restante = total
+        for lote in lotes.get(codigo, []):
+            if restante <= 0:
+                break
+            quantidade = min(lote.estoque_disponivel, restante)
+            sugestao.append((lote, quantidade))
+            restante -= quantidade
+
+        nome, unidade, categoria = descricoes.get(codigo, (None, None, None))
+        linhas.append({
+            'codigo_barras': codigo,
+            'nome': nome,
+            'unidade_medida': unidade,
+            'categoria': categoria,
+            'quantidade': total,
+            'lotes': sugestao,
+            'faltante': max(restante, 0)
+        })
+
+    if ordem == 'endereco':
+        linhas.sort(key=lambda l: chave_caminhada_item(l['lotes'][0][0]) if l['lotes']
+                    else (True, (), l['codigo_barras'], ''))
+    else:
+        linhas.sort(key=lambda l: (l['categoria'] is None, l['categoria'] or '', l['codigo_barras']))
+    return linhas
+
+
+def atender_onda(onda, usuario_id):
+    """
+    Registra as saídas de todas as requisições da onda, tudo ou nada.
+    Os lotes de todos os códigos são travados numa única consulta.
+    Não faz commit.
+    """
+    agora = datetime.utcnow()
+    resultado = db.session.execute(
+        update(OndaSeparacao).where(
+            OndaSeparacao.id == onda.id, OndaSeparacao.status == 'aberta'
+        ).values(status='concluida', data_conclusao=agora).execution_options(synchronize_session='fetch')
+    )
+    if resultado.rowcount != 1:
+        raise ValueError(f'A onda nº {onda.id} já foi concluída.')
+
+    lista = Requisicao.query.options(selectinload(Requisicao.itens)).filter_by(
+        onda_id=onda.id, status='em_separacao'
+    ).order_by(Requisicao.id).all()
+
+    lotes = lotes_fefo(onda.almoxarifado_id, {linha.codigo_barras for r in lista for linha in r.itens})
+
+    total = 0
+    for requisicao in lista:
+        for linha in requisicao.itens:
+            total += len(baixar_fefo(
+                lotes.get(linha.codigo_barras, []), linha.codigo_barras, linha.quantidade, usuario_id,
+                setor_id=requisicao.setor_id,
+                observacao=f'Requisição nº {requisicao.id} (onda {onda.id})'
+            ))
+        requisicao.status = 'atendida'
+        requisicao.data_atendimento = agora
+
+    return total
+
+
+@requisicoes.route('/requisicoes')
+@login_required
+def listar():
+    """Requisições abertas (para montar ondas) e ondas em separação"""
+    negado = _verificar_permissao()
+    if negado:
+        return negado
+
+    status = request.args.get('status', 'aberta')
+    query = _almoxarifados_visiveis(Requisicao.query, Requisicao).options(selectinload(Requisicao.itens))
+    if status:
+        query = query.filter(Requisicao.status == status)
+    lista = query.order_by(Requisicao.data_criacao).limit(500).all()
+
+    ondas = _almoxarifados_visiveis(
+        OndaSeparacao.query.filter_by(status='aberta'), OndaSeparacao
+    ).order_by(OndaSeparacao.data_criacao).all()
+
+    return render_template('requisicoes/listar.html', requisicoes=lista, ondas=ondas, status=status)
+
+
+@requisicoes.route('/requisicoes/nova', methods=['GET', 'POST'])
+@login_required
+def nova():
+    """Registra a requisição de um setor (vários códigos de uma vez)"""
+    negado = _verificar_permissao()
+    if negado:
+        return negado
+
+    almoxarifados = []
+    if current_user.ve_todos_almoxarifados:
+        almoxarifados = Almoxarifado.query.filter_by(ativo=True).order_by(Almoxarifado.nome).all()
+
+    if request.method == 'POST':
+        try:
+            if current_user.ve_todos_almoxarifados:
+                almoxarifado_id = int(request.form.get('almoxarifado_id'))
+            else:
+                almoxarifado_id = current_user.almoxarifado_id
+
+            # Soma linhas repetidas do mesmo código
+            quantidades = {}
+            for codigo, quantidade in zip(request.form.getlist('codigo_barras'), request.form.getlist('quantidade')):
+                codigo = codigo.strip()
+                if not codigo:
+                    continue
+                quantidade = float(quantidade)
+                if not math.isfinite(quantidade) or quantidade <= 0:
+                    raise ValueError(f'Quantidade inválida para {codigo}.')
+                quantidades[codigo] = quantidades.get(codigo, 0) + quantidade
+
+            if not quantidades:
+                raise ValueError('Informe ao menos um item.')
+
+            conhecidos = {c for (c,) in db.session.query(Item.codigo_barras).filter(
+                Item.almoxarifado_id == almoxarifado_id,
+                Item.codigo_barras.in_(list(quantidades)),
+                Item.ativo == True
+            ).distinct()}
+            desconhecidos = [c for c in quantidades if c not in conhecidos]
+            if desconhecidos:
+                raise ValueError(f'Código(s) não cadastrado(s) no almoxarifado: {", ".join(desconhecidos)}')
+
+            requisicao = Requisicao(
+                setor_id=int(request.form.get('setor_id')),
+                almoxarifado_id=almoxarifado_id,
+                usuario_id=current_user.id,
+                observacao=request.form.get('observacao'),
+                itens=[ItemRequisicao(codigo_barras=c, quantidade=q) for c, q in quantidades.items()]
+            )
+            db.session.add(requisicao)
+            db.session.commit()
+
+            flash(f'Requisição nº {requisicao.id} registrada com {len(quantidades)} item(ns).', 'success')
+            return redirect(url_for('requisicoes.listar'))
+        except ValueError as e:
+            db.session.rollback()
+            flash(str(e), 'danger')
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Erro ao registrar requisição: {str(e)}', 'danger')
+
+    setores = Setor.query.filter_by(ativo=True).order_by(Setor.nome).all()
+    return render_template('requisicoes/form.html', setores=setores, almoxarifados=almoxarifados)
+
+
+@requisicoes.route('/requisicoes/<int:id>/cancelar', methods=['POST'])
+@login_required
+def cancelar(id):
+    """Cancela uma requisição ainda aberta"""
+    negado = _verificar_permissao()
+    if negado:
+        return negado
+
+    requisicao = Requisicao.query.get_or_404(id)
+    if not current_user.pode_acessar_almoxarifado(requisicao.almoxarifado_id):
+        flash('Você não tem permissão para alterar esta requisição.', 'danger')
+    elif requisicao.status != 'aberta':
+        flash('Apenas requisições abertas podem ser canceladas.', 'warning')
+    else:
+        requisicao.status = 'cancelada'
+        db.session.commit()
+        flash(f'Requisição nº {id} cancelada.', 'success')
+
+    return redirect(url_for('requisicoes.listar'))
+
+
+@requisicoes.route('/requisicoes/ondas', methods=['POST'])
+@login_required
+def criar_onda():
+    """Agrupa as requisições abertas selecionadas numa onda de separação"""
+    negado = _verificar_permissao()
+    if negado:
+        return negado
+
+    ids = [int(i) for i in request.form.getlist('requisicoes')]
+    selecionadas = Requisicao.query.filter(Requisicao.id.in_(ids), Requisicao.status == 'aberta').all() if ids else []
+
+    almoxarifados = {r.almoxarifado_id for r in selecionadas}
+    if not selecionadas:
+        flash('Selecione ao menos uma requisição aberta.', 'warning')
+        return redirect(url_for('requisicoes.listar'))
+    if len(almoxarifados) > 1:
+        flash('Uma onda só pode reunir requisições do mesmo almoxarifado.', 'warning')
+        return redirect(url_for('requisicoes.listar'))
+
+    almoxarifado_id = almoxarifados.pop()
+    if not current_user.pode_acessar_almoxarifado(almoxarifado_id):
+        flash('Você não tem permissão para este almoxarifado.', 'danger')
+        return redirect(url_for('requisicoes.listar'))
+
+    try:
+        onda = OndaSeparacao(almoxarifado_id=almoxarifado_id, usuario_id=current_user.id)
+        db.session.add(onda)
+        db.session.flush()
+
+        # Só leva as que continuam abertas (outra onda pode ter pegado alguma)
+        resultado = db.session.execute(
+            update(Requisicao).where(
+                Requisicao.id.in_([r.id for r in selecionadas]), Requisicao.status == 'aberta'
+            ).values(status='em_separacao', onda_id=onda.id).execution_options(synchronize_session='fetch')
+        )
+        if resultado.rowcount != len(selecionadas):
+            raise ValueError('Algumas requisições já foram incluídas em outra onda. Atualize a página.')
+
+        db.session.commit()
+        flash(f'Onda nº {onda.id} criada com {len(selecionadas)} requisição(ões).', 'success')
+        return redirect(url_for('requisicoes.onda', id=onda.id))
+    except ValueError as e:
+        db.session.rollback()
+        flash(str(e), 'warning')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Erro ao criar onda: {str(e)}', 'danger')
+
+    return redirect(url_for('requisicoes.listar'))
+
+
+def _onda_acessivel(id):
+    onda = OndaSeparacao.query.get_or_404(id)
+    if not current_user.pode_acessar_almoxarifado(onda.almoxarifado_id):
+        return None
+    return onda
+
+
+@requisicoes.route('/requisicoes/ondas/<int:id>')
+@login_required
+def onda(id):
+    """Lista de separação consolidada da onda"""
+    negado = _verificar_permissao()
+    if negado:
+        return negado
+
+    onda = _onda_acessivel(id)
+    if onda is None:
+        flash('Você não tem permissão para este almoxarifado.', 'danger')
+        return redirect(url_for('requisicoes.listar'))
+
+    lista = Requisicao.query.options(selectinload(Requisicao.itens)).filter_by(
+        onda_id=onda.id
+    ).order_by(Requisicao.id).all()
+
+    ordem = request.args.get('ordem', '')
+    return render_template('requisicoes/onda.html',
+                         onda=onda,
+                         requisicoes=lista,
+                         linhas=lista_separacao(onda, ordem),
+                         ordem=ordem)
+
+
+@requisicoes.route('/requisicoes/ondas/<int:id>/confirmar', methods=['POST'])
+@login_required
+def confirmar_onda(id):
+    """Baixa todas as requisições da onda numa única transação"""
+    negado = _verificar_permissao()
+    if negado:
+        return negado
+
+    onda = _onda_acessivel(id)
+    if onda is None:
+        flash('Você não tem permissão para este almoxarifado.', 'danger')
+        return redirect(url_for('requisicoes.listar'))
+
+    try:
+        total = atender_onda(onda, current_user.id)
+        db.session.commit()
+        flash(f'Onda nº {id} concluída: {total} saída(s) registrada(s).', 'success')
+    except (EstoqueInsuficienteError, ValueError) as e:
+        db.session.rollback()
+        flash(f'Nenhuma saída foi registrada. {str(e)}', 'danger')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Erro ao concluir onda: {str(e)}', 'danger')
+
+    return redirect(url_for('requisicoes.onda', id=id))
+
+
+@requisicoes.route('/requisicoes/ondas/<int:id>/cancelar', methods=['POST'])
+@login_required
+def cancelar_onda(id):
+    """Desfaz a onda: as requisições voltam a ficar abertas"""
+    negado = _verificar_permissao()
+    if negado:
+        return negado
+
+    onda = _onda_acessivel(id)
+    if onda is None or onda.status != 'aberta':
+        flash('Esta onda não pode ser cancelada.', 'warning')
+        return redirect(url_for('requisicoes.listar'))
+
+    try:
+        Requisicao.query.filter_by(onda_id=onda.id, status='em_separacao').update(
+            {'status': 'aberta', 'onda_id': None}, synchronize_session=False
+        )
+        db.session.delete(onda)
+        db.session.commit()
+        flash(f'Onda nº {id} cancelada; as requisições voltaram para a fila.', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Erro ao cancelar onda: {str(e)}', 'danger')
+
+    return redirect(url_for('requisicoes.listar'))
@@ -0,0 +1,128 @@
+"""
+Rotas de reservas de estoque para requisições dos setores
+"""
+
+from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask_login import login_required, current_user
+
+from models import db, Item, Setor, Reserva, Almoxarifado
+from estoque import (filtrar_por_almoxarifado, reservar, liberar_reserva, consumir_reserva,
+                     EstoqueInsuficienteError)
+
+reservas = Blueprint('reservas', __name__)
+
+
+def _verificar_permissao():
+    if not current_user.pode_gerenciar_estoque:
+        flash('Você não tem permissão para acessar esta página.', 'danger')
+        return redirect(url_for('dashboard'))
+    return None
+
+
+@reservas.route('/reservas')
+@login_required
+def listar():
+    """Lista reservas (por padrão, as ativas) dos almoxarifados visíveis"""
+    negado = _verificar_permissao()
+    if negado:
+        return negado
+
+    page = request.args.get('page', 1, type=int)
+    status = request.args.get('status', 'ativa')
+    almoxarifado_filtro = request.args.get('almoxarifado_id', '')
+
+    query = filtrar_por_almoxarifado(Reserva.query.join(Item), current_user, almoxarifado_filtro)
+    if status:
+        query = query.filter(Reserva.status == status)
+
+    lista = query.order_by(Reserva.data_criacao.desc()).paginate(page=page, per_page=20, error_out=False)
+
+    almoxarifados = []
+    if current_user.ve_todos_almoxarifados:
+        almoxarifados = Almoxarifado.query.filter_by(ativo=True).order_by(Almoxarifado.nome).all()
+
+    return render_template('reservas/listar.html',
+                         reservas=lista,
+                         status=status,
+                         almoxarifados=almoxarifados,
+                         almoxarifado_selecionado=almoxarifado_filtro)
+
+
+@reservas.route('/reservas/nova', methods=['GET', 'POST'])
+@login_required
+def nova():
+    """Reserva material de um lote para um setor"""
+    negado = _verificar_permissao()
+    if negado:
+        return negado
+
+    if request.method == 'POST':
+        try:
+            item = Item.query.get_or_404(int(request.form.get('item_id')))
+            if not current_user.pode_acessar_almoxarifado(item.almoxarifado_id):
+                flash('Você não tem permissão para movimentar este item.', 'danger')
+                return redirect(url_for('reservas.nova'))
+
+            reserva = reservar(
+                item,
+                float(request.form.get('quantidade')),
+                int(request.form.get('setor_id')),
+                current_user.id,
+                observacao=request.form.get('observacao')
+            )
+            db.session.commit()
+
+            flash(f'Reserva nº {reserva.id} registrada! Disponível: {item.estoque_disponivel:g} {item.unidade_medida}', 'success')
+            return redirect(url_for('reservas.listar'))
+        except (EstoqueInsuficienteError, ValueError) as e:
+            db.session.rollback()
+            flash(str(e), 'danger')
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Erro ao registrar reserva: {str(e)}', 'danger')
+
+    itens = filtrar_por_almoxarifado(
+        Item.query.filter(Item.ativo == True, Item.estoque_disponivel > 0), current_user
+    ).order_by(Item.nome).all()
+    setores = Setor.query.filter_by(ativo=True).order_by(Setor.nome).all()
+
+    return render_template('reservas/form.html', itens=itens, setores=setores)
+
+
+def _encerrar(id, operacao, mensagem):
+    negado = _verificar_permissao()
+    if negado:
+        return negado
+
+    reserva = Reserva.query.get_or_404(id)
+    if not current_user.pode_acessar_almoxarifado(reserva.item.almoxarifado_id):
+        flash('Você não tem permissão para movimentar este item.', 'danger')
+        return redirect(url_for('reservas.listar'))
+
+    try:
+        operacao(reserva)
+        db.session.commit()
+        flash(mensagem.format(id=reserva.id), 'success')
+    except (EstoqueInsuficienteError, ValueError) as e:
+        db.session.rollback()
+        flash(str(e), 'danger')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Erro ao atualizar reserva: {str(e)}', 'danger')
+
+    return redirect(url_for('reservas.listar'))
+
+
+@reservas.route('/reservas/<int:id>/liberar', methods=['POST'])
+@login_required
+def liberar(id):
+    """Cancela a reserva, devolvendo a quantidade ao estoque disponível"""
+    return _encerrar(id, liberar_reserva, 'Reserva nº {id} liberada.')
+
+
+@reservas.route('/reservas/<int:id>/consumir', methods=['POST'])
+@login_required
+def consumir(id):
+    """Registra a saída do material reservado para o setor"""
+    return _encerrar(id, lambda reserva: consumir_reserva(reserva, current_user.id),
+                     'Reserva nº {id} retirada: saída registrada.')
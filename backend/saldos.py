@@ -0,0 +1,192 @@
+"""
+Rotas de posição de estoque em uma data, fechamentos periódicos de saldo,
+conciliação de estoque_atual com as movimentações e valor do estoque
+"""
+
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_file
+from flask_login import login_required, current_user
+from datetime import date, datetime
+from io import BytesIO
+import click
+
+from models import db, Item, Usuario, Almoxarifado
+from estoque import (consulta_saldo_em, gerar_fechamento, ultimo_dia_mes_anterior,
+                     levantar_divergencias, corrigir_divergencias, valores_por_almoxarifado,
+                     recalcular_valor_estoque)
+from relatorios import gerar_relatorio_posicao_estoque
+
+saldos = Blueprint('saldos', __name__)
+
+
+def _data_parametro(nome='data'):
+    """Lê uma data YYYY-MM-DD da query string (padrão: hoje)"""
+    valor = request.args.get(nome)
+    if not valor:
+        return datetime.now().date()
+    return datetime.strptime(valor, '%Y-%m-%d').date()
+
+
+@saldos.route('/api/estoque/posicao')
+@login_required
+def api_posicao_estoque():
+    """API: saldo de cada item ao final de uma data"""
+    try:
+        data_ref = _data_parametro()
+    except ValueError:
+        return jsonify({'erro': 'Data inválida. Use o formato AAAA-MM-DD.'}), 400
+
+    linhas = consulta_saldo_em(
+        data_ref, current_user, request.args.get('almoxarifado_id')
+    ).order_by(Item.nome).all()
+
+    return jsonify({
+        'data': data_ref.isoformat(),
+        'itens': [{
+            'id': item.id,
+            'codigo_barras': item.codigo_barras,
+            'lote': item.lote,
+            'nome': item.nome,
+            'almoxarifado_id': item.almoxarifado_id,
+            'unidade_medida': item.unidade_medida,
+            'saldo': float(saldo)
+        } for item, saldo in linhas]
+    })
+
+
+@saldos.route('/api/estoque/valor')
+@login_required
+def api_valor_estoque():
+    """API: valor do estoque ao custo médio por almoxarifado"""
+    valores = valores_por_almoxarifado(current_user)
+    return jsonify({
+        'data_hora': datetime.now().isoformat(timespec='seconds'),
+        'total': sum(valor for _, valor in valores),
+        'almoxarifados': [{
+            'id': almox.id,
+            'nome': almox.nome,
+            'valor': valor
+        } for almox, valor in valores]
+    })
+
+
+@saldos.route('/relatorios/posicao-estoque-pdf')
+@login_required
+def relatorio_posicao_pdf():
+    """Gerar relatório de posição de estoque em uma data"""
+    try:
+        data_ref = _data_parametro()
+    except ValueError:
+        flash('Data inválida.', 'danger')
+        return redirect(url_for('relatorios'))
+
+    pdf = gerar_relatorio_posicao_estoque(current_user, data_ref, request.args.get('almoxarifado_id'))
+
+    return send_file(
+        BytesIO(pdf),
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=f'posicao_estoque_{data_ref.strftime("%Y%m%d")}.pdf'
+    )
+
+
+@saldos.route('/saldos/fechamento', methods=['POST'])
+@login_required
+def fechamento():
+    """Gera o fechamento de saldos de uma data (apenas administradores centrais)"""
+    if not current_user.ve_todos_almoxarifados:
+        flash('Apenas administradores podem gerar fechamentos de saldo.', 'danger')
+        return redirect(url_for('relatorios'))
+
+    try:
+        valor = request.form.get('data')
+        data_ref = datetime.strptime(valor, '%Y-%m-%d').date() if valor else ultimo_dia_mes_anterior()
+        if data_ref >= date.today():
+            flash('O fechamento só pode ser gerado para dias já encerrados (anteriores a hoje).', 'warning')
+            return redirect(url_for('relatorios'))
+        total = gerar_fechamento(data_ref)
+        flash(f'Fechamento de {data_ref.strftime("%d/%m/%Y")} gerado: {total} saldo(s) gravado(s).', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Erro ao gerar fechamento: {str(e)}', 'danger')
+
+    return redirect(url_for('relatorios'))
+
+
+@saldos.cli.command('fechar')
+@click.option('--data', 'data_ref', default=None, help='Data do fechamento (AAAA-MM-DD). Padrão: último dia do mês anterior.')
+def fechar_comando(data_ref):
+    """Gera o fechamento periódico de saldos (para agendar via cron)"""
+    data_ref = datetime.strptime(data_ref, '%Y-%m-%d').date() if data_ref else ultimo_dia_mes_anterior()
+    if data_ref >= date.today():
+        raise click.BadParameter('use um dia já encerrado (anterior a hoje).', param_hint='--data')
+    total = gerar_fechamento(data_ref)
+    click.echo(f'Fechamento de {data_ref.isoformat()}: {total} saldo(s) gravado(s).')
+
+
+# Limite de linhas exibidas na tela de conciliação
+LIMITE_EXIBICAO_CONCILIACAO = 500
+
+
+@saldos.route('/saldos/conciliacao', methods=['GET', 'POST'])
+@login_required
+def conciliacao():
+    """Lista itens cujo estoque diverge das movimentações e permite corrigi-los"""
+    if not current_user.ve_todos_almoxarifados:
+        flash('Apenas administradores podem conciliar o estoque.', 'danger')
+        return redirect(url_for('dashboard'))
+
+    almoxarifado_id = request.values.get('almoxarifado_id') or None
+    divergencias = levantar_divergencias(almoxarifado_id)
+
+    if request.method == 'POST':
+        try:
+            total = corrigir_divergencias(divergencias, current_user.id)
+            flash(f'{total} ajuste(s) de conciliação registrado(s).', 'success')
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Erro ao corrigir divergências: {str(e)}', 'danger')
+        return redirect(url_for('saldos.conciliacao', almoxarifado_id=almoxarifado_id))
+
+    exibidas = divergencias[:LIMITE_EXIBICAO_CONCILIACAO]
+    itens = {item.id: item for item in Item.query.filter(
+        Item.id.in_([d['item_id'] for d in exibidas])
+    ).all()} if exibidas else {}
+
+    return render_template('saldos/conciliacao.html',
+                         divergencias=exibidas,
+                         total_divergencias=len(divergencias),
+                         itens=itens,
+                         almoxarifado_selecionado=almoxarifado_id)
+
+
+@saldos.cli.command('conciliar')
+@click.option('--processos', default=1, show_default=True, help='Processos paralelos (um almoxarifado por vez em cada).')
+@click.option('--almoxarifado', 'almoxarifado_id', type=int, default=None, help='Conciliar apenas este almoxarifado.')
+@click.option('--corrigir', is_flag=True, help='Gravar ajustes compensatórios para as divergências.')
+@click.option('--usuario', 'username', default='admin', show_default=True, help='Usuário registrado nos ajustes.')
+def conciliar_comando(processos, almoxarifado_id, corrigir, username):
+    """Confere estoque_atual contra a soma das movimentações de cada item"""
+    divergencias = levantar_divergencias(almoxarifado_id, processos)
+
+    for d in divergencias:
+        click.echo(f"item {d['item_id']} (almox {d['almoxarifado_id']}): estoque {d['estoque_atual']:g}, "
+                   f"movimentações {d['soma_movimentacoes']:g}, diferença {d['diferenca']:g}")
+    click.echo(f'{len(divergencias)} divergência(s) encontrada(s).')
+
+    if corrigir and divergencias:
+        usuario = Usuario.query.filter_by(username=username).first()
+        if not usuario:
+            raise click.ClickException(f'Usuário "{username}" não encontrado.')
+        total = corrigir_divergencias(divergencias, usuario.id)
+        click.echo(f'{total} ajuste(s) de conciliação registrado(s).')
+
+
+@saldos.cli.command('valorizar')
+@click.option('--inicializar-custos', is_flag=True, help='Itens sem custo médio recebem o preço da última compra.')
+def valorizar_comando(inicializar_custos):
+    """Recalcula o valor do estoque de cada almoxarifado a partir dos itens"""
+    valores = recalcular_valor_estoque(inicializar_custos)
+    nomes = dict(db.session.query(Almoxarifado.id, Almoxarifado.nome))
+    for almoxarifado_id, valor in valores.items():
+        click.echo(f'{nomes.get(almoxarifado_id, almoxarifado_id)}: R$ {valor:.2f}')
+    click.echo(f'Total: R$ {sum(valores.values()):.2f}')
@@ -0,0 +1,126 @@
+"""
+Leitura de código de barras nos balcões
+Índice em memória (por processo) de código de barras -> lotes, mantido
+coerente pela versão de alteração dos itens
+"""
+
+import threading
+from flask import Blueprint, request, jsonify
+from flask_login import login_required, current_user
+from sqlalchemy import func
+
+from models import db, Item
+
+scan = Blueprint('scan', __name__)
+
+
+class IndiceCodigos:
+    """
+    Mapa codigo_barras -> almoxarifado_id -> item_id -> dados do lote.
+    Cada worker mantém o seu; a cada leitura são aplicadas apenas as
+    alterações com versão maior que a última vista (consulta no índice
+    de versao, normalmente vazia).
+    """
+
+    def __init__(self):
+        self._lotes = {}
+        self._chave_do_item = {}
+        self._versao = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _dados(item):
+        return {
+            'id': item.id,
+            'lote': item.lote,
+            'nome': item.nome,
+            'unidade_medida': item.unidade_medida,
+            'estoque_atual': item.estoque_atual,
+            'estoque_disponivel': item.estoque_disponivel,
+            'data_validade': item.data_validade.isoformat() if item.data_validade else None
+        }
+
+    def _remover(self, item_id):
+        chave = self._chave_do_item.pop(item_id, None)
+        if chave:
+            codigo, almoxarifado_id = chave
+            lotes = self._lotes[codigo][almoxarifado_id]
+            lotes.pop(item_id, None)
+            if not lotes:
+                del self._lotes[codigo][almoxarifado_id]
+                if not self._lotes[codigo]:
+                    del self._lotes[codigo]
+
+    def _aplicar(self, item):
+        self._remover(item.id)
+        if item.ativo:
+            self._lotes.setdefault(item.codigo_barras, {}).setdefault(item.almoxarifado_id, {})[item.id] = self._dados(item)
+            self._chave_do_item[item.id] = (item.codigo_barras, item.almoxarifado_id)
+
+    def _carregar(self):
+        """Carga completa do catálogo (com o lock já tomado)"""
+        versao = db.session.query(func.coalesce(func.max(Item.versao), 0)).scalar()
+        self._lotes = {}
+        self._chave_do_item = {}
+        for item in Item.query.filter_by(ativo=True).yield_per(1000):
+            self._aplicar(item)
+        self._versao = versao
+
+    def sincronizar(self):
+        """
+        Aplica as alterações gravadas (por qualquer processo) desde a última
+        versão vista. A primeira leitura do processo faz a carga completa:
+        só os workers web que atendem /api/scan pagam por ela, não os
+        comandos flask nem os processos de varredura e de envio.
+        """
+        with self._lock:
+            if self._versao is None:
+                self._carregar()
+                return
+            alterados = Item.query.filter(Item.versao > self._versao).order_by(Item.versao).all()
+            for item in alterados:
+                self._aplicar(item)
+                self._versao = max(self._versao, item.versao)
+
+    def lotes(self, codigo_barras, almoxarifado_id=None):
+        """Lotes de um código (de um almoxarifado ou de todos), do que vence primeiro ao último"""
+        with self._lock:
+            por_almoxarifado = self._lotes.get(codigo_barras, {})
+            if almoxarifado_id is not None:
+                grupos = [(almoxarifado_id, por_almoxarifado.get(almoxarifado_id, {}))]
+            else:
+                grupos = por_almoxarifado.items()
+
+            resultado = [dict(dados, almoxarifado_id=a_id) for a_id, lotes in grupos for dados in lotes.values()]
+
+        resultado.sort(key=lambda l: (l['data_validade'] is None, l['data_validade'] or '', l['id']))
+        return resultado
+
+
+indice_codigos = IndiceCodigos()
+
+
+@scan.route('/api/scan/<codigo_barras>')
+@login_required
+def api_scan(codigo_barras):
+    """API: lotes ativos de um código de barras com estoque e validade"""
+    if current_user.ve_todos_almoxarifados:
+        almoxarifado_id = request.args.get('almoxarifado_id', type=int)
+    else:
+        almoxarifado_id = current_user.almoxarifado_id
+        if not almoxarifado_id:
+            return jsonify({'erro': 'Usuário sem almoxarifado vinculado.'}), 403
+
+    indice_codigos.sincronizar()
+    lotes = indice_codigos.lotes(codigo_barras, almoxarifado_id)
+
+    if not lotes:
+        return jsonify({'erro': 'Código de barras não encontrado.', 'codigo_barras': codigo_barras}), 404
+
+    return jsonify({
+        'codigo_barras': codigo_barras,
+        'nome': lotes[0]['nome'],
+        'unidade_medida': lotes[0]['unidade_medida'],
+        'estoque_total': sum(l['estoque_atual'] or 0 for l in lotes),
+        'lotes': lotes
+    })
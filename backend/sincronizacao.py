@@ -0,0 +1,200 @@
+"""
+APIs para coletores portáteis que trabalham offline
+- Sincronização incremental do catálogo pela versão de alteração dos itens
+- Envio em lote das movimentações feitas offline, com chave de idempotência
+"""
+
+import math
+import uuid
+from flask import Blueprint, request, jsonify
+from flask_login import login_required, current_user
+from sqlalchemy import or_, and_
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Item, Movimentacao, Setor
+from estoque import filtrar_por_almoxarifado, registrar_movimentacao
+
+sincronizacao = Blueprint('sincronizacao', __name__)
+
+# Colunas enviadas em cada linha do delta (na ordem de 'campos')
+CAMPOS_SYNC_ITENS = ['id', 'codigo_barras', 'lote', 'nome', 'unidade_medida',
+                     'estoque_atual', 'estoque_minimo', 'data_validade', 'almoxarifado_id', 'versao']
+POR_PAGINA_SYNC = 500
+MAX_POR_PAGINA_SYNC = 5000
+
+
+@sincronizacao.route('/api/sync/itens')
+@login_required
+def sync_itens():
+    """
+    Alterações do catálogo desde uma versão.
+    Paginação por (versao, id): repita a chamada com since/apos de
+    'proxima' enquanto 'mais' for verdadeiro. Itens desativados vêm em
+    'removidos'.
+    """
+    since = request.args.get('since', 0, type=int)
+    apos = request.args.get('apos', 0, type=int)
+    por_pagina = max(1, min(request.args.get('limite', POR_PAGINA_SYNC, type=int), MAX_POR_PAGINA_SYNC))
+
+    query = Item.query.filter(or_(
+        Item.versao > since,
+        and_(Item.versao == since, Item.id > apos)
+    ))
+    query = filtrar_por_almoxarifado(query, current_user, request.args.get('almoxarifado_id'))
+    alterados = query.order_by(Item.versao, Item.id).limit(por_pagina + 1).all()
+
+    mais = len(alterados) > por_pagina
+    alterados = alterados[:por_pagina]
+
+    itens, removidos = [], []
+    for item in alterados:
+        if item.ativo:
+            itens.append([
+                item.id, item.codigo_barras, item.lote, item.nome, item.unidade_medida,
+                item.estoque_atual, item.estoque_minimo,
+                item.data_validade.isoformat() if item.data_validade else None,
+                item.almoxarifado_id, item.versao
+            ])
+        else:
+            removidos.append(item.id)
+
+    proxima = {'since': since, 'apos': apos}
+    if alterados:
+        proxima = {'since': alterados[-1].versao, 'apos': alterados[-1].id}
+
+    return jsonify({
+        'campos': CAMPOS_SYNC_ITENS,
+        'itens': itens,
+        'removidos': removidos,
+        'proxima': proxima,
+        'mais': mais
+    })
+
+
+MAX_MOVIMENTACOES_LOTE = 1000
+
+
+def _validar_movimentacao(dados, itens, setores_ativos, saldos):
+    """Retorna a mensagem de erro da movimentação ou None se ela pode ser aplicada"""
+    if dados.get('tipo') not in ('entrada', 'saida'):
+        return 'Tipo inválido (use entrada ou saida).'
+
+    try:
+        quantidade = float(dados.get('quantidade'))
+    except (TypeError, ValueError):
+        return 'Quantidade inválida.'
+    if not math.isfinite(quantidade):
+        return 'Quantidade inválida.'
+    if quantidade <= 0:
+        return 'Quantidade deve ser maior que zero.'
+
+    item = itens.get(dados.get('item_id'))
+    if item is None or not item.ativo:
+        return 'Item não encontrado.'
+    if not current_user.pode_acessar_almoxarifado(item.almoxarifado_id):
+        return 'Sem permissão para este almoxarifado.'
+
+    if dados['tipo'] == 'saida':
+        if dados.get('setor_id') not in setores_ativos:
+            return 'Setor inválido.'
+        if saldos[item.id] < quantidade:
+            return 'Estoque insuficiente!'
+
+    return None
+
+
+def _aplicar_lote(movimentacoes):
+    """Aplica as movimentações válidas em uma única transação; retorna o resultado de cada uma"""
+    chaves = [m['uuid'] for m in movimentacoes]
+    existentes = dict(db.session.query(
+        Movimentacao.chave_idempotencia, Movimentacao.id
+    ).filter(Movimentacao.chave_idempotencia.in_(chaves)).all())
+
+    itens_ids = {m.get('item_id') for m in movimentacoes}
+    itens = {item.id: item for item in Item.query.filter(
+        Item.id.in_([i for i in itens_ids if isinstance(i, int)])
+    ).with_for_update().all()}
+    setores_ativos = {s_id for (s_id,) in db.session.query(Setor.id).filter_by(ativo=True).all()}
+    saldos = {item.id: item.estoque_disponivel for item in itens.values()}
+
+    resultados = []
+    vistas = set()
+    for dados in movimentacoes:
+        chave = dados['uuid']
+        if chave in existentes:
+            resultados.append({'uuid': chave, 'status': 'duplicada', 'movimentacao_id': existentes[chave]})
+            continue
+        if chave in vistas:
+            resultados.append({'uuid': chave, 'status': 'duplicada'})
+            continue
+        vistas.add(chave)
+
+        erro = _validar_movimentacao(dados, itens, setores_ativos, saldos)
+        if erro:
+            resultados.append({'uuid': chave, 'status': 'erro', 'erro': erro})
+            continue
+
+        item = itens[dados['item_id']]
+        quantidade = float(dados['quantidade'])
+        observacao = dados.get('observacao') or ''
+        if dados.get('data_hora'):
+            observacao = f"{observacao} (registrada offline em {dados['data_hora']})".strip()
+
+        movimentacao = registrar_movimentacao(
+            item, dados['tipo'], quantidade, current_user.id,
+            observacao=observacao or None,
+            nota_fiscal=dados.get('nota_fiscal'),
+            setor_id=dados.get('setor_id') if dados['tipo'] == 'saida' else None,
+            chave_idempotencia=chave
+        )
+        saldos[item.id] = item.estoque_disponivel
+        resultados.append({'uuid': chave, 'status': 'aplicada', 'movimentacao': movimentacao})
+
+    db.session.commit()
+
+    for resultado in resultados:
+        if 'movimentacao' in resultado:
+            mov = resultado.pop('movimentacao')
+            resultado['movimentacao_id'] = mov.id
+            resultado['estoque_apos'] = mov.saldo_apos
+    return resultados
+
+
+@sincronizacao.route('/api/sync/movimentacoes', methods=['POST'])
+@login_required
+def sync_movimentacoes():
+    """
+    Recebe em lote as movimentações feitas offline.
+    Corpo: {"movimentacoes": [{"uuid", "tipo", "item_id", "quantidade",
+    "setor_id", "observacao", "nota_fiscal", "data_hora"}, ...]}
+    Reenviar o mesmo uuid não duplica o lançamento.
+    """
+    if not current_user.pode_gerenciar_estoque:
+        return jsonify({'erro': 'Sem permissão para movimentar estoque.'}), 403
+
+    dados = request.get_json(silent=True) or {}
+    movimentacoes = dados.get('movimentacoes')
+    if not isinstance(movimentacoes, list):
+        return jsonify({'erro': 'Envie uma lista em "movimentacoes".'}), 400
+    if len(movimentacoes) > MAX_MOVIMENTACOES_LOTE:
+        return jsonify({'erro': f'Máximo de {MAX_MOVIMENTACOES_LOTE} movimentações por lote.'}), 400
+
+    for m in movimentacoes:
+        try:
+            m['uuid'] = str(uuid.UUID(str(m.get('uuid'))))
+        except (ValueError, AttributeError):
+            return jsonify({'erro': 'Toda movimentação precisa de um uuid válido.'}), 400
+
+    try:
+        resultados = _aplicar_lote(movimentacoes)
+    except IntegrityError:
+        # Outro envio do mesmo lote chegou primeiro: reprocessa, agora como duplicadas
+        db.session.rollback()
+        try:
+            resultados = _aplicar_lote(movimentacoes)
+        except IntegrityError:
+            # Novo conflito (envios concorrentes com parte das chaves em comum): o coletor reenvia depois
+            db.session.rollback()
+            return jsonify({'erro': 'Conflito com outro envio em andamento. Reenvie o lote.'}), 409
+
+    return jsonify({'resultados': resultados})
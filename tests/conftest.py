@@ -0,0 +1,60 @@
+"""
+Configuração dos testes: a aplicação aponta para um banco SQLite
+temporário, recriado a cada teste com um almoxarifado e um administrador
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+os.environ['DATABASE_URI'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'testes.db')
+
+from app import app as aplicacao  # noqa: E402
+from models import db, Almoxarifado, Usuario  # noqa: E402
+
+SENHA = 'teste123'
+
+
+@pytest.fixture
+def app():
+    aplicacao.config['TESTING'] = True
+    with aplicacao.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add(Almoxarifado(nome='Central'))
+        admin = Usuario(nome='Administrador', username='admin', nivel_acesso='admin_geral',
+                        email='admin@hospital.local')
+        admin.set_senha(SENHA)
+        db.session.add(admin)
+        db.session.commit()
+        db.session.remove()
+    yield aplicacao
+    with aplicacao.app_context():
+        db.session.remove()
+
+
+@pytest.fixture
+def cliente(app):
+    """Cliente de teste autenticado como o administrador geral"""
+    cliente = app.test_client()
+    resposta = cliente.post('/login', data={'username': 'admin', 'senha': SENHA})
+    assert resposta.status_code == 302
+    return cliente
+
+
+@pytest.fixture
+def operador(app):
+    """Cliente de teste autenticado como admin, que vê todos os almoxarifados e movimenta estoque"""
+    with app.app_context():
+        usuario = Usuario(nome='Operador', username='operador', nivel_acesso='admin')
+        usuario.set_senha(SENHA)
+        db.session.add(usuario)
+        db.session.commit()
+        db.session.remove()
+    cliente = app.test_client()
+    resposta = cliente.post('/login', data={'username': 'operador', 'senha': SENHA})
+    assert resposta.status_code == 302
+    return cliente
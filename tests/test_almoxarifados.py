@@ -0,0 +1,91 @@
+"""Listagem e exclusão de almoxarifados: número de consultas independente do volume de itens"""
+
+from contextlib import contextmanager
+
+from sqlalchemy import event, insert
+
+from models import db, Almoxarifado, Item, Usuario
+
+TOTAL_ITENS = 50000
+
+
+@contextmanager
+def contar_consultas(app):
+    """Conta os comandos SQL executados dentro do bloco"""
+    consultas = []
+
+    def registrar(conn, cursor, statement, parameters, context, executemany):
+        consultas.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', registrar)
+    try:
+        yield consultas
+    finally:
+        event.remove(engine, 'before_cursor_execute', registrar)
+
+
+def _criar_itens(almoxarifado_id, quantidade):
+    db.session.execute(insert(Item), [{
+        'codigo_barras': f'{almoxarifado_id}-{n:06d}',
+        'nome': f'Item {n}',
+        'unidade_medida': 'UN',
+        'lote': '1',
+        'estoque_atual': 1,
+        'almoxarifado_id': almoxarifado_id
+    } for n in range(quantidade)])
+
+
+def _popular(app, itens_por_almoxarifado):
+    with app.app_context():
+        for nome, quantidade in itens_por_almoxarifado.items():
+            almoxarifado = Almoxarifado.query.filter_by(nome=nome).first()
+            if not almoxarifado:
+                almoxarifado = Almoxarifado(nome=nome)
+                db.session.add(almoxarifado)
+                db.session.flush()
+            _criar_itens(almoxarifado.id, quantidade)
+            usuario = Usuario(nome=f'Almoxarife {nome}', username=f'almox_{almoxarifado.id}',
+                              nivel_acesso='almoxarife', almoxarifado_id=almoxarifado.id)
+            usuario.set_senha('x')
+            db.session.add(usuario)
+        db.session.commit()
+        db.session.remove()
+
+
+def test_listar_com_numero_constante_de_consultas(app, cliente):
+    _popular(app, {'Central': 10})
+    # A primeira página cria a configuração padrão; mede a partir da segunda
+    cliente.get('/almoxarifados')
+    with contar_consultas(app) as poucos_itens:
+        resposta = cliente.get('/almoxarifados')
+    assert resposta.status_code == 200
+
+    _popular(app, {'Grande': TOTAL_ITENS, 'Farmácia': 5})
+    with contar_consultas(app) as muitos_itens:
+        resposta = cliente.get('/almoxarifados')
+    assert resposta.status_code == 200
+
+    pagina = resposta.get_data(as_text=True)
+    assert 'Grande' in pagina and str(TOTAL_ITENS) in pagina
+    assert len(muitos_itens) == len(poucos_itens)
+
+
+def test_excluir_com_itens_usa_exists(app, cliente):
+    _popular(app, {'Grande': TOTAL_ITENS})
+    with app.app_context():
+        almoxarifado_id = Almoxarifado.query.filter_by(nome='Grande').one().id
+        Usuario.query.filter_by(almoxarifado_id=almoxarifado_id).delete()
+        db.session.commit()
+
+    with contar_consultas(app) as consultas:
+        resposta = cliente.get(f'/almoxarifados/{almoxarifado_id}/excluir', follow_redirects=False)
+    assert resposta.status_code == 302
+
+    # Nenhuma consulta carrega as linhas de itens: só o EXISTS
+    consultas_itens = [sql for sql in consultas if 'FROM itens' in sql]
+    assert len(consultas_itens) == 1 and 'EXISTS' in consultas_itens[0]
+
+    with app.app_context():
+        assert db.session.get(Almoxarifado, almoxarifado_id) is not None
@@ -0,0 +1,21 @@
+"""API de classificação: limite sempre entre 1 e 10000"""
+
+import pytest
+
+from models import db, Almoxarifado, Item
+
+
+@pytest.mark.parametrize('limite, esperado', [(-1, 1), (0, 1), (2, 2), (50000, 3)])
+def test_api_limita_a_pagina(app, cliente, limite, esperado):
+    with app.app_context():
+        almoxarifado_id = Almoxarifado.query.filter_by(nome='Central').one().id
+        for n, classe in enumerate('ABC'):
+            db.session.add(Item(codigo_barras=f'C{n}', nome=f'Item {n}', unidade_medida='UN', lote='1',
+                                estoque_atual=1, almoxarifado_id=almoxarifado_id,
+                                classe_abc=classe, classe_xyz='X', consumo_valor=100 - n))
+        db.session.commit()
+        db.session.remove()
+
+    resposta = cliente.get('/api/classificacao', query_string={'almoxarifado_id': almoxarifado_id, 'limite': limite})
+    assert resposta.status_code == 200
+    assert len(resposta.get_json()['itens']) == esperado
@@ -0,0 +1,148 @@
+"""Stream de eventos: um leitor do banco por processo, filas por conexão e limite de conexões"""
+
+import json
+import threading
+
+import pytest
+from sqlalchemy import event
+
+import eventos
+from models import db, Almoxarifado, Item, Movimentacao, Usuario
+
+
+@pytest.fixture
+def distribuidor(app, monkeypatch):
+    monkeypatch.setattr(eventos, 'INTERVALO_EVENTOS', 0.2)
+    monkeypatch.setattr(eventos, 'INTERVALO_KEEPALIVE', 1)
+    monkeypatch.setattr(eventos, 'DURACAO_STREAM', 10)
+    monkeypatch.setitem(app.config, 'EVENTOS_MAX_CONEXOES', 3)
+    yield eventos.distribuidor
+    assert eventos.distribuidor.conexoes == 0
+
+
+def _almoxarifados(app):
+    """Central (da configuração dos testes) e Farmácia, com um lote cada"""
+    with app.app_context():
+        farmacia = Almoxarifado(nome='Farmácia')
+        db.session.add(farmacia)
+        db.session.flush()
+        ids = {'Central': Almoxarifado.query.filter_by(nome='Central').one().id, 'Farmácia': farmacia.id}
+        for nome, almoxarifado_id in ids.items():
+            db.session.add(Item(codigo_barras=f'SORO-{almoxarifado_id}', nome=f'Soro {nome}',
+                                unidade_medida='UN', lote='L1', estoque_atual=100,
+                                almoxarifado_id=almoxarifado_id))
+        db.session.commit()
+        db.session.remove()
+        return ids
+
+
+def _movimentar(app, almoxarifado_id, quantidade=1):
+    with app.app_context():
+        item = Item.query.filter_by(almoxarifado_id=almoxarifado_id).one()
+        admin = Usuario.query.filter_by(username='admin').one()
+        item.estoque_atual -= quantidade
+        db.session.add(Movimentacao(tipo='saida', quantidade=quantidade, item_id=item.id, usuario_id=admin.id))
+        db.session.commit()
+        db.session.remove()
+
+
+def _ler(resposta, quantidade=1):
+    """As `quantidade` primeiras movimentações do stream e os ids dos eventos que as trouxeram"""
+    movimentacoes, ids = [], []
+    for pedaco in resposta.response:
+        texto = pedaco.decode() if isinstance(pedaco, bytes) else pedaco
+        if texto.startswith('event: movimentacao'):
+            linhas = dict(linha.split(': ', 1) for linha in texto.strip().split('\n'))
+            ids.append(linhas['id'])
+            movimentacoes.extend(json.loads(linhas['data'])['movimentacoes'])
+            if len(movimentacoes) >= quantidade:
+                return movimentacoes, ids
+    return movimentacoes, ids
+
+
+def _fechar(respostas):
+    # Cada stream empilhou o próprio contexto de requisição: fecha na ordem inversa
+    for resposta in reversed(respostas):
+        resposta.close()
+
+
+def _depois(segundos, funcao, *args, **kwargs):
+    temporizador = threading.Timer(segundos, funcao, args, kwargs)
+    temporizador.start()
+    return temporizador
+
+
+def test_um_leitor_para_todas_as_conexoes(app, cliente, distribuidor):
+    ids = _almoxarifados(app)
+    consultas = []
+
+    def registrar(conn, cursor, statement, parameters, context, executemany):
+        consultas.append(threading.current_thread().name)
+
+    respostas = [cliente.get('/api/eventos', query_string={'almoxarifado_id': ids[nome]})
+                 for nome in ('Central', 'Central', 'Farmácia')]
+    assert distribuidor.conexoes == 3
+    try:
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', registrar)
+        try:
+            threading.Event().wait(1)
+        finally:
+            event.remove(engine, 'before_cursor_execute', registrar)
+        # Conexões ociosas não consultam o banco: só o distribuidor lê o registro
+        assert consultas and set(consultas) == {'eventos-distribuidor'}
+        assert [thread.name for thread in threading.enumerate()].count('eventos-distribuidor') == 1
+
+        _movimentar(app, ids['Central'])
+        _movimentar(app, ids['Farmácia'], quantidade=2)
+        lidos = [_ler(resposta)[0] for resposta in respostas]
+    finally:
+        _fechar(respostas)
+
+    assert [[mov['item'] for mov in movimentacoes] for movimentacoes in lidos] == [
+        ['Soro Central'], ['Soro Central'], ['Soro Farmácia']
+    ]
+
+
+def test_recupera_pelo_cursor_sem_repetir(app, cliente, distribuidor):
+    ids = _almoxarifados(app)
+    with app.app_context():
+        desde = eventos.cursor_atual()
+        db.session.remove()
+    _movimentar(app, ids['Central'])
+
+    # O distribuidor começa adiante do cursor: a primeira movimentação vem da
+    # recuperação e a segunda da fila, cada uma uma única vez
+    resposta = cliente.get('/api/eventos', query_string={'desde': desde})
+    try:
+        temporizador = _depois(0.5, _movimentar, app, ids['Central'], quantidade=3)
+        movimentacoes, marcadores = _ler(resposta, quantidade=2)
+        temporizador.join()
+    finally:
+        _fechar([resposta])
+
+    assert [mov['quantidade'] for mov in movimentacoes] == [1, 3]
+    assert marcadores[0] != marcadores[1]
+
+
+def test_limite_de_conexoes(app, cliente, distribuidor):
+    ids = _almoxarifados(app)
+    respostas = [cliente.get('/api/eventos') for _ in range(3)]
+    try:
+        cheio = cliente.get('/api/eventos')
+        assert cheio.status_code == 200
+        assert cheio.get_data(as_text=True) == f'retry: {eventos.INTERVALO_SEM_VAGA * 1000}\n\n'
+        assert distribuidor.conexoes == 3
+
+        _movimentar(app, ids['Central'])
+        for resposta in respostas:
+            assert _ler(resposta)[0]
+    finally:
+        _fechar(respostas)
+    assert distribuidor.conexoes == 0
+
+    # Vaga liberada: a conexão seguinte volta a receber o stream
+    resposta = cliente.get('/api/eventos')
+    assert distribuidor.conexoes == 1
+    _fechar([resposta])
@@ -0,0 +1,38 @@
+"""Contagem de inventário: valores não finitos da planilha vão para as linhas inválidas"""
+
+import pytest
+
+from importacao import comparar_contagem, numero
+from models import db, Almoxarifado, Item
+
+
+@pytest.mark.parametrize('valor', ['nan', 'NaN', 'inf', '-inf', 'Infinity', '1e999'])
+def test_numero_recusa_nao_finitos(valor):
+    with pytest.raises(ValueError):
+        numero(valor)
+
+
+@pytest.mark.parametrize('valor, esperado', [('1.234,5', 1234.5), ('1234,5', 1234.5), ('1234.5', 1234.5), (' 7 ', 7)])
+def test_numero_aceita_formatos(valor, esperado):
+    assert numero(valor) == esperado
+
+
+def test_comparar_contagem_separa_nao_finitos(app):
+    with app.app_context():
+        almoxarifado_id = Almoxarifado.query.filter_by(nome='Central').one().id
+        for lote in ('L1', 'L2', 'L3'):
+            db.session.add(Item(codigo_barras='SORO', nome='Soro', unidade_medida='UN', lote=lote,
+                                estoque_atual=10, almoxarifado_id=almoxarifado_id))
+        db.session.commit()
+        ids = {item.lote: item.id for item in Item.query}
+
+        resultado = comparar_contagem(almoxarifado_id, [
+            (2, {'codigo_barras': 'SORO', 'lote': 'L1', 'quantidade': 'nan'}),
+            (3, {'codigo_barras': 'SORO', 'lote': 'L2', 'quantidade': 'inf'}),
+            (4, {'codigo_barras': 'SORO', 'lote': 'L3', 'quantidade': '8'}),
+        ])
+        db.session.remove()
+
+    assert [linha['linha'] for linha in resultado['invalidas']] == [2, 3]
+    assert resultado['contagens'] == [(ids['L3'], 8)]
+    assert resultado['diferencas'] == [(ids['L3'], 10, 8)]
@@ -0,0 +1,110 @@
+"""Quantidades não finitas (nan, inf) são recusadas antes de tocar no estoque"""
+
+from datetime import date, timedelta
+
+import pytest
+
+from estoque import baixar_fefo, lotes_fefo
+from models import db, Almoxarifado, Item, Movimentacao, Setor, Usuario
+
+NAO_FINITAS = ['nan', 'inf', '-inf']
+
+
+def _lotes(app, codigo='SORO', estoques=(10, 20)):
+    """Lotes de um código no almoxarifado Central, com validades crescentes"""
+    with app.app_context():
+        almoxarifado_id = Almoxarifado.query.filter_by(nome='Central').one().id
+        for n, estoque in enumerate(estoques, start=1):
+            db.session.add(Item(codigo_barras=codigo, nome='Soro', unidade_medida='UN', lote=f'L{n}',
+                                estoque_atual=estoque, almoxarifado_id=almoxarifado_id,
+                                data_validade=date.today() + timedelta(days=30 * n)))
+        if not Setor.query.first():
+            db.session.add(Setor(nome='UTI'))
+        db.session.commit()
+        ids = (almoxarifado_id, Setor.query.one().id)
+        db.session.remove()
+        return ids
+
+
+def _estoques(app, codigo='SORO'):
+    with app.app_context():
+        estoques = [item.estoque_atual for item in Item.query.filter_by(codigo_barras=codigo).order_by(Item.lote)]
+        movimentacoes = Movimentacao.query.count()
+        db.session.remove()
+        return estoques, movimentacoes
+
+
+@pytest.mark.parametrize('quantidade', NAO_FINITAS)
+def test_saida_por_codigo_recusa_quantidade_nao_finita(app, operador, quantidade):
+    almoxarifado_id, setor_id = _lotes(app)
+
+    resposta = operador.post('/movimentacoes/saida-codigo', data={
+        'codigo_barras': 'SORO', 'quantidade': quantidade, 'setor_id': setor_id,
+        'almoxarifado_id': almoxarifado_id
+    })
+    assert resposta.status_code == 302 and resposta.location.endswith('/movimentacoes/saida-codigo')
+    assert _estoques(app) == ([10, 20], 0)
+
+
+def test_saida_por_codigo_baixa_quantidade_valida(app, operador):
+    almoxarifado_id, setor_id = _lotes(app)
+
+    operador.post('/movimentacoes/saida-codigo', data={
+        'codigo_barras': 'SORO', 'quantidade': '12', 'setor_id': setor_id, 'almoxarifado_id': almoxarifado_id
+    })
+    assert _estoques(app) == ([0, 18], 2)
+
+
+@pytest.mark.parametrize('quantidade', [float(valor) for valor in NAO_FINITAS])
+def test_baixar_fefo_recusa_quantidade_nao_finita(app, quantidade):
+    almoxarifado_id, _ = _lotes(app)
+
+    with app.app_context():
+        admin = Usuario.query.filter_by(username='admin').one()
+        lotes = lotes_fefo(almoxarifado_id, ['SORO'])['SORO']
+        with pytest.raises(ValueError, match='Quantidade inválida'):
+            baixar_fefo(lotes, 'SORO', quantidade, admin.id)
+        db.session.rollback()
+        db.session.remove()
+
+    assert _estoques(app) == ([10, 20], 0)
+
+
+def _lote_para_transferir(app):
+    """Lote de 10 no Central e um segundo almoxarifado de destino"""
+    with app.app_context():
+        central = Almoxarifado.query.filter_by(nome='Central').one()
+        farmacia = Almoxarifado(nome='Farmácia')
+        item = Item(codigo_barras='LUVA', nome='Luva', unidade_medida='CX', lote='L1', estoque_atual=10,
+                    almoxarifado_id=central.id)
+        db.session.add_all([farmacia, item])
+        db.session.commit()
+        ids = item.id, farmacia.id
+        db.session.remove()
+        return ids
+
+
+@pytest.mark.parametrize('quantidade', NAO_FINITAS)
+def test_transferencia_recusa_quantidade_nao_finita(app, operador, quantidade):
+    item_id, destino_id = _lote_para_transferir(app)
+
+    resposta = operador.post('/movimentacoes/transferencia', data={
+        'item_id': item_id, 'almoxarifado_destino_id': destino_id, 'quantidade': quantidade
+    })
+    assert 'Quantidade inválida.' in resposta.get_data(as_text=True)
+    assert _estoques(app, 'LUVA') == ([10], 0)
+
+
+@pytest.mark.parametrize('corpo', [
+    '{"transferencias": [{"item_id": %d, "almoxarifado_destino_id": %d, "quantidade": NaN}]}',
+    '{"transferencias": [{"item_id": %d, "almoxarifado_destino_id": %d, "quantidade": Infinity}]}',
+    '{"transferencias": [{"item_id": %d, "almoxarifado_destino_id": %d, "quantidade": "nan"}]}',
+])
+def test_api_transferencias_recusa_quantidade_nao_finita(app, operador, corpo):
+    item_id, destino_id = _lote_para_transferir(app)
+
+    resposta = operador.post('/api/transferencias', data=corpo % (item_id, destino_id),
+                             content_type='application/json')
+    assert resposta.status_code == 400
+    assert resposta.get_json() == {'erro': 'Quantidade inválida.', 'indice': 0}
+    assert _estoques(app, 'LUVA') == ([10], 0)
@@ -0,0 +1,193 @@
+"""Envio dos resumos de notificações contra um servidor SMTP local de testes"""
+
+import smtplib
+import socketserver
+import threading
+from datetime import date, datetime, timedelta
+from email import message_from_bytes, policy
+
+import pytest
+
+from models import db, Almoxarifado, Item, Notificacao, Usuario
+from notificacoes import enviar_resumos
+
+
+class _SessaoSMTP(socketserver.StreamRequestHandler):
+    """Diálogo SMTP mínimo: guarda as mensagens aceitas em server.mensagens"""
+
+    def _responder(self, linha):
+        self.wfile.write(f'{linha}\r\n'.encode())
+
+    def handle(self):
+        self._responder('220 smtp de testes')
+        para = []
+        while True:
+            linha = self.rfile.readline()
+            if not linha:
+                return
+            comando = linha.decode().strip()
+            verbo = comando[:4].upper()
+            if verbo in ('HELO', 'EHLO'):
+                self._responder('250 ok')
+            elif verbo == 'MAIL':
+                if len(self.server.mensagens) >= self.server.aceitar:
+                    if self.server.falha == 'derrubar':
+                        return
+                    self._responder('554 remetente recusado')
+                    continue
+                para = []
+                self._responder('250 ok')
+            elif verbo == 'RCPT':
+                para.append(comando.split(':', 1)[1].strip(' <>'))
+                self._responder('250 ok')
+            elif verbo == 'DATA':
+                self._responder('354 termine com "."')
+                linhas = []
+                while True:
+                    linha = self.rfile.readline()
+                    if linha in (b'.\r\n', b''):
+                        break
+                    linhas.append(linha[1:] if linha.startswith(b'..') else linha)
+                self.server.mensagens.append((para, message_from_bytes(b''.join(linhas), policy=policy.default)))
+                self._responder('250 aceita')
+            elif verbo == 'QUIT':
+                self._responder('221 até logo')
+                return
+            else:
+                self._responder('250 ok')
+
+
+class ServidorSMTP(socketserver.ThreadingTCPServer):
+    """
+    Servidor SMTP em porta livre. Aceita até `aceitar` mensagens; depois
+    recusa o remetente (falha='recusar') ou derruba a conexão (falha='derrubar').
+    """
+    daemon_threads = True
+
+    def __init__(self, aceitar=None, falha='recusar'):
+        super().__init__(('127.0.0.1', 0), _SessaoSMTP)
+        self.mensagens = []
+        self.aceitar = float('inf') if aceitar is None else aceitar
+        self.falha = falha
+
+
+@pytest.fixture
+def smtp(app):
+    servidores = []
+
+    def iniciar(**opcoes):
+        servidor = ServidorSMTP(**opcoes)
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        servidores.append(servidor)
+        app.config.update(SMTP_HOST='127.0.0.1', SMTP_PORT=servidor.server_address[1],
+                          SMTP_TLS=False, SMTP_USUARIO='', SMTP_TIMEOUT=5)
+        return servidor
+
+    yield iniciar
+    for servidor in servidores:
+        servidor.shutdown()
+        servidor.server_close()
+
+
+def _popular_fila(app):
+    """Dois almoxarifados com um almoxarife cada e um lote vencido na fila de cada um"""
+    with app.app_context():
+        ids = {}
+        for nome in ('Central', 'Farmácia'):
+            almoxarifado = Almoxarifado.query.filter_by(nome=nome).first()
+            if not almoxarifado:
+                almoxarifado = Almoxarifado(nome=nome)
+                db.session.add(almoxarifado)
+                db.session.flush()
+            usuario = Usuario(nome=f'Almoxarife {nome}', username=f'almox_{almoxarifado.id}',
+                              nivel_acesso='almoxarife', almoxarifado_id=almoxarifado.id,
+                              email=f'almox{almoxarifado.id}@hospital.local')
+            usuario.set_senha('x')
+            item = Item(codigo_barras=f'VENC-{almoxarifado.id}', nome=f'Soro {nome}', unidade_medida='UN',
+                        lote='L1', estoque_atual=5, almoxarifado_id=almoxarifado.id,
+                        data_validade=date.today() - timedelta(days=1))
+            db.session.add_all([usuario, item])
+            db.session.flush()
+            db.session.add(Notificacao(almoxarifado_id=almoxarifado.id, tipo='vencido',
+                                       item_id=item.id, quantidade=5))
+            ids[nome] = almoxarifado.id
+        db.session.commit()
+        db.session.remove()
+        return ids
+
+
+def _pendentes(app):
+    with app.app_context():
+        pendentes = {id for id, in db.session.query(Notificacao.almoxarifado_id).filter(
+            Notificacao.enviada_em == None
+        ).distinct()}
+        db.session.remove()
+        return pendentes
+
+
+def test_um_resumo_por_almoxarifado(app, smtp):
+    servidor = smtp()
+    ids = _popular_fila(app)
+
+    with app.app_context():
+        enviados, baixadas = enviar_resumos(agora=datetime(2026, 10, 19, 8, 0))
+        total = Notificacao.query.count()
+        db.session.remove()
+
+    assert enviados == 2 and baixadas == total
+    assert _pendentes(app) == set()
+
+    por_almoxarifado = {mensagem['Subject'].split(']')[0].lstrip('['): (para, mensagem)
+                        for para, mensagem in servidor.mensagens}
+    assert set(por_almoxarifado) == {'Central', 'Farmácia'}
+    for nome, almoxarifado_id in ids.items():
+        para, mensagem = por_almoxarifado[nome]
+        # Almoxarife do próprio almoxarifado e o administrador geral, sem os dos outros
+        assert sorted(para) == ['admin@hospital.local', f'almox{almoxarifado_id}@hospital.local']
+        assert f'Soro {nome}' in mensagem.get_content()
+
+
+def test_falha_no_smtp_mantem_pendentes(app, smtp):
+    servidor = smtp(aceitar=1, falha='recusar')
+    ids = _popular_fila(app)
+
+    with app.app_context():
+        with pytest.raises(smtplib.SMTPSenderRefused):
+            enviar_resumos()
+        db.session.rollback()
+        db.session.remove()
+
+    # O primeiro resumo saiu e foi baixado; o recusado continua na fila
+    assert len(servidor.mensagens) == 1
+    enviado = servidor.mensagens[0][1]['Subject'].split(']')[0].lstrip('[')
+    assert _pendentes(app) == {id for nome, id in ids.items() if nome != enviado}
+
+
+def test_conexao_derrubada_propaga_erro_original(app, smtp):
+    servidor = smtp(aceitar=0, falha='derrubar')
+    ids = _popular_fila(app)
+
+    with app.app_context():
+        with pytest.raises(smtplib.SMTPServerDisconnected, match='unexpectedly closed'):
+            enviar_resumos()
+        db.session.rollback()
+        db.session.remove()
+
+    assert servidor.mensagens == []
+    assert _pendentes(app) == set(ids.values())
+
+
+def test_servidor_fora_do_ar_mantem_pendentes(app, smtp):
+    servidor = smtp()
+    porta = servidor.server_address[1]
+    servidor.shutdown()
+    servidor.server_close()
+    app.config['SMTP_PORT'] = porta
+    ids = _popular_fila(app)
+
+    with app.app_context():
+        with pytest.raises(OSError):
+            enviar_resumos()
+        db.session.remove()
+
+    assert _pendentes(app) == set(ids.values())
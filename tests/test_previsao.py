@@ -0,0 +1,23 @@
+"""API de previsões: limite sempre entre 1 e 10000"""
+
+import pytest
+
+from models import db, Almoxarifado, PrevisaoConsumo, Setor
+
+
+@pytest.mark.parametrize('limite, esperado', [(-1, 1), (0, 1), (2, 2), (50000, 3)])
+def test_api_limita_a_pagina(app, cliente, limite, esperado):
+    with app.app_context():
+        almoxarifado_id = Almoxarifado.query.filter_by(nome='Central').one().id
+        setor = Setor(nome='UTI')
+        db.session.add(setor)
+        db.session.flush()
+        for n in range(3):
+            db.session.add(PrevisaoConsumo(almoxarifado_id=almoxarifado_id, setor_id=setor.id,
+                                           codigo_barras=f'C{n}', metodo='suavizacao', previsao_90=10 - n))
+        db.session.commit()
+        db.session.remove()
+
+    resposta = cliente.get('/api/previsao', query_string={'almoxarifado_id': almoxarifado_id, 'limite': limite})
+    assert resposta.status_code == 200
+    assert len(resposta.get_json()['previsoes']) == esperado
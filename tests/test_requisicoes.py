@@ -0,0 +1,50 @@
+"""Requisições com quantidades não finitas (nan, inf) não são registradas"""
+
+import pytest
+
+from models import db, Almoxarifado, Item, Requisicao, ItemRequisicao, Setor
+
+
+@pytest.fixture
+def catalogo(app):
+    with app.app_context():
+        almoxarifado_id = Almoxarifado.query.filter_by(nome='Central').one().id
+        db.session.add_all([
+            Item(codigo_barras='SORO', nome='Soro', unidade_medida='UN', lote='L1', estoque_atual=50,
+                 almoxarifado_id=almoxarifado_id),
+            Setor(nome='UTI')
+        ])
+        db.session.commit()
+        ids = almoxarifado_id, Setor.query.one().id
+        db.session.remove()
+        return ids
+
+
+@pytest.mark.parametrize('quantidade', ['nan', 'inf', '-inf', '0'])
+def test_nova_recusa_quantidade_invalida(app, operador, catalogo, quantidade):
+    almoxarifado_id, setor_id = catalogo
+
+    resposta = operador.post('/requisicoes/nova', data={
+        'almoxarifado_id': almoxarifado_id, 'setor_id': setor_id,
+        'codigo_barras': ['SORO', 'SORO'], 'quantidade': ['2', quantidade]
+    })
+    assert resposta.status_code == 200
+    assert 'Quantidade inválida para SORO' in resposta.get_data(as_text=True)
+
+    with app.app_context():
+        assert Requisicao.query.count() == 0 and ItemRequisicao.query.count() == 0
+        db.session.remove()
+
+
+def test_nova_soma_linhas_do_mesmo_codigo(app, operador, catalogo):
+    almoxarifado_id, setor_id = catalogo
+
+    resposta = operador.post('/requisicoes/nova', data={
+        'almoxarifado_id': almoxarifado_id, 'setor_id': setor_id,
+        'codigo_barras': ['SORO', 'SORO'], 'quantidade': ['2', '3']
+    })
+    assert resposta.status_code == 302
+
+    with app.app_context():
+        assert [(i.codigo_barras, i.quantidade) for i in ItemRequisicao.query] == [('SORO', 5)]
+        db.session.remove()
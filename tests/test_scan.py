@@ -0,0 +1,76 @@
+"""Índice de códigos de barras: carregado na primeira leitura, não ao importar a aplicação"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+from sqlalchemy import event
+
+import scan
+from models import db, Almoxarifado, Item
+
+
+@pytest.fixture
+def indice(app, monkeypatch):
+    # Cada teste recria o banco: começa com um índice ainda não carregado
+    novo = scan.IndiceCodigos()
+    monkeypatch.setattr(scan, 'indice_codigos', novo)
+    return novo
+
+
+def _consultas_de_itens(app, funcao):
+    consultas = []
+
+    def registrar(conn, cursor, statement, parameters, context, executemany):
+        if 'FROM itens' in statement:
+            consultas.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', registrar)
+    try:
+        resultado = funcao()
+    finally:
+        event.remove(engine, 'before_cursor_execute', registrar)
+    return resultado, consultas
+
+
+def test_importar_a_aplicacao_nao_carrega_o_indice(app):
+    # Comandos flask, varredura e envio de notificações importam o app sem atender /api/scan
+    with app.app_context():
+        almoxarifado_id = Almoxarifado.query.filter_by(nome='Central').one().id
+        db.session.add(Item(codigo_barras='SORO', nome='Soro', unidade_medida='UN', lote='L1',
+                            estoque_atual=10, almoxarifado_id=almoxarifado_id))
+        db.session.commit()
+        db.session.remove()
+
+    saida = subprocess.run(
+        [sys.executable, '-c', 'import app, scan; print(scan.indice_codigos._versao)'],
+        cwd=os.path.dirname(scan.__file__), capture_output=True, text=True, check=True
+    ).stdout
+    assert saida.strip().splitlines()[-1] == 'None'
+
+
+def test_primeira_leitura_carrega_e_as_seguintes_sincronizam(app, cliente, indice):
+    with app.app_context():
+        almoxarifado_id = Almoxarifado.query.filter_by(nome='Central').one().id
+        db.session.add(Item(codigo_barras='SORO', nome='Soro', unidade_medida='UN', lote='L1',
+                            estoque_atual=10, almoxarifado_id=almoxarifado_id))
+        db.session.commit()
+        db.session.remove()
+    assert indice._versao is None
+
+    resposta, consultas = _consultas_de_itens(app, lambda: cliente.get('/api/scan/SORO'))
+    assert resposta.status_code == 200 and resposta.get_json()['estoque_total'] == 10
+    assert any('WHERE itens.ativo' in sql for sql in consultas)
+
+    with app.app_context():
+        Item.query.filter_by(codigo_barras='SORO').one().estoque_atual = 4
+        db.session.commit()
+        db.session.remove()
+
+    resposta, consultas = _consultas_de_itens(app, lambda: cliente.get('/api/scan/SORO'))
+    assert resposta.get_json()['estoque_total'] == 4
+    # Só as alterações desde a última versão, sem recarregar o catálogo
+    assert not any('WHERE itens.ativo' in sql for sql in consultas)